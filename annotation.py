@@ -0,0 +1,108 @@
+import cv2
+import numpy as np
+
+# 各类别的角标记颜色 (BGR)
+PLAYER_COLOR = (255, 128, 0)     # 橙色
+REFEREE_COLOR = (255, 0, 255)    # 鲜艳紫色/品红色
+CORNER_THICKNESS = 2
+MAX_CORNER_LENGTH = 20
+
+# 球的光晕：半径从外到内逐圈叠加，线宽 2 时最外圈超出半径 1 像素
+HALO_RADII = range(20, 10, -1)
+HALO_MARGIN = max(HALO_RADII) + CORNER_THICKNESS
+
+
+def corner_polylines(boxes):
+    """为一组边界框生成四个角标记的折线（每个角一条三点折线）"""
+    lines = []
+    for x1, y1, x2, y2 in boxes:
+        length = min(MAX_CORNER_LENGTH, (x2 - x1) // 3, (y2 - y1) // 3)
+        lines.extend([
+            [(x1 + length, y1), (x1, y1), (x1, y1 + length)],  # 左上角
+            [(x2 - length, y1), (x2, y1), (x2, y1 + length)],  # 右上角
+            [(x1 + length, y2), (x1, y2), (x1, y2 - length)],  # 左下角
+            [(x2 - length, y2), (x2, y2), (x2, y2 - length)],  # 右下角
+        ])
+    return [np.array(line, dtype=np.int32) for line in lines]
+
+
+def draw_corners(image, boxes, color):
+    """一次 polylines 调用绘制同一类别所有框的角标记"""
+    if boxes:
+        cv2.polylines(image, corner_polylines(boxes), False, color, CORNER_THICKNESS)
+
+
+def draw_ball(image, center):
+    """绘制球的光晕标记：只在标记所在的局部区域内做混合，而不是整帧复制和混合"""
+    h, w = image.shape[:2]
+    cx, cy = center
+    rx1, ry1 = max(0, cx - HALO_MARGIN), max(0, cy - HALO_MARGIN)
+    rx2, ry2 = min(w, cx + HALO_MARGIN + 1), min(h, cy + HALO_MARGIN + 1)
+
+    if rx1 < rx2 and ry1 < ry2:
+        roi = image[ry1:ry2, rx1:rx2]  # 视图，混合结果直接写回原图
+        local_center = (cx - rx1, cy - ry1)
+        for r in HALO_RADII:
+            alpha = (20 - r) / 10  # 渐变透明度
+            color = (0, int(255 * alpha), int(255 * alpha))  # 渐变黄色
+            overlay = roi.copy()
+            cv2.circle(overlay, local_center, r, color, 2)
+            cv2.addWeighted(overlay, 0.3, roi, 0.7, 0, roi)
+
+    # 主圆圈 - 明亮的黄色；内部白色高光；中心黄色点
+    cv2.circle(image, center, 12, (0, 255, 255), 2)
+    cv2.circle(image, center, 8, (255, 255, 255), -1)
+    cv2.circle(image, center, 4, (0, 200, 255), -1)
+
+
+def draw_label(image, text, x1, y1, x2):
+    """在边界框顶部居中绘制带黑色背景的小型ID标签"""
+    text_size = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
+    text_x = x1 + (x2 - x1 - text_size[0]) // 2
+    text_y = y1 - 5
+    if text_y < 15:  # 确保文本在图像内
+        text_y = y1 + 15
+
+    cv2.rectangle(image,
+                  (text_x - 2, text_y - text_size[1] - 2),
+                  (text_x + text_size[0] + 2, text_y + 2),
+                  (0, 0, 0), -1)
+    cv2.putText(image, text, (text_x, text_y),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+
+def draw_detections(frame, detections):
+    """在帧上绘制检测结果（Detections），返回 (标注后的图像, 球员信息列表)
+
+    球先绘制（光晕在局部区域混合），裁判和球员的角标记按类别批量绘制，最后绘制球员ID标签。
+    """
+    h, w = frame.shape[:2]
+    annotated_frame = frame.copy()
+
+    players_data = []
+    referee_boxes = []
+    player_boxes = []
+
+    boxes = detections.boxes(w, h).tolist()
+    centers = detections.centers().astype(np.int64).tolist()
+    for name, box, center in zip(detections.names(), boxes, centers):
+        if name == 'ball':
+            draw_ball(annotated_frame, tuple(center))
+        elif name == 'referee':
+            referee_boxes.append(tuple(box))
+        else:
+            player_boxes.append(tuple(box))
+            players_data.append({
+                "id": len(players_data) + 1,
+                "bbox": box,
+                "center": center
+            })
+
+    draw_corners(annotated_frame, referee_boxes, REFEREE_COLOR)
+    draw_corners(annotated_frame, player_boxes, PLAYER_COLOR)
+
+    for player in players_data:
+        x1, y1, x2, _ = player["bbox"]
+        draw_label(annotated_frame, f"P{player['id']}", x1, y1, x2)
+
+    return annotated_frame, players_data
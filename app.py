@@ -1,33 +1,95 @@
 import os
+import time
+import logging
+import math
+import atexit
+import functools
+from dotenv import load_dotenv
+load_dotenv()
+
+from metrics import (REGISTRY, STAGE_SECONDS, HTTP_REQUESTS, HTTP_SECONDS, request_id_var,
+                     request_id_from, setup_logging, span)
+
+# 日志级别：DEBUG 输出每个阶段的详细信息和耗时，默认 INFO
+setup_logging(os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger("app")
+
 try:
     import cv2
-    print("OpenCV导入成功")
+    logger.debug("OpenCV导入成功")
 except Exception as e:
-    print(f"OpenCV导入失败: {e}")
+    logger.error(f"OpenCV导入失败: {e}")
     cv2 = None
 import numpy as np
 import json
-from flask import Flask, request, render_template, jsonify
+from flask import (Flask, request, render_template, jsonify, Response, stream_with_context,
+                   redirect, send_from_directory, has_request_context, g)
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
-from roboflow import Roboflow
-from supabase import create_client, Client
 import tempfile
-import shutil
 from datetime import datetime
-import google.generativeai as genai
+from video_store import VideoStore
+from uploads import ChunkedUploads, UploadError, parse_content_range
+from frame_reader import FrameReader, read_frames
+from seek_index import get_seek_index
+from detection_cache import DetectionCache
+from detectors import load_detector, DEFAULT_MODEL_ID, DEFAULT_MODEL_VERSION
+from tiling import TiledDetector
+from annotation import draw_detections
+from clip import CLIP_MODES, extract_clip, player_point
+from jobs import JobManager, JobCancelled, QueueFullError, FAILED, FINISHED_STATES
+from storage import SupabaseStorage, LocalStorage, ArtifactUploader
+from tracking import TrackStore, track_clip, track_center_at
+from services import ServiceRegistry, ServiceUnavailable, DISABLED, READY
+from concurrency import CpuPool, Limiter, Overloaded
+from resilience import RemoteCall, CircuitBreaker, CircuitOpen, client_error
+from renditions import parse_renditions, encode_renditions, new_artifact_id
+from scratch import ScratchStore, ScratchFull
+from response_cache import ResponseCache, make_key
+from detections import Detections, TrackTable, PlayerTable
+from encoding import negotiate, packb, maybe_gzip, MSGPACK_TYPE
 
-from dotenv import load_dotenv
-load_dotenv()
-
-# 配置Gemini API
+# 配置Gemini API（在服务注册表中初始化）
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
 
-# 使用临时文件夹代替永久存储
-TEMP_FOLDER = tempfile.mkdtemp()
+# 临时存储：固定目录，视频、分片上传、本地产物和中间文件共用字节数/文件数配额，
+# 超出时按最近最少使用淘汰未在使用的文件；启动时清理上次运行（异常退出）残留的文件，
+# 只清理由本服务创建的目录（带标记文件），SCRATCH_DIR 指向已有内容的目录时不做清理
+TEMP_FOLDER = os.getenv("SCRATCH_DIR") or os.path.join(tempfile.gettempdir(), "video_analysis")
+scratch = ScratchStore(
+    TEMP_FOLDER,
+    max_bytes=int(os.getenv("SCRATCH_MAX_MB", 4096)) * 1024 * 1024,
+    max_files=int(os.getenv("SCRATCH_MAX_FILES", 10000)),
+    stale_seconds=float(os.getenv("SCRATCH_STALE_SECONDS", 3600)),
+)
+scratch.sweep(adopt={"artifacts": "artifact"}, keep=("detection_cache", "uploads"))
 app = Flask(__name__)
 
+
+class ResponseJSONProvider(DefaultJSONProvider):
+    """检测结果等内部数组类型在 JSON 响应中输出为原来的字典列表"""
+
+    @staticmethod
+    def default(o):
+        if hasattr(o, "__json__"):
+            return o.__json__()
+        return DefaultJSONProvider.default(o)
+
+
+app.json = ResponseJSONProvider(app)
+
+# 视频会话存储：上传一次，按内容哈希(video_id)在各分析接口中复用
+VIDEO_SESSION_TTL = int(os.getenv("VIDEO_SESSION_TTL", 3600))
+video_store = VideoStore(os.path.join(TEMP_FOLDER, "videos"), ttl_seconds=VIDEO_SESSION_TTL, scratch=scratch)
+
+# 分片上传：大文件按区间流式写入磁盘，断线后可从已确认的 offset 续传
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE_MB", 8)) * 1024 * 1024
+UPLOAD_MAX_SIZE = int(os.getenv("UPLOAD_MAX_SIZE_MB", 2048)) * 1024 * 1024
+chunked_uploads = ChunkedUploads(
+    os.path.join(TEMP_FOLDER, "uploads"), video_store, max_size=UPLOAD_MAX_SIZE,
+    ttl_seconds=int(os.getenv("UPLOAD_SESSION_TTL", 24 * 3600)), scratch=scratch,
+)
+
 # 配置CORS - Railway域名通常是 *.railway.app
 CORS(app, resources={
     r"/*": {
@@ -37,72 +99,483 @@ CORS(app, resources={
             "https://*.tcloudbaseapp.com",
             "https://cloud1-2g1ltb323fb30dca-1374423658.tcloudbaseapp.com"  # 您的前端域名
         ],
-        "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
+        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
+        "allow_headers": ["Content-Type", "Authorization", "Content-Range", "Upload-Offset", "X-Request-ID"],
+        "expose_headers": ["X-Request-ID"]
     }
 })
 
+@app.before_request
+def start_request():
+    """为每个请求分配请求ID（沿用客户端传入的合法 X-Request-ID），日志行和后台任务都带上该ID"""
+    g.request_id = request_id_from(request.headers.get("X-Request-ID"))
+    g.request_start = time.perf_counter()
+    request_id_var.set(g.request_id)
+
+@app.teardown_request
+def release_videos(_error=None):
+    """释放本次请求固定的视频文件"""
+    for session in g.pop("video_holds", []):
+        video_store.release(session)
+
+@app.errorhandler(ScratchFull)
+def handle_scratch_full(e):
+    return jsonify({"error": str(e), "success": False}), 507
+
+@app.after_request
+def finish_request(response):
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    if "request_start" in g:
+        HTTP_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    response.headers["X-Request-ID"] = g.get("request_id", "-")
+    return response
+
 # 增加文件上传大小限制 (Railway支持更大文件)
 app.config['MAX_CONTENT_LENGTH'] = 500 * 1024 * 1024  # 500MB
 
 # Roboflow 模型配置
 API_KEY = os.getenv("ROBOFLOW_API_KEY")
-MODEL_ID = "football-players-detection-3zvbc-lkn9q"
-MODEL_VERSION = 1
+MODEL_ID = DEFAULT_MODEL_ID
+MODEL_VERSION = DEFAULT_MODEL_VERSION
+DETECTION_CONFIDENCE = 40
+DETECTION_OVERLAP = 30
 
-if API_KEY:
-    rf = Roboflow(api_key=API_KEY)
-    project = rf.workspace().project(MODEL_ID)
-    model = project.version(MODEL_VERSION).model
-else:
-    model = None
-    print("Warning: ROBOFLOW_API_KEY not found")
+# 批量分帧分析：单次请求最多帧数与并发检测数
+MAX_BATCH_FRAMES = int(os.getenv("MAX_BATCH_FRAMES", 50))
+DETECTION_CONCURRENCY = int(os.getenv("DETECTION_CONCURRENCY", 4))
+
+# 标注帧的输出规格（名称:最大宽度:格式:质量），全部在内存中编码；
+# 第一种为主图（annotated_frame_url），preview 等小图供客户端先行加载
+FRAME_RENDITIONS = parse_renditions(os.getenv("FRAME_RENDITIONS", "full:0:jpeg:90,preview:480:webp:75"))
+
+# 后台任务：有界线程池执行Gemini/单帧分析，排队过多时返回429，客户端离开后取消任务
+job_manager = JobManager(
+    max_workers=int(os.getenv("JOB_WORKERS", 2)),
+    max_queue=int(os.getenv("JOB_QUEUE_LIMIT", 16)),
+    client_timeout=int(os.getenv("JOB_CLIENT_TIMEOUT", 60)),
+    result_ttl=int(os.getenv("JOB_RESULT_TTL", 600)),
+)
+JOB_STREAM_HEARTBEAT = 15
+
+# Gemini 视频预处理：截取分析时间点前后共 N 秒，降低分辨率和帧率后再发送
+GEMINI_CLIP_SECONDS = float(os.getenv("GEMINI_CLIP_SECONDS", 10))
+GEMINI_CLIP_MAX_WIDTH = int(os.getenv("GEMINI_CLIP_MAX_WIDTH", 640))
+GEMINI_CLIP_FPS = float(os.getenv("GEMINI_CLIP_FPS", 5))
+GEMINI_CLIP_MODE = os.getenv("GEMINI_CLIP_MODE", "highlight")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+# 片段提取失败时，只有不超过该大小的原视频才改为完整发送，否则任务失败
+GEMINI_FULL_VIDEO_MAX_BYTES = int(os.getenv("GEMINI_FULL_VIDEO_MAX_BYTES", 20 * 1024 * 1024))
+
+# Gemini 响应缓存：相同视频、时间点、坐标、提示词和模型的分析结果在 TTL 内直接复用，
+# 同时到达的相同请求只调用一次 Gemini；GEMINI_CACHE_TTL=0 关闭缓存（仍合并并发请求）
+gemini_cache = ResponseCache(
+    ttl_seconds=float(os.getenv("GEMINI_CACHE_TTL", 3600)),
+    max_items=int(os.getenv("GEMINI_CACHE_MAX_ITEMS", 256)),
+    max_bytes=int(os.getenv("GEMINI_CACHE_MAX_MB", 16)) * 1024 * 1024,
+    retry_on=(JobCancelled,),
+)
+
+# 球员跟踪：按采样帧率抽帧，每 N 帧检测一次，中间帧用光流跟踪，得到稳定的轨迹ID
+TRACKING_SAMPLE_FPS = float(os.getenv("TRACKING_SAMPLE_FPS", 10))
+TRACKING_DETECT_EVERY = int(os.getenv("TRACKING_DETECT_EVERY", 5))
+TRACKING_MAX_SECONDS = float(os.getenv("TRACKING_MAX_SECONDS", 30))
+track_store = TrackStore()
+
+# 检测结果缓存：同一视频同一帧在相同模型参数下只请求一次 Roboflow
+detection_cache = DetectionCache(
+    os.getenv("DETECTION_CACHE_DIR", os.path.join(TEMP_FOLDER, "detection_cache")),
+    memory_bytes=int(os.getenv("DETECTION_CACHE_MEMORY_MB", 32)) * 1024 * 1024,
+    disk_bytes=int(os.getenv("DETECTION_CACHE_DISK_MB", 256)) * 1024 * 1024,
+    encode=Detections.to_cache, decode=Detections.from_cache,
+)
+
+# 检测后端：roboflow（托管API，默认）/ onnx / opencv（本地CPU推理，直接处理内存中的帧）
+DETECTOR_BACKEND = os.getenv("DETECTOR_BACKEND", "roboflow").lower()
+DETECTOR_MODEL_PATH = os.getenv("DETECTOR_MODEL_PATH")
+DETECTOR_CLASSES = os.getenv("DETECTOR_CLASSES")
+DETECTOR_INPUT_SIZE = int(os.getenv("DETECTOR_INPUT_SIZE", 640))
+
+# 检测模式：full 整帧检测；tiled 先检测缩略图，再在目标周围裁出原分辨率切片批量检测，提高小球召回率
+DETECTION_MODE = os.getenv("DETECTION_MODE", "full").lower()
+TILE_SIZE = int(os.getenv("TILE_SIZE", 480))
+TILE_COARSE_WIDTH = int(os.getenv("TILE_COARSE_WIDTH", 960))
+TILE_MAX_TILES = int(os.getenv("TILE_MAX_TILES", 3))
+
+# 并发模型：解码/绘制/编码进入与 CPU 核数相同的线程池，请求线程只等待远程服务和池中结果；
+# 每个远程后端单独限制并发，重型同步接口做准入控制，超出时返回 429 而不是占满所有请求线程
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", 32))
+BACKEND_QUEUE_TIMEOUT = float(os.getenv("BACKEND_QUEUE_TIMEOUT", 30))
+cpu_pool = CpuPool(int(os.getenv("CPU_WORKERS", 0)) or None)
+backend_limits = {
+    "detector": Limiter(
+        "detector",
+        int(os.getenv("DETECTOR_MAX_CONCURRENCY", 8 if DETECTOR_BACKEND == "roboflow" else cpu_pool.workers)),
+        max_waiting=GUNICORN_THREADS, timeout=BACKEND_QUEUE_TIMEOUT),
+    "gemini": Limiter("gemini", int(os.getenv("GEMINI_MAX_CONCURRENCY", 4)),
+                      max_waiting=GUNICORN_THREADS, timeout=BACKEND_QUEUE_TIMEOUT),
+}
+# 至少留出 1/4 的请求线程给 /health、/jobs 轮询等轻量请求
+admission = Limiter(
+    "analysis",
+    int(os.getenv("ANALYSIS_MAX_INFLIGHT", max(1, GUNICORN_THREADS // 2))),
+    max_waiting=int(os.getenv("ANALYSIS_MAX_WAITING", GUNICORN_THREADS // 4)),
+    timeout=float(os.getenv("ANALYSIS_QUEUE_TIMEOUT", 10)),
+)
+
+# 远程调用策略：单次时限 + 带抖动的有界重试 + 熔断（连续失败后在一段时间内直接返回 503），
+# 检测后端可选对冲请求：单帧请求超过近期 p95 仍未返回时再发一次，取先返回的结果
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+
+def remote_call(name, timeout, retries, workers, hedge=False):
+    # 4xx（密钥无效、请求错误）不重试，也不计入熔断
+    return RemoteCall(name, timeout=timeout, retries=retries, hedge=hedge, workers=workers,
+                      breaker=CircuitBreaker(name, BREAKER_FAILURES, BREAKER_RESET_SECONDS),
+                      no_retry=client_error)
+
+remote_calls = {
+    "detector": remote_call(
+        "detector", float(os.getenv("DETECTOR_TIMEOUT", 15)), int(os.getenv("DETECTOR_RETRIES", 2)),
+        workers=backend_limits["detector"].limit * DETECTION_CONCURRENCY * 2,
+        hedge=os.getenv("DETECTOR_HEDGE", "false").lower() in ("1", "true", "yes")),
+    "gemini": remote_call(
+        "gemini", float(os.getenv("GEMINI_TIMEOUT", 120)), int(os.getenv("GEMINI_RETRIES", 1)),
+        workers=backend_limits["gemini"].limit * 2),
+    # 上传失败由 ArtifactUploader 重试，这里只限时和熔断
+    "storage": remote_call("storage", float(os.getenv("STORAGE_TIMEOUT", 30)), 0,
+                           workers=int(os.getenv("UPLOAD_WORKERS", 4)) * 2),
+}
+
+def admitted(view):
+    """重型同步接口的准入控制：进行中的请求数达到上限时排队，队列满或等待超时返回 429"""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        with admission.slot():
+            return view(*args, **kwargs)
+    return wrapper
+
+@app.errorhandler(Overloaded)
+def handle_overloaded(e):
+    """并发已满返回 429，后端熔断（CircuitOpen）返回 503，都带 Retry-After"""
+    response = jsonify({"error": str(e), "success": False})
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response, e.status
 
 # Supabase 配置
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY")
 BUCKET_NAME = "videos"
 
-if SUPABASE_URL and SUPABASE_KEY:
-    supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+def wrap_detector(detector):
+    """按 DETECTION_MODE 包装检测后端"""
+    if detector is not None and DETECTION_MODE == "tiled":
+        return TiledDetector(detector, tile=TILE_SIZE, coarse_width=TILE_COARSE_WIDTH, max_tiles=TILE_MAX_TILES)
+    return detector
+
+# 外部服务客户端在后台（或首次使用时）初始化，不阻塞进程启动；失败时按指数退避重试
+def init_detector():
+    """检测后端：Roboflow 需要网络请求获取模型，本地模型需要加载权重文件"""
+    if DETECTOR_BACKEND == "roboflow":
+        if not API_KEY:
+            logger.warning("ROBOFLOW_API_KEY not found")
+            return None
+    elif not DETECTOR_MODEL_PATH:
+        logger.warning("DETECTOR_MODEL_PATH not found")
+        return None
+    return wrap_detector(load_detector(
+        DETECTOR_BACKEND, api_key=API_KEY, model_id=MODEL_ID, model_version=MODEL_VERSION,
+        model_path=DETECTOR_MODEL_PATH,
+        class_names=DETECTOR_CLASSES.split(",") if DETECTOR_CLASSES else None,
+        input_size=DETECTOR_INPUT_SIZE,
+        confidence=DETECTION_CONFIDENCE, overlap=DETECTION_OVERLAP,
+        concurrency=DETECTION_CONCURRENCY, call=remote_calls["detector"].call,
+    ))
+
+def init_supabase():
+    if not (SUPABASE_URL and SUPABASE_KEY):
+        logger.warning("Supabase credentials not found")
+        return None
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+def init_gemini():
+    if not GEMINI_API_KEY:
+        logger.warning("GEMINI_API_KEY not found")
+        return None
+    import google.generativeai as genai
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai
+
+# 产物存储：supabase 或 local（本地目录，用于开发测试）；未配置 Supabase 时使用本地存储
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "supabase" if SUPABASE_URL and SUPABASE_KEY else "local")
+
+# 请求等待服务初始化完成的最长时间（秒）；lazy 模式下不预热，首次使用时初始化
+SERVICE_WAIT_SECONDS = float(os.getenv("SERVICE_WAIT_SECONDS", 10))
+SERVICE_WARMUP = os.getenv("SERVICE_WARMUP", "background")
+services = ServiceRegistry(
+    backoff=float(os.getenv("SERVICE_RETRY_BACKOFF", 1)),
+    max_backoff=float(os.getenv("SERVICE_RETRY_MAX_BACKOFF", 60)),
+)
+services.register("detector", init_detector)
+services.register("supabase", init_supabase, required=STORAGE_BACKEND == "supabase")
+services.register("gemini", init_gemini, required=False)
+if SERVICE_WARMUP == "background":
+    services.warmup()
+
+def get_detector():
+    return services.get("detector", wait=SERVICE_WAIT_SECONDS)
+
+if STORAGE_BACKEND == "supabase" and SUPABASE_URL and SUPABASE_KEY:
+    artifact_storage = SupabaseStorage(lambda: services.get("supabase", wait=SERVICE_WAIT_SECONDS),
+                                       BUCKET_NAME, SUPABASE_URL, call=remote_calls["storage"].call)
 else:
-    supabase = None
-    print("Warning: Supabase credentials not found")
+    if STORAGE_BACKEND == "supabase":
+        logger.warning("Supabase 未配置，产物改为保存到本地存储")
+    artifact_storage = LocalStorage(
+        os.getenv("LOCAL_STORAGE_DIR", os.path.join(TEMP_FOLDER, "artifacts")),
+        base_url=os.getenv("PUBLIC_BASE_URL", ""),
+        scratch=scratch,
+    )
+
+# 产物后台上传：请求不再等待上传完成，失败时带退避重试
+artifact_uploader = ArtifactUploader(
+    artifact_storage,
+    max_workers=int(os.getenv("UPLOAD_WORKERS", 4)),
+    retries=int(os.getenv("UPLOAD_RETRIES", 3)),
+    no_retry=client_error,
+)
+
+def publish_artifact(target_name: str, data: bytes, content_type: str) -> dict:
+    """提交产物后台上传，立即返回链接：url 为上传完成后的地址，local_url 在上传完成前即可访问"""
+    url = artifact_uploader.submit(target_name, data, content_type)
+    local_url = f"/artifacts/{target_name}"
+    if has_request_context():
+        local_url = request.host_url.rstrip("/") + local_url
+        if url.startswith("/"):
+            url = request.host_url.rstrip("/") + url
+    logger.debug(f"已提交后台上传: {target_name} ({len(data)} 字节)")
+    return {"url": url, "local_url": local_url}
+
+def detect_samples(video_id: str, samples):
+    """带缓存的批量检测，返回与 samples 对应的 Detections 列表；只把缓存未命中的帧交给检测后端
+
+    检测结果在这里一次性转为结构化数组，缓存命中时直接复用，不再逐次转换。
+    """
+    detector = get_detector()
+    keys = [
+        DetectionCache.make_key(video_id, sample.frame_index, detector.model_id, detector.model_version,
+                                DETECTION_CONFIDENCE, DETECTION_OVERLAP)
+        for sample in samples
+    ]
+    with span("detect"):
+        found = {key: detection_cache.get(key) for key in keys}
+        # 同一帧重复出现时只检测一次
+        missing = {}
+        for i, key in enumerate(keys):
+            if found[key] is None:
+                missing.setdefault(key, i)
+        logger.debug(f"检测缓存命中 {len(found) - len(missing)}/{len(found)} 帧")
+
+        if missing:
+            with backend_limits["detector"].slot(), span("model_predict"):
+                predictions = detector.predict([samples[i].frame for i in missing.values()])
+            DETECTOR_FRAMES.inc(len(missing), backend=detector.name)
+            for key, prediction in zip(missing, predictions):
+                detections = Detections.from_result(prediction)
+                detection_cache.put(key, detections)
+                found[key] = detections
+
+    return [found[key] for key in keys]
+
+def render_annotated(frame, detections, renditions):
+    """绘制检测结果并按各输出规格在内存中编码，返回 (EncodedImage 列表, 球员信息)；在 CPU 线程池中执行"""
+    with span("annotate"):
+        annotated_frame, players_data = draw_detections(frame, detections)
+    with span("encode"):
+        encoded = encode_renditions(annotated_frame, renditions)
+    return encoded, players_data
+
+def publish_renditions(prefix: str, encoded) -> dict:
+    """提交各规格的后台上传（小图先上传），返回 {规格名: 链接和尺寸}"""
+    published = {}
+    for image in sorted(encoded, key=lambda image: len(image.data)):
+        rendition = image.rendition
+        artifact = publish_artifact(f"{prefix}_{rendition.name}{rendition.extension}",
+                                    image.data, rendition.content_type)
+        published[rendition.name] = {
+            **artifact,
+            "width": image.width,
+            "height": image.height,
+            "format": rendition.format,
+            "bytes": len(image.data),
+        }
+    return {image.rendition.name: published[image.rendition.name] for image in encoded}
+
+def parse_renditions_param(form):
+    """请求中的 renditions 参数（逗号分隔的规格名）选择输出规格，未指定时输出全部；未知名称抛出 AnalysisError(400)"""
+    names = [name.strip() for name in (form.get("renditions") or "").split(",") if name.strip()]
+    if not names:
+        return FRAME_RENDITIONS
+    available = {rendition.name: rendition for rendition in FRAME_RENDITIONS}
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise AnalysisError(f"未知的输出规格: {', '.join(unknown)}（可用: {', '.join(available)}）", 400)
+    return [available[name] for name in names]
+
+def resolve_video():
+    """从请求中取得视频会话：优先使用 video_id，否则将上传的文件存入会话存储
+
+    返回 (会话, 错误响应)，二者只有一个不为 None
+    """
+    video_id = request.form.get("video_id") or request.args.get("video_id")
+    if video_id:
+        session = video_store.get(video_id)
+        if session is None or not hold_video(session):
+            return None, (jsonify({"error": "视频不存在或已过期，请重新上传", "success": False}), 404)
+        logger.info(f"复用已上传视频: {video_id}")
+        return session, None
+
+    file = request.files.get("video")
+    if not file:
+        return None, (jsonify({"error": "No file uploaded", "success": False}), 400)
 
-def cleanup_file(file_path):
-    """安全删除文件"""
+    session, _, error = save_video_upload(file)
+    if error:
+        return None, error
+    if not hold_video(session):
+        return None, (jsonify({"error": "临时存储空间不足，视频已被清理，请稍后重试", "success": False}), 507)
+    return session, None
+
+def hold_video(session) -> bool:
+    """在本次请求结束前固定视频文件，防止被临时存储配额淘汰"""
+    if not video_store.acquire(session):
+        return False
+    g.setdefault("video_holds", []).append(session)
+    return True
+
+def save_video_upload(file):
+    """保存请求中上传的视频，返回 (会话, 是否新建, 错误响应)；先按请求大小预留临时存储空间"""
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"已删除临时文件: {file_path}")
-    except Exception as e:
-        print(f"删除文件时出错: {e}")
+        with scratch.reserve(request.content_length or 0) as reservation, span("save_upload"):
+            session, created = video_store.ingest(file.stream, file.filename, reservation)
+    except ScratchFull:
+        raise
+    except Exception as save_error:
+        logger.error(f"文件保存失败: {str(save_error)}")
+        return None, False, (jsonify({"error": f"文件保存失败: {str(save_error)}", "success": False}), 500)
+
+    logger.info(f"视频已保存: {session.video_id} ({'新上传' if created else '重复上传，复用已有文件'})")
+    return session, created, None
+
+@app.route("/videos", methods=["POST"])
+def upload_video():
+    """上传视频并返回内容哈希 video_id，后续分析请求可直接传 video_id"""
+    file = request.files.get("video")
+    if not file:
+        return jsonify({"error": "No file uploaded", "success": False}), 400
 
-def upload_to_supabase(file_path: str, target_name: str) -> str:
-    """上传文件到 Supabase 并返回公共链接"""
+    session, created, error = save_video_upload(file)
+    if error:
+        return error
+
+    result = session.to_dict()
+    result["duplicate"] = not created
+    result["success"] = True
+    return jsonify(result)
+
+@app.route("/videos/<video_id>", methods=["GET"])
+def get_video(video_id):
+    """查询视频会话信息（同时刷新过期时间）"""
+    session = video_store.get(video_id)
+    if session is None:
+        return jsonify({"error": "视频不存在或已过期", "success": False}), 404
+    result = session.to_dict()
+    result["success"] = True
+    return jsonify(result)
+
+@app.route("/videos/<video_id>", methods=["DELETE"])
+def delete_video(video_id):
+    """删除视频会话"""
+    if not video_store.remove(video_id):
+        return jsonify({"error": "视频不存在或已过期", "success": False}), 404
+    return jsonify({"success": True})
+
+def upload_error_response(error):
+    """分片上传错误响应，带上服务端已确认的 offset 便于客户端续传"""
+    body = {"error": str(error), "success": False}
+    if error.offset is not None:
+        body["offset"] = error.offset
+    return jsonify(body), error.status
+
+@app.route("/uploads", methods=["POST"])
+def initiate_upload():
+    """初始化分片上传，返回 upload_id；参数 filename、size（字节，可选）"""
+    params = request.get_json(silent=True) or request.form
     try:
-        with open(file_path, "rb") as f:
-            try:
-                supabase.storage.from_(BUCKET_NAME).remove([target_name])
-            except Exception as e:
-                print(f"删除文件时出错（可能文件不存在）: {e}")
-                pass
-            
-            res = supabase.storage.from_(BUCKET_NAME).upload(
-                path=target_name,
-                file=f
-            )
-        
-        if hasattr(res, 'error') and res.error:
-            raise Exception(f"上传 Supabase 失败: {res.error}")
-        
-        public_url = f"{SUPABASE_URL}/storage/v1/object/public/{BUCKET_NAME}/{target_name}"
-        print(f"文件上传成功: {public_url}")
-        return public_url
-    
-    except Exception as e:
-        print(f"上传过程中出错: {e}")
-        raise e
+        size = params.get("size")
+        size = int(size) if size not in (None, "") else None
+        session = chunked_uploads.initiate(params.get("filename"), size)
+    except ValueError:
+        return jsonify({"error": "size 必须是整数", "success": False}), 400
+    except UploadError as e:
+        return upload_error_response(e)
+
+    result = session.to_dict()
+    result["chunk_size"] = UPLOAD_CHUNK_SIZE
+    result["success"] = True
+    return jsonify(result), 201
+
+@app.route("/uploads/<upload_id>", methods=["GET"])
+def get_upload(upload_id):
+    """查询已确认的 offset，断线后从该位置继续上传"""
+    try:
+        result = chunked_uploads.get(upload_id).to_dict()
+    except UploadError as e:
+        return upload_error_response(e)
+    result["success"] = True
+    return jsonify(result)
+
+@app.route("/uploads/<upload_id>", methods=["PUT"])
+def put_upload_chunk(upload_id):
+    """上传一个分片：请求体为原始字节，Content-Range: bytes start-end/total"""
+    try:
+        content_range = request.headers.get("Content-Range")
+        if content_range:
+            start, end, total = parse_content_range(content_range)
+        else:
+            start, end, total = int(request.headers.get("Upload-Offset", 0)), None, None
+        session = chunked_uploads.write_chunk(upload_id, start, request.stream, total,
+                                              stream_length=request.content_length, end=end)
+    except ValueError:
+        return jsonify({"error": "Upload-Offset 必须是整数", "success": False}), 400
+    except UploadError as e:
+        return upload_error_response(e)
+
+    result = session.to_dict()
+    result["success"] = True
+    return jsonify(result)
+
+@app.route("/uploads/<upload_id>/complete", methods=["POST"])
+def complete_upload(upload_id):
+    """完成分片上传，校验后转为视频会话并返回 video_id；可选参数 sha256"""
+    params = request.get_json(silent=True) or request.form
+    try:
+        video_session, created = chunked_uploads.finalize(upload_id, params.get("sha256"))
+    except UploadError as e:
+        return upload_error_response(e)
+
+    result = video_session.to_dict()
+    result["duplicate"] = not created
+    result["success"] = True
+    return jsonify(result)
+
+@app.route("/uploads/<upload_id>", methods=["DELETE"])
+def abort_upload(upload_id):
+    """放弃分片上传并删除已上传的数据"""
+    if not chunked_uploads.abort(upload_id):
+        return jsonify({"error": "上传不存在或已过期", "success": False}), 404
+    return jsonify({"success": True})
 
 @app.route("/test_post", methods=["POST"])
 def test_post():
@@ -118,427 +591,804 @@ def index():
     """主页 - 重定向到单帧分析页面"""
     return render_template("frame_analysis.html")
 
+class AnalysisError(Exception):
+    """分析流程中可直接返回给客户端的错误"""
+
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+def job_stage(job, stage: str):
+    """后台任务中报告当前阶段，并在阶段边界响应取消请求"""
+    if job is not None:
+        job.check_cancelled()
+        job_manager.set_stage(job, stage)
+
+def check_frame_analysis_config():
+    """检查单帧分析依赖的后端配置，未配置时抛出 AnalysisError"""
+    try:
+        get_detector()
+    except ServiceUnavailable as e:
+        if e.state == DISABLED:
+            logger.error("检测后端未配置 (ROBOFLOW_API_KEY 或 DETECTOR_MODEL_PATH)")
+            raise AnalysisError("Detector not configured")
+        raise AnalysisError(f"检测后端尚未就绪，请稍后重试: {e}", 503)
+
+def run_frame_analysis(video_session, time_in_seconds, job=None, renditions=None) -> dict:
+    """分析视频的单帧，返回响应数据；失败时抛出 AnalysisError"""
+    temp_input_path = video_session.path
+    renditions = renditions or FRAME_RENDITIONS
+
+    # 产物名带唯一ID，同一秒内的并发请求不会相互覆盖
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    artifact_id = new_artifact_id()
+
+    # 打开视频并获取基本信息
+    job_stage(job, "decode")
+    try:
+        with span("open"):
+            reader = FrameReader(temp_input_path, index=get_seek_index(temp_input_path, run=cpu_pool.run))
+    except IOError:
+        logger.error("无法打开视频文件")
+        raise AnalysisError("无法打开视频文件，请检查文件格式")
+
+    try:
+        fps = reader.fps
+        total_frames = reader.total_frames
+        video_duration = reader.duration
+        logger.debug(f"视频信息: 帧率={fps:.2f}fps, 时长={video_duration:.2f}秒, 总帧数={total_frames}")
+
+        # 获取请求中指定的时间戳
+        requested_time = 0.0
+
+        if time_in_seconds:
+            try:
+                requested_time = float(time_in_seconds)
+                # 确保时间在有效范围内
+                requested_time = max(0.0, min(requested_time, video_duration))
+                logger.debug(f"前端请求的时间: {requested_time:.3f}秒")
+            except ValueError:
+                logger.warning(f"无效的时间值: {time_in_seconds}，使用默认值")
+                requested_time = video_duration / 2
+        else:
+            # 默认使用中间时间
+            requested_time = video_duration / 2
+            logger.debug(f"未指定时间，使用默认中间时间: {requested_time:.3f}秒")
+
+        # 使用定位索引跳到最近的关键帧，再解码到精确的目标帧
+        with span("decode"):
+            samples = cpu_pool.run(reader.read, [requested_time])
+        if not samples:
+            logger.error("无法提取视频帧")
+            raise AnalysisError("Failed to extract frame from video")
+
+        frame = samples[0].frame
+        actual_time = samples[0].actual_time
+        actual_frame = samples[0].frame_index
+        logger.debug(f"视频帧提取成功: 时间={actual_time:.3f}秒, 帧={actual_frame}")
+
+        # 调用检测后端分析单帧（命中检测缓存时不再请求）
+        job_stage(job, "detect")
+        try:
+            detections = detect_samples(video_session.video_id, samples)[0]
+            logger.info(f"目标检测完成，检测到 {len(detections)} 个对象")
+        except Overloaded:
+            raise
+        except Exception as roboflow_error:
+            logger.error(f"目标检测失败: {str(roboflow_error)}")
+            raise AnalysisError(f"AI分析失败: {str(roboflow_error)}", getattr(roboflow_error, "status", 500))
+
+        # 处理预测结果
+        h, w = frame.shape[:2]
+        logger.debug(f"图像尺寸: {w}x{h}")
+
+        # 绘制检测结果并在内存中编码
+        job_stage(job, "annotate")
+        encoded, players_data = cpu_pool.run(render_annotated, frame, detections, renditions)
+        logger.debug(f"检测结果绘制完成，球员数量: {len(players_data)}")
+
+        # 后台上传，不阻塞响应
+        job_stage(job, "upload")
+        published = publish_renditions(f"frame_analysis/{timestamp}_{artifact_id}_annotated_frame", encoded)
+        primary = published[renditions[0].name]
+
+        # 构建响应数据
+        response_data = {
+            "video_id": video_session.video_id,
+            "artifact_id": artifact_id,
+            "time_in_seconds": actual_time,
+            "annotated_frame_url": primary["url"],
+            "annotated_frame_local_url": primary["local_url"],
+            "renditions": published,
+            "upload_pending": True,
+            "predictions": detections,
+            "players_data": PlayerTable(players_data),
+            "image_dimensions": {"width": w, "height": h},
+            "success": True,
+            "video_duration": video_duration,
+            "gemini_analysis": "请使用Gemini AI分析功能上传整个视频进行分析"
+        }
+
+        return response_data
+
+    except (AnalysisError, JobCancelled, Overloaded):
+        raise
+    except Exception as processing_error:
+        logger.exception(f"视频处理过程中出错: {str(processing_error)}")
+        raise AnalysisError(f"视频处理失败: {str(processing_error)}")
+
+    finally:
+        reader.close()
+
+def respond(data, status=200):
+    """分析结果响应：默认 JSON；Accept 为 application/msgpack（或 format=msgpack）时返回 MessagePack，
+    检测框、球员和轨迹点按列编码为二进制数组，客户端接受 gzip 时压缩"""
+    if negotiate(request.accept_mimetypes, request.args.get("format")) == "json":
+        return jsonify(data), status
+    with span("serialize"):
+        body, encoding = maybe_gzip(packb(data), request.accept_encodings)
+    response = Response(body, status=status, mimetype=MSGPACK_TYPE)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.update(("Accept", "Accept-Encoding"))
+    return response
+
 @app.route("/analyze_frame", methods=["POST"])
+@admitted
 def analyze_frame():
     """分析视频的单帧"""
     try:
-        print("=== analyze_frame 开始 ===")
-        print(f"请求方法: {request.method}")
-        print(f"Content-Type: {request.content_type}")
-        print(f"文件数量: {len(request.files)}")
-        print(f"表单数据: {list(request.form.keys())}")
-        
-        if request.method == "POST":
-            file = request.files.get("video")
-            if not file:
-                print("❌ 错误: 没有收到视频文件")
-                return jsonify({"error": "No file uploaded"}), 400
-
-            print(f"✅ 收到文件: {file.filename}")
-            print(f"✅ 文件大小: {file.content_length if hasattr(file, 'content_length') else '未知'}")
-            
-            # 检查环境变量
-            if not API_KEY:
-                print("❌ 错误: ROBOFLOW_API_KEY 未设置")
-                return jsonify({"error": "ROBOFLOW_API_KEY not configured"}), 500
-                
-            if not SUPABASE_URL or not SUPABASE_KEY:
-                print("❌ 错误: Supabase配置不完整")
-                return jsonify({"error": "Supabase configuration incomplete"}), 500
-                
-            print("✅ 环境变量检查通过")
-
-            # 生成唯一的文件名
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"{timestamp}_{file.filename}"
-            
-            # 使用临时文件路径
-            temp_input_path = os.path.join(TEMP_FOLDER, filename)
-            print(f"✅ 临时文件路径: {temp_input_path}")
-            
-            try:
-                file.save(temp_input_path)
-                print("✅ 文件保存成功")
-            except Exception as save_error:
-                print(f"❌ 文件保存失败: {str(save_error)}")
-                return jsonify({"error": f"文件保存失败: {str(save_error)}", "success": False}), 500
+        logger.debug(f"analyze_frame: Content-Type={request.content_type}, "
+                     f"文件数量={len(request.files)}, 表单数据={list(request.form.keys())}")
 
-            try:
-                # 打开视频并获取基本信息
-                print("🎬 开始处理视频...")
-                cap = cv2.VideoCapture(temp_input_path)
-                
-                if not cap.isOpened():
-                    print("❌ 无法打开视频文件")
-                    cleanup_file(temp_input_path)
-                    return jsonify({"error": "无法打开视频文件，请检查文件格式", "success": False}), 500
-                
-                fps = cap.get(cv2.CAP_PROP_FPS)
-                total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-                video_duration = cap.get(cv2.CAP_PROP_FRAME_COUNT) / fps if fps > 0 else 0
-                print(f"✅ 视频信息: 帧率={fps:.2f}fps, 时长={video_duration:.2f}秒, 总帧数={total_frames}")
-                
-                # 获取请求中指定的时间戳
-                time_in_seconds = request.form.get("time_in_seconds")
-                requested_time = 0.0
-                
-                if time_in_seconds:
-                    try:
-                        requested_time = float(time_in_seconds)
-                        # 确保时间在有效范围内
-                        requested_time = max(0.0, min(requested_time, video_duration))
-                        print(f"✅ 前端请求的时间: {requested_time:.3f}秒")
-                    except ValueError:
-                        print(f"⚠️ 无效的时间值: {time_in_seconds}，使用默认值")
-                        requested_time = video_duration / 2
-                else:
-                    # 默认使用中间时间
-                    requested_time = video_duration / 2
-                    print(f"✅ 未指定时间，使用默认中间时间: {requested_time:.3f}秒")
-                
-                # 使用时间戳定位
-                cap.set(cv2.CAP_PROP_POS_MSEC, requested_time * 1000)
-                actual_time = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
-                actual_frame = int(cap.get(cv2.CAP_PROP_POS_FRAMES))
-                print(f"✅ 实际定位到: 时间={actual_time:.3f}秒, 帧={actual_frame}")
-                
-                # 读取帧
-                ret, frame = cap.read()
-                if not ret:
-                    print("❌ 无法提取视频帧")
-                    cap.release()
-                    cleanup_file(temp_input_path)
-                    return jsonify({"error": "Failed to extract frame from video"}), 500
-                
-                print("✅ 视频帧提取成功")
-                
-                # 保存帧为图像文件
-                frame_path = os.path.join(TEMP_FOLDER, f"{timestamp}_frame.jpg")
-                cv2.imwrite(frame_path, frame)
-                print(f"✅ 帧图像保存: {frame_path}")
-                
-                # 调用Roboflow API分析单帧
-                print("🤖 开始Roboflow分析...")
-                try:
-                    prediction = model.predict(frame_path, confidence=40, overlap=30).json()
-                    print(f"✅ Roboflow分析完成，检测到 {len(prediction.get('predictions', []))} 个对象")
-                except Exception as roboflow_error:
-                    print(f"❌ Roboflow分析失败: {str(roboflow_error)}")
-                    cap.release()
-                    cleanup_file(temp_input_path)
-                    cleanup_file(frame_path)
-                    return jsonify({"error": f"AI分析失败: {str(roboflow_error)}", "success": False}), 500
-                
-                # 处理预测结果
-                h, w = frame.shape[:2]
-                print(f"✅ 图像尺寸: {w}x{h}")
-                
-                # 创建带有标注的图像
-                annotated_frame = frame.copy()
-                
-                # 存储检测到的球员信息，用于前端交互
-                players_data = []
-                
-                # 绘制检测结果
-                print("🎨 开始绘制检测结果...")
-                for pred in prediction['predictions']:
-                    # 获取边界框坐标
-                    x = pred['x']
-                    y = pred['y']
-                    width = pred['width']
-                    height = pred['height']
-                    
-                    # 计算边界框的左上角和右下角坐标
-                    x1 = int(x - width/2)
-                    y1 = int(y - height/2)
-                    x2 = int(x + width/2)
-                    y2 = int(y + height/2)
-                    
-                    # 确保坐标在图像范围内
-                    x1 = max(0, x1)
-                    y1 = max(0, y1)
-                    x2 = min(w, x2)
-                    y2 = min(h, y2)
-                    
-                    # 根据类别选择颜色和标签
-                    if pred['class'] == 'ball':
-                        # 球的特殊标记 - 使用渐变光晕效果
-                        center = (int(x), int(y))
-                        
-                        # 1. 绘制外部光晕效果
-                        for r in range(20, 10, -1):
-                            alpha = (20 - r) / 10  # 渐变透明度
-                            color = (0, int(255 * alpha), int(255 * alpha))  # 渐变黄色
-                            overlay = annotated_frame.copy()
-                            cv2.circle(overlay, center, r, color, 2)
-                            cv2.addWeighted(overlay, 0.3, annotated_frame, 0.7, 0, annotated_frame)
-                        
-                        # 2. 绘制主圆圈 - 明亮的黄色
-                        cv2.circle(annotated_frame, center, 12, (0, 255, 255), 2)
-                        
-                        # 3. 绘制内部圆圈 - 白色高光
-                        cv2.circle(annotated_frame, center, 8, (255, 255, 255), -1)
-                        
-                        # 4. 绘制中心点 - 黄色
-                        cv2.circle(annotated_frame, center, 4, (0, 200, 255), -1)
-                        
-                        label = "Ball"
-                        
-                    elif pred['class'] == 'referee':
-                        # 裁判员使用轻量级角标记设计 - 与球员相同但颜色为紫色
-                        label = "Referee"
-                        
-                        # 使用鲜艳紫色作为主色调
-                        corner_color = (255, 0, 255)  # 鲜艳紫色/品红色
-                        
-                        # 只添加角标记 - 不绘制填充矩形和完整边框
-                        corner_length = min(20, (x2-x1)//3, (y2-y1)//3)  # 角标记长度
-                        thickness = 2  # 角标记粗细
-                        
-                        # 左上角
-                        cv2.line(annotated_frame, (x1, y1), (x1 + corner_length, y1), corner_color, thickness)
-                        cv2.line(annotated_frame, (x1, y1), (x1, y1 + corner_length), corner_color, thickness)
-                        
-                        # 右上角
-                        cv2.line(annotated_frame, (x2, y1), (x2 - corner_length, y1), corner_color, thickness)
-                        cv2.line(annotated_frame, (x2, y1), (x2, y1 + corner_length), corner_color, thickness)
-                        
-                        # 左下角
-                        cv2.line(annotated_frame, (x1, y2), (x1 + corner_length, y2), corner_color, thickness)
-                        cv2.line(annotated_frame, (x1, y2), (x1, y2 - corner_length), corner_color, thickness)
-                        
-                        # 右下角
-                        cv2.line(annotated_frame, (x2, y2), (x2 - corner_length, y2), corner_color, thickness)
-                        cv2.line(annotated_frame, (x2, y2), (x2, y2 - corner_length), corner_color, thickness)
-                        
-                    else:
-                        # 球员使用轻量级角标记设计 - 不使用填充边界框
-                        label = "Player"
-                        
-                        # 使用橙色作为主色调
-                        corner_color = (255, 128, 0)  # 橙色
-                        
-                        # 只添加角标记 - 不绘制填充矩形和完整边框
-                        corner_length = min(20, (x2-x1)//3, (y2-y1)//3)  # 角标记长度
-                        thickness = 2  # 角标记粗细
-                        
-                        # 左上角
-                        cv2.line(annotated_frame, (x1, y1), (x1 + corner_length, y1), corner_color, thickness)
-                        cv2.line(annotated_frame, (x1, y1), (x1, y1 + corner_length), corner_color, thickness)
-                        
-                        # 右上角
-                        cv2.line(annotated_frame, (x2, y1), (x2 - corner_length, y1), corner_color, thickness)
-                        cv2.line(annotated_frame, (x2, y1), (x2, y1 + corner_length), corner_color, thickness)
-                        
-                        # 左下角
-                        cv2.line(annotated_frame, (x1, y2), (x1 + corner_length, y2), corner_color, thickness)
-                        cv2.line(annotated_frame, (x1, y2), (x1, y2 - corner_length), corner_color, thickness)
-                        
-                        # 右下角
-                        cv2.line(annotated_frame, (x2, y2), (x2 - corner_length, y2), corner_color, thickness)
-                        cv2.line(annotated_frame, (x2, y2), (x2, y2 - corner_length), corner_color, thickness)
-                        
-                        # 添加小型ID标签在边界框顶部
-                        player_id = len(players_data) + 1
-                        id_text = f"P{player_id}"
-                        text_size = cv2.getTextSize(id_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
-                        text_x = x1 + (x2 - x1 - text_size[0]) // 2  # 居中
-                        text_y = y1 - 5  # 边界框上方
-                        
-                        # 确保文本在图像内
-                        if text_y < 15:
-                            text_y = y1 + 15
-                        
-                        # 绘制文本背景
-                        cv2.rectangle(annotated_frame, 
-                                     (text_x - 2, text_y - text_size[1] - 2),
-                                     (text_x + text_size[0] + 2, text_y + 2),
-                                     (0, 0, 0), -1)
-                        
-                        # 绘制文本
-                        cv2.putText(annotated_frame, id_text, (text_x, text_y), 
-                                   cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-                        
-                        # 存储球员信息用于前端交互
-                        player_id = len(players_data) + 1  # 简单的ID分配
-                        players_data.append({
-                            "id": player_id,
-                            "bbox": [x1, y1, x2, y2],
-                            "center": [int(x), int(y)]
-                        })
-                
-                print(f"✅ 检测结果绘制完成，球员数量: {len(players_data)}")
-                
-                # 保存标注后的图像
-                annotated_frame_path = os.path.join(TEMP_FOLDER, f"{timestamp}_annotated_frame.jpg")
-                cv2.imwrite(annotated_frame_path, annotated_frame)
-                print(f"✅ 标注图像保存: {annotated_frame_path}")
-                
-                # 上传到Supabase
-                print("☁️ 开始上传到Supabase...")
-                try:
-                    supabase_path = f"frame_analysis/{timestamp}_annotated_frame.jpg"
-                    public_url = upload_to_supabase(annotated_frame_path, supabase_path)
-                    print(f"✅ Supabase上传成功: {public_url}")
-                except Exception as upload_error:
-                    print(f"❌ Supabase上传失败: {str(upload_error)}")
-                    cap.release()
-                    cleanup_file(temp_input_path)
-                    cleanup_file(frame_path)
-                    cleanup_file(annotated_frame_path)
-                    return jsonify({"error": f"图像上传失败: {str(upload_error)}", "success": False}), 500
-                
-                # 构建响应数据
-                response_data = {
-                    "time_in_seconds": actual_time,
-                    "annotated_frame_url": public_url,
-                    "predictions": prediction['predictions'],
-                    "players_data": players_data,
-                    "image_dimensions": {"width": w, "height": h},
-                    "success": True,
-                    "video_duration": video_duration,
-                    "gemini_analysis": "请使用Gemini AI分析功能上传整个视频进行分析"
-                }
-                
-                print("✅ analyze_frame 处理完成，返回成功响应")
-                return jsonify(response_data)
-                
-            except Exception as processing_error:
-                print(f"❌ 视频处理过程中出错: {str(processing_error)}")
-                import traceback
-                print("详细错误堆栈:")
-                print(traceback.format_exc())
-                return jsonify({
-                    "error": f"视频处理失败: {str(processing_error)}",
-                    "success": False
-                }, 500)
-            
-            finally:
-                # 清理临时文件
-                print("🧹 开始清理临时文件...")
-                cleanup_file(temp_input_path)
-                if 'frame_path' in locals():
-                    cleanup_file(frame_path)
-                if 'annotated_frame_path' in locals():
-                    cleanup_file(annotated_frame_path)
-                if 'cap' in locals():
-                    cap.release()
-                print("✅ 临时文件清理完成")
-                
+        check_frame_analysis_config()
+        renditions = parse_renditions_param(request.form)
+
+        # 获取视频：video_id 复用已上传的视频，否则保存本次上传的文件
+        video_session, error = resolve_video()
+        if error:
+            return error
+
+        return respond(run_frame_analysis(video_session, request.form.get("time_in_seconds"),
+                                          renditions=renditions))
+
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+    except Overloaded:
+        raise
     except Exception as e:
-        print(f"❌ analyze_frame 发生顶级异常: {str(e)}")
-        import traceback
-        print("完整错误堆栈:")
-        print(traceback.format_exc())
+        logger.exception(f"analyze_frame 发生顶级异常: {str(e)}")
         return jsonify({
             "error": f"处理失败: {str(e)}",
             "success": False
         }), 500
 
+@app.route("/analyze_frames", methods=["POST"])
+@admitted
+def analyze_frames():
+    """批量分析同一视频的多个时间点：一次解码遍历，批量检测"""
+    try:
+        check_frame_analysis_config()
+        renditions = parse_renditions_param(request.form)
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+
+    try:
+        timestamps = json.loads(request.form.get("timestamps", ""))
+        if not isinstance(timestamps, list) or not timestamps:
+            raise ValueError("timestamps 必须是非空数组")
+        timestamps = [float(t) for t in timestamps]
+        if not all(math.isfinite(t) for t in timestamps):
+            raise ValueError("timestamps 中的时间点必须是有限数值")
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"参数格式错误: {str(e)}", "success": False}), 400
+
+    if len(timestamps) > MAX_BATCH_FRAMES:
+        return jsonify({
+            "error": f"单次最多分析 {MAX_BATCH_FRAMES} 帧",
+            "success": False
+        }), 400
+
+    video_session, error = resolve_video()
+    if error:
+        return error
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    artifact_id = new_artifact_id()
+    try:
+        try:
+            with span("decode"):
+                info, samples = cpu_pool.run(read_frames, video_session.path, timestamps,
+                                             index=get_seek_index(video_session.path, run=cpu_pool.run))
+        except IOError as e:
+            return jsonify({"error": str(e), "success": False}), 500
+        if not samples:
+            return jsonify({"error": "Failed to extract frame from video", "success": False}), 500
+        logger.info(f"批量提取 {len(samples)} 帧 (请求 {len(timestamps)} 个时间点)")
+
+        try:
+            detections = detect_samples(video_session.video_id, samples)
+        except Overloaded:
+            raise
+        except Exception as roboflow_error:
+            logger.error(f"目标检测失败: {str(roboflow_error)}")
+            return (jsonify({"error": f"AI分析失败: {str(roboflow_error)}", "success": False}),
+                    getattr(roboflow_error, "status", 500))
+
+        # 各帧的绘制和编码在 CPU 线程池中并行，全部在内存中完成；重复的帧只绘制和上传一次
+        first = {}
+        for i, sample in enumerate(samples):
+            first.setdefault(sample.frame_index, i)
+        unique = list(first.values())
+        rendered = cpu_pool.map(render_annotated, [samples[i].frame for i in unique],
+                                [detections[i] for i in unique],
+                                [renditions] * len(unique))
+        outputs = {}
+        for i, (encoded, players_data) in zip(unique, rendered):
+            frame_index = samples[i].frame_index
+            published = publish_renditions(
+                f"frame_analysis/{timestamp}_{artifact_id}_{frame_index}_annotated_frame", encoded)
+            outputs[frame_index] = (published, players_data)
+
+        frames = []
+        for sample, frame_detections in zip(samples, detections):
+            published, players_data = outputs[sample.frame_index]
+            primary = published[renditions[0].name]
+
+            frames.append({
+                "requested_time": sample.requested_time,
+                "time_in_seconds": sample.actual_time,
+                "frame_index": sample.frame_index,
+                "annotated_frame_url": primary["url"],
+                "annotated_frame_local_url": primary["local_url"],
+                "renditions": published,
+                "predictions": frame_detections,
+                "players_data": PlayerTable(players_data),
+            })
+
+        h, w = samples[0].frame.shape[:2]
+        return respond({
+            "success": True,
+            "video_id": video_session.video_id,
+            "artifact_id": artifact_id,
+            "video_duration": info["duration"],
+            "image_dimensions": {"width": w, "height": h},
+            "upload_pending": True,
+            "frames": frames,
+        })
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        logger.exception(f"批量分析过程中出错: {str(e)}")
+        return jsonify({"error": f"视频处理失败: {str(e)}", "success": False}), 500
+
+def parse_tracking_params(form):
+    """解析跟踪参数，返回 (开始时间, 结束时间, 采样帧率, 检测间隔)；格式错误时抛出 AnalysisError(400)"""
+    try:
+        start_time = float(form.get("start_time", 0))
+        end_time = float(form["end_time"]) if form.get("end_time") else start_time + 10
+        sample_fps = float(form.get("sample_fps", TRACKING_SAMPLE_FPS))
+        detect_every = int(form.get("detect_every", TRACKING_DETECT_EVERY))
+    except ValueError as e:
+        raise AnalysisError(f"参数格式错误: {str(e)}", 400)
+    if start_time < 0 or end_time <= start_time or sample_fps <= 0 or detect_every < 1:
+        raise AnalysisError("时间范围、采样帧率或检测间隔无效", 400)
+    if end_time - start_time > TRACKING_MAX_SECONDS:
+        raise AnalysisError(f"单次最多跟踪 {TRACKING_MAX_SECONDS:g} 秒", 400)
+    return start_time, end_time, sample_fps, detect_every
+
+def run_tracking(video_session, start_time, end_time, sample_fps, detect_every, job=None) -> dict:
+    """在时间范围内跟踪球员，返回带稳定轨迹ID的结果；失败时抛出 AnalysisError"""
+    job_stage(job, "track")
+    try:
+        reader = FrameReader(video_session.path, index=get_seek_index(video_session.path, run=cpu_pool.run))
+    except IOError:
+        raise AnalysisError("无法打开视频文件，请检查文件格式")
+
+    try:
+        end_time = min(end_time, reader.duration)
+        if end_time <= start_time:
+            raise AnalysisError("开始时间超出视频时长", 400)
+        with span("track"):
+            result = track_clip(
+                reader, start_time, end_time,
+                detect=lambda samples: detect_samples(video_session.video_id, samples),
+                sample_fps=sample_fps, detect_every=detect_every,
+                check_cancelled=job.check_cancelled if job is not None else None,
+            )
+    except (AnalysisError, JobCancelled, Overloaded):
+        raise
+    except Exception as e:
+        logger.exception(f"球员跟踪过程中出错: {str(e)}")
+        raise AnalysisError(f"跟踪失败: {str(e)}")
+    finally:
+        reader.close()
+
+    tracking_id = track_store.put(video_session.video_id, result)
+    logger.info(f"跟踪完成: {result['frames']} 帧，检测 {result['detected_frames']} 帧，{len(result['tracks'])} 条轨迹")
+    return {
+        "success": True,
+        "video_id": video_session.video_id,
+        "tracking_id": tracking_id,
+        "video_duration": reader.duration,
+        **result,
+        "tracks": TrackTable(result["tracks"]),
+    }
+
+@app.route("/track_players", methods=["POST"])
+@admitted
+def track_players():
+    """跟踪一段时间内的球员：每 N 帧检测一次，中间帧用光流跟踪，返回稳定的轨迹ID"""
+    try:
+        check_frame_analysis_config()
+        start_time, end_time, sample_fps, detect_every = parse_tracking_params(request.form)
+
+        video_session, error = resolve_video()
+        if error:
+            return error
+
+        return respond(run_tracking(video_session, start_time, end_time, sample_fps, detect_every))
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+
 @app.route("/gemini_analysis")
 def gemini_analysis():
     """渲染Gemini AI分析页面"""
     return render_template("frame_analysis.html")
 
-@app.route("/analyze_with_gemini", methods=["POST"])
-def analyze_with_gemini():
-    """使用Gemini AI分析视频中特定时间点的特定球员"""
-    file = request.files.get("video")
-    if not file:
-        return jsonify({"error": "No file uploaded", "success": False}), 400
+def parse_gemini_params(form):
+    """解析 Gemini 分析参数，返回 (时间点, 球员坐标, 提示词)；格式错误时抛出 AnalysisError(400)
 
-    time_in_seconds = request.form.get("time_in_seconds")
-    player_coordinates_str = request.form.get("player_coordinates")
-    prompt = request.form.get("prompt")
+    给出 tracking_id 和 track_id 时可以不传球员坐标，由 resolve_track 从跟踪结果中取得。
+    """
+    time_in_seconds = form.get("time_in_seconds")
+    player_coordinates_str = form.get("player_coordinates")
+    prompt = form.get("prompt")
+    has_track = form.get("tracking_id") and form.get("track_id")
 
-    if not time_in_seconds or not player_coordinates_str or not prompt:
-        return jsonify({
-            "error": "缺少必要参数：时间点、球员坐标或提示词",
-            "success": False
-        }), 400
+    if not time_in_seconds or not (player_coordinates_str or has_track) or not prompt:
+        raise AnalysisError("缺少必要参数：时间点、球员坐标或提示词", 400)
 
     try:
-        player_coordinates = json.loads(player_coordinates_str)
+        player_coordinates = json.loads(player_coordinates_str) if player_coordinates_str else None
         time_in_seconds = float(time_in_seconds)
     except (ValueError, json.JSONDecodeError) as e:
-        return jsonify({"error": f"参数格式错误: {str(e)}", "success": False}), 400
+        raise AnalysisError(f"参数格式错误: {str(e)}", 400)
+    if not math.isfinite(time_in_seconds) or time_in_seconds < 0:
+        raise AnalysisError(f"时间点必须是非负数: {time_in_seconds}", 400)
+
+    if player_coordinates is not None:
+        try:
+            point = player_point(player_coordinates)
+        except (TypeError, ValueError):
+            point = None
+        if point is None or not all(math.isfinite(v) for v in point):
+            raise AnalysisError('球员坐标格式错误：应为 {"x", "y"}、{"bbox": [x1, y1, x2, y2]}、[x, y] 或 [x1, y1, x2, y2]',
+                                400)
+
+    return time_in_seconds, player_coordinates, prompt
+
+def parse_clip_mode(form):
+    """片段处理方式：highlight / crop / none，full 表示发送完整视频"""
+    clip_mode = form.get("clip_mode", GEMINI_CLIP_MODE)
+    if clip_mode not in CLIP_MODES + ("full",):
+        raise AnalysisError(f"clip_mode 必须是 {', '.join(CLIP_MODES + ('full',))} 之一", 400)
+    return clip_mode
+
+def parse_use_cache(form):
+    """cache=false 时跳过 Gemini 响应缓存，强制重新分析"""
+    return form.get("cache", "true").lower() not in ("0", "false", "no")
+
+def resolve_track(form, video_session):
+    """根据 tracking_id + track_id 取出之前跟踪得到的轨迹，未指定时返回 None"""
+    tracking_id = form.get("tracking_id")
+    if not tracking_id:
+        return None
+    try:
+        track_id = int(str(form.get("track_id", "")).lstrip("Tt"))
+    except ValueError:
+        raise AnalysisError("track_id 格式错误", 400)
+    track = track_store.get_track(tracking_id, track_id, video_session.video_id)
+    if track is None:
+        raise AnalysisError("跟踪结果不存在或已过期，请重新跟踪", 404)
+    return track
 
+def gemini_cache_key(video_session, time_in_seconds, player_coordinates, prompt, clip_mode, track) -> str:
+    """缓存键：视频内容哈希 + 决定发送内容的全部参数（片段参数、规范化后的坐标和提示词、模型名）"""
+    clip_params = ([clip_mode, GEMINI_CLIP_SECONDS, GEMINI_CLIP_MAX_WIDTH, GEMINI_CLIP_FPS]
+                   if clip_mode in CLIP_MODES else "full")
+    track_params = ([track["track_id"], track["label"], track["start_time"], track["end_time"], track.get("points")]
+                    if track else None)
+    return make_key("gemini", GEMINI_MODEL, video_session.video_id, clip_params, time_in_seconds,
+                    player_coordinates, prompt, track_params)
+
+def run_gemini_analysis(video_session, time_in_seconds, player_coordinates, prompt,
+                        clip_mode=None, job=None, track=None, use_cache=True) -> dict:
+    """使用Gemini分析视频中特定时间点的特定球员，返回响应数据；失败时抛出 AnalysisError
+
+    结果按请求内容缓存，cache 字段表示来源：hit（缓存）、coalesced（与进行中的相同请求共用一次调用）、
+    miss（本次调用了 Gemini）、stale（Gemini 不可用，返回已过期的缓存结果）。use_cache 为 False 时强制重新分析并更新缓存。
+    """
+    key = gemini_cache_key(video_session, time_in_seconds, player_coordinates, prompt, clip_mode, track)
+    try:
+        result, source = gemini_cache.get_or_compute(
+            key,
+            lambda: generate_gemini_analysis(video_session, time_in_seconds, player_coordinates, prompt,
+                                             clip_mode=clip_mode, job=job, track=track),
+            refresh=not use_cache,
+            check=job.check_cancelled if job is not None else None,
+        )
+    except (CircuitOpen, AnalysisError) as e:
+        # Gemini 不可用时退回已过期（或被 cache=false 跳过）的缓存结果
+        result, source = gemini_cache.get_stale(key), "stale"
+        if result is None:
+            raise
+        logger.warning(f"Gemini 调用失败，返回缓存的旧结果: {e}")
+    if source != "miss":
+        logger.info(f"Gemini 分析复用结果（{source}）: {key[:12]}")
+    return {**result, "cached": source != "miss", "cache": source}
+
+def generate_gemini_analysis(video_session, time_in_seconds, player_coordinates, prompt,
+                             clip_mode=None, job=None, track=None) -> dict:
+    """实际调用 Gemini 的分析过程（不经过缓存）"""
+    temp_input_path = video_session.path
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    temp_input_path = os.path.join(TEMP_FOLDER, filename)
-    file.save(temp_input_path)
+    clip_path = None
+
+    try:
+        genai = services.get("gemini", wait=SERVICE_WAIT_SECONDS)
+    except ServiceUnavailable as e:
+        raise AnalysisError(str(e), 500 if e.state == DISABLED else 503)
 
     try:
-        gemini_model = genai.GenerativeModel("gemini-1.5-flash")
+        gemini_model = genai.GenerativeModel(GEMINI_MODEL)
+
+        # 只截取请求时间点附近的片段并降低分辨率/帧率，而不是把整个视频读入内存发送
+        job_stage(job, "prepare")
+        clip = None
+        if clip_mode in CLIP_MODES:
+            clip_path = scratch.new_temp("_clip.mp4", kind="clip")
+            try:
+                with span("clip"):
+                    clip = cpu_pool.run(
+                        extract_clip,
+                        temp_input_path, time_in_seconds, clip_path,
+                        window=GEMINI_CLIP_SECONDS, max_width=GEMINI_CLIP_MAX_WIDTH,
+                        target_fps=GEMINI_CLIP_FPS, player_coordinates=player_coordinates, mode=clip_mode,
+                        track=track, index=get_seek_index(temp_input_path, run=cpu_pool.run),
+                    )
+                scratch.update(clip_path, clip.clip_bytes)
+                logger.info(f"视频片段: {clip.source_bytes} → {clip.clip_bytes} 字节 (减少 {clip.reduction:.1%})")
+            except (JobCancelled, Overloaded):
+                raise
+            except Exception as clip_error:
+                source_bytes = os.path.getsize(temp_input_path)
+                if source_bytes > GEMINI_FULL_VIDEO_MAX_BYTES:
+                    raise AnalysisError(f"视频片段提取失败，原视频 {source_bytes} 字节超过完整发送上限 "
+                                        f"{GEMINI_FULL_VIDEO_MAX_BYTES} 字节: {clip_error}", 500)
+                logger.warning(f"视频片段提取失败，改为发送完整视频（{source_bytes} 字节）: {clip_error}")
+                clip = None
 
         # 读取视频二进制内容
-        with open(temp_input_path, "rb") as video_file:
+        with span("read_video"), open(clip.path if clip else temp_input_path, "rb") as video_file:
             video_bytes = video_file.read()
 
-        user_text = f"{prompt}\n时间点: {time_in_seconds} 秒\n球员坐标: {player_coordinates}"
+        if clip:
+            point = player_point(player_coordinates)
+            clip_point = clip.map_point(*point) if point else None
+            user_text = (
+                f"{prompt}\n"
+                f"视频片段覆盖原视频 {clip.start:.2f}–{clip.end:.2f} 秒，"
+                f"分析时间点: {time_in_seconds} 秒（片段内第 {time_in_seconds - clip.start:.2f} 秒）\n"
+                f"球员坐标: {player_coordinates}"
+            )
+            if clip_point:
+                user_text += f"（片段画面中约为 x={clip_point[0]:.0f}, y={clip_point[1]:.0f}"
+                user_text += "，已用黄色圆圈标出）" if clip_mode == "highlight" else "）"
+        else:
+            user_text = f"{prompt}\n时间点: {time_in_seconds} 秒\n球员坐标: {player_coordinates}"
+        if track:
+            user_text += (f"\n该球员为跟踪轨迹 {track['label']}，出现在 {track['start_time']:.2f}–{track['end_time']:.2f} 秒"
+                          + ("，标记圆圈随球员移动" if clip and clip_mode == "highlight" else ""))
 
         # 传二进制视频
-        response = gemini_model.generate_content(
-            contents=[
-                {"role": "user", "parts": [
-                    {"text": user_text},
-                    {"inline_data": {"mime_type": "video/mp4", "data": video_bytes}}
-                ]}
-            ]
-        )
+        job_stage(job, "generate")
+        with backend_limits["gemini"].slot(), span("generate"):
+            response = remote_calls["gemini"].call(
+                gemini_model.generate_content,
+                contents=[
+                    {"role": "user", "parts": [
+                        {"text": user_text},
+                        {"inline_data": {"mime_type": "video/mp4", "data": video_bytes}}
+                    ]}
+                ]
+            )
 
         analysis_result = response.text if hasattr(response, "text") else str(response)
 
-        analysis_filename = f"{timestamp}_analysis.txt"
-        analysis_path = os.path.join(TEMP_FOLDER, analysis_filename)
-        with open(analysis_path, "w", encoding="utf-8") as f:
-            f.write(analysis_result)
-
-        supabase_path = f"gemini_analysis/{analysis_filename}"
-        try:
-            analysis_url = upload_to_supabase(analysis_path, supabase_path)
-        except Exception as e:
-            print(f"上传分析结果失败: {e}")
-            analysis_url = None
+        job_stage(job, "upload")
+        artifact = publish_artifact(f"gemini_analysis/{timestamp}_{new_artifact_id()}_analysis.txt",
+                                    analysis_result.encode("utf-8"), "text/plain; charset=utf-8")
 
         result = {
             "success": True,
+            "video_id": video_session.video_id,
             "analysis": analysis_result,
+            "analysis_url": artifact["url"],
+            "analysis_local_url": artifact["local_url"],
             "timestamp": timestamp
         }
-        if analysis_url:
-            result["analysis_url"] = analysis_url
+        if clip:
+            result["clip"] = clip.to_dict()
+        if track:
+            result["track_id"] = track["track_id"]
 
-        return jsonify(result)
+        return result
 
+    except (JobCancelled, Overloaded):
+        raise
     except Exception as e:
-        print(f"Gemini AI分析过程中出错: {e}")
-        return jsonify({"error": f"分析失败: {str(e)}", "success": False}), 500
+        logger.exception(f"Gemini AI分析过程中出错: {e}")
+        raise AnalysisError(f"分析失败: {str(e)}", getattr(e, "status", 500))
 
     finally:
-        cleanup_file(temp_input_path)
-        if 'analysis_path' in locals():
-            cleanup_file(analysis_path)
+        if clip_path:
+            scratch.discard(clip_path)
 
+@app.route("/analyze_with_gemini", methods=["POST"])
+@admitted
+def analyze_with_gemini():
+    """使用Gemini AI分析视频中特定时间点的特定球员"""
+    try:
+        time_in_seconds, player_coordinates, prompt = parse_gemini_params(request.form)
+        clip_mode = parse_clip_mode(request.form)
+        use_cache = parse_use_cache(request.form)
 
-# @app.route("/health")
-# def health_check():
-#     """健康检查端点"""
-#     return jsonify({
-#         "status": "healthy", 
-#         "temp_folder": TEMP_FOLDER,
-#         "gemini_enabled": True
-#     })
+        video_session, error = resolve_video()
+        if error:
+            return error
+        track = resolve_track(request.form, video_session)
+        if track:
+            player_coordinates = track_center_at(track, time_in_seconds)
+
+        return jsonify(run_gemini_analysis(video_session, time_in_seconds, player_coordinates, prompt,
+                                           clip_mode=clip_mode, track=track, use_cache=use_cache))
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+
+def job_response(job, status=200):
+    """任务状态响应"""
+    data = job.to_dict()
+    data["success"] = job.status != FAILED
+    data["status_url"] = f"/jobs/{job.job_id}"
+    return respond(data, status)
+
+def submit_job(kind, fn, *args, video=None):
+    """提交后台任务，队列已满时返回 429；video 在任务结束前保持固定，不会被临时存储淘汰"""
+    def run(job, *run_args):
+        STAGE_SECONDS.observe(time.time() - job.created_at, stage="queue_wait")
+        return fn(job, *run_args)
+
+    if video is not None and not video_store.acquire(video):
+        return jsonify({"error": "视频不存在或已过期，请重新上传", "success": False}), 404
+    on_done = (lambda: video_store.release(video)) if video is not None else None
+    try:
+        job = job_manager.submit(kind, run, *args, on_done=on_done)
+    except QueueFullError as e:
+        if on_done is not None:
+            on_done()
+        response = jsonify({"error": str(e), "success": False})
+        response.headers["Retry-After"] = "5"
+        return response, 429
+    logger.info(f"已提交后台任务: {job.kind} {job.job_id}")
+    return job_response(job, 202)
+
+@app.route("/jobs/gemini", methods=["POST"])
+def submit_gemini_job():
+    """提交Gemini分析任务，立即返回任务ID；参数与 /analyze_with_gemini 相同"""
+    try:
+        time_in_seconds, player_coordinates, prompt = parse_gemini_params(request.form)
+        clip_mode = parse_clip_mode(request.form)
+        use_cache = parse_use_cache(request.form)
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+
+    video_session, error = resolve_video()
+    if error:
+        return error
+    try:
+        track = resolve_track(request.form, video_session)
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+    if track:
+        player_coordinates = track_center_at(track, time_in_seconds)
+
+    def run(job):
+        return run_gemini_analysis(video_session, time_in_seconds, player_coordinates, prompt,
+                                   clip_mode=clip_mode, job=job, track=track, use_cache=use_cache)
+    return submit_job("gemini", run, video=video_session)
+
+@app.route("/jobs/frame", methods=["POST"])
+def submit_frame_job():
+    """提交单帧分析任务，立即返回任务ID；参数与 /analyze_frame 相同"""
+    try:
+        check_frame_analysis_config()
+        renditions = parse_renditions_param(request.form)
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+
+    video_session, error = resolve_video()
+    if error:
+        return error
+
+    time_in_seconds = request.form.get("time_in_seconds")
+
+    def run(job):
+        return run_frame_analysis(video_session, time_in_seconds, job=job, renditions=renditions)
+    return submit_job("frame", run, video=video_session)
+
+@app.route("/jobs/track", methods=["POST"])
+def submit_track_job():
+    """提交球员跟踪任务，立即返回任务ID；参数与 /track_players 相同"""
+    try:
+        check_frame_analysis_config()
+        params = parse_tracking_params(request.form)
+    except AnalysisError as e:
+        return jsonify({"error": str(e), "success": False}), e.status
+
+    video_session, error = resolve_video()
+    if error:
+        return error
+
+    def run(job):
+        return run_tracking(video_session, *params, job=job)
+    return submit_job("track", run, video=video_session)
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """轮询任务状态；客户端需定期轮询，否则任务会被视为无人等待而取消"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在或已过期", "success": False}), 404
+    return job_response(job)
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+def cancel_job(job_id):
+    """取消任务"""
+    if not job_manager.cancel(job_id):
+        return jsonify({"error": "任务不存在或已结束", "success": False}), 404
+    return job_response(job_manager.get(job_id))
+
+@app.route("/jobs/<job_id>/events", methods=["GET"])
+def stream_job(job_id):
+    """以 Server-Sent Events 推送任务状态，直到任务结束"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({"error": "任务不存在或已过期", "success": False}), 404
+
+    def events():
+        version = -1
+        while True:
+            # 连接保持期间持续刷新 last_seen；客户端断开后不再刷新，任务随后被取消
+            job_manager.get(job_id)
+            if job.version != version:
+                version = job.version
+                yield f"event: status\ndata: {app.json.dumps(job.to_dict(), ensure_ascii=False)}\n\n"
+                if job.status in FINISHED_STATES:
+                    return
+            else:
+                yield ": keep-alive\n\n"
+            job_manager.wait_for_change(job, version, timeout=JOB_STREAM_HEARTBEAT)
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+# 缓存、队列等状态在抓取 /metrics 时读取
+DETECTOR_FRAMES = REGISTRY.counter("detector_frames_total", "实际送入检测后端的帧数", ("backend",))
+REGISTRY.gauge_callback("video_sessions", "视频会话数", lambda: video_store.stats()["sessions"])
+REGISTRY.gauge_callback("video_sessions_bytes", "视频会话占用字节数", lambda: video_store.stats()["bytes"])
+REGISTRY.gauge_callback("chunked_uploads", "进行中的分片上传数", lambda: chunked_uploads.stats()["uploads"])
+
+def detection_cache_lookups():
+    stats = detection_cache.stats()
+    return {("memory_hit",): stats["memory_hits"], ("disk_hit",): stats["disk_hits"], ("miss",): stats["misses"]}
+
+REGISTRY.counter_callback("detection_cache_lookups_total", "检测缓存查询次数", detection_cache_lookups, ("result",))
+REGISTRY.gauge_callback(
+    "detection_cache_bytes", "检测缓存占用字节数",
+    lambda: {(tier,): detection_cache.stats()[f"{tier}_bytes"] for tier in ("memory", "disk")},
+    ("tier",))
+def gemini_cache_lookups():
+    stats = gemini_cache.stats()
+    return {("hit",): stats["hits"], ("miss",): stats["misses"], ("coalesced",): stats["coalesced"]}
+
+REGISTRY.counter_callback("gemini_cache_lookups_total", "Gemini 响应缓存查询次数", gemini_cache_lookups, ("result",))
+REGISTRY.gauge_callback("gemini_cache_bytes", "Gemini 响应缓存占用字节数", lambda: gemini_cache.stats()["bytes"])
+REGISTRY.gauge_callback(
+    "jobs", "各状态的后台任务数",
+    lambda: {(state,): count for state, count in job_manager.stats().items()
+             if state not in ("workers", "max_queue")},
+    ("status",))
+REGISTRY.gauge_callback("artifact_uploads_pending", "等待上传的产物数", lambda: artifact_uploader.stats()["pending"])
+REGISTRY.gauge_callback("artifact_uploads_pending_bytes", "等待上传的产物字节数",
+                        lambda: artifact_uploader.stats()["pending_bytes"])
+REGISTRY.counter_callback(
+    "artifact_uploads_total", "产物上传结果",
+    lambda: {(result,): artifact_uploader.stats()[result] for result in ("uploaded", "failed", "retried")},
+    ("result",))
+
+def limiter_stats():
+    return {"analysis": admission.stats(), **{name: limiter.stats() for name, limiter in backend_limits.items()}}
+
+REGISTRY.gauge_callback("concurrency_active", "各后端进行中的调用数",
+                        lambda: {(name,): stats["active"] for name, stats in limiter_stats().items()}, ("limiter",))
+REGISTRY.gauge_callback("concurrency_waiting", "各后端排队等待的调用数",
+                        lambda: {(name,): stats["waiting"] for name, stats in limiter_stats().items()}, ("limiter",))
+REGISTRY.counter_callback("concurrency_rejected_total", "因并发已满被拒绝的调用数",
+                          lambda: {(name,): stats["rejected"] for name, stats in limiter_stats().items()},
+                          ("limiter",))
+BREAKER_STATES = {"closed": 0, "half_open": 1, "open": 2}
+REGISTRY.gauge_callback("circuit_breaker_state", "熔断器状态（0 关闭，1 半开，2 打开）",
+                        lambda: {(name,): BREAKER_STATES[call.breaker.state] for name, call in remote_calls.items()},
+                        ("backend",))
+for _stat, _help in (("timeouts", "超时"), ("retried", "重试"), ("hedged", "对冲"), ("failures", "最终失败")):
+    REGISTRY.counter_callback(f"remote_call_{_stat}_total", f"远程调用{_help}次数",
+                              lambda stat=_stat: {(name,): call.stats()[stat] for name, call in remote_calls.items()},
+                              ("backend",))
+REGISTRY.gauge_callback("cpu_pool_pending", "CPU 线程池中排队和执行中的任务数", lambda: cpu_pool.stats()["pending"])
+
+REGISTRY.gauge_callback("scratch_bytes", "临时存储各类文件占用字节数",
+                        lambda: {(kind,): v["bytes"] for kind, v in scratch.stats()["kinds"].items()}, ("kind",))
+REGISTRY.gauge_callback("scratch_files", "临时存储各类文件数",
+                        lambda: {(kind,): v["files"] for kind, v in scratch.stats()["kinds"].items()}, ("kind",))
+REGISTRY.gauge_callback("scratch_max_bytes", "临时存储字节数配额", lambda: scratch.max_bytes)
+REGISTRY.counter_callback("scratch_evictions_total", "临时存储淘汰的文件数", lambda: scratch.stats()["evictions"])
+REGISTRY.counter_callback("scratch_rejections_total", "临时存储空间不足被拒绝的写入数",
+                          lambda: scratch.stats()["rejections"])
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus 抓取端点"""
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/artifacts/<path:name>", methods=["GET"])
+def get_artifact(name):
+    """访问分析产物：上传未完成时直接返回内存中的内容，完成后转到存储地址"""
+    pending = artifact_uploader.get_local(name)
+    if pending:
+        data, content_type = pending
+        return Response(data, mimetype=content_type, headers={"Cache-Control": "no-store"})
+    if isinstance(artifact_storage, LocalStorage):
+        try:
+            scratch.touch(artifact_storage.local_path(name))
+        except ValueError:
+            return jsonify({"error": "产物不存在", "success": False}), 404
+        return send_from_directory(artifact_storage.root, name)
+    return redirect(artifact_storage.public_url(name))
+
+
+@app.route("/scratch", methods=["GET"])
+def scratch_usage():
+    """临时存储用量：总量与配额、各类文件占用、被固定的字节数、淘汰次数和磁盘剩余空间"""
+    result = scratch.stats()
+    result["success"] = True
+    return jsonify(result)
+
+@app.route("/ready")
+def readiness_check():
+    """就绪检查：必需的外部服务全部初始化完成时返回 200，否则 503（进程存活请用 /health）"""
+    ready = services.ready()
+    return jsonify({"ready": ready, "services": services.status()}), 200 if ready else 503
 
-# 应用关闭时清理临时文件夹
-import atexit
 def cleanup_temp_folder():
-    """应用关闭时清理临时文件夹"""
+    """应用关闭时删除本进程登记的视频和中间文件；检测缓存、本地产物和未完成的分片上传保留"""
     try:
-        shutil.rmtree(TEMP_FOLDER, ignore_errors=True)
-        print(f"已清理临时文件夹: {TEMP_FOLDER}")
+        removed = scratch.cleanup(keep=("artifact", "upload"))
+        logger.info(f"已清理临时文件: {removed} 个 ({TEMP_FOLDER})")
     except Exception as e:
-        print(f"清理临时文件夹时出错: {e}")
+        logger.warning(f"清理临时文件夹时出错: {e}")
 
 atexit.register(cleanup_temp_folder)
 
@@ -549,9 +1399,21 @@ def health_check():
     return jsonify({
         "status": "healthy", 
         "temp_folder": TEMP_FOLDER,
+        "video_sessions": video_store.stats(),
+        "scratch": {k: v for k, v in scratch.stats().items() if k not in ("root", "kinds")},
+        "chunked_uploads": chunked_uploads.stats(),
+        "detection_cache": detection_cache.stats(),
+        "gemini_cache": gemini_cache.stats(),
+        "jobs": job_manager.stats(),
+        "tracking": track_store.stats(),
+        "artifact_uploads": artifact_uploader.stats(),
+        "concurrency": {"cpu_pool": cpu_pool.stats(), **limiter_stats()},
+        "remote_calls": {name: call.stats() for name, call in remote_calls.items()},
         "gemini_enabled": bool(GEMINI_API_KEY),
         "roboflow_enabled": bool(API_KEY),
-        "supabase_enabled": bool(supabase),
+        "detector": services.peek("detector").describe() if services.peek("detector") else None,
+        "supabase_enabled": services.state("supabase") == READY,
+        "services": services.status(),
         "platform": "Railway"
     })
 
@@ -0,0 +1,410 @@
+"""离线批量检测：对整个目录（或通配符匹配）的比赛视频按采样帧率检测，结果写入列式文件
+
+视频按时间切成若干段，分发到进程池中并行处理；每段完成后立即写入分段文件，
+一个视频的所有分段完成后合并为 <输出目录>/<视频名>-<指纹>.npz（或 .parquet）并删除分段。
+中断后用相同参数重新运行即可从已完成的分段继续。
+
+检测后端与服务端使用相同的环境变量（DETECTOR_BACKEND、ROBOFLOW_API_KEY、DETECTOR_MODEL_PATH、
+DETECTION_MODE、TILE_* 等），也可以用命令行参数覆盖。
+
+用法: python batch.py VIDEO_DIR_OR_GLOB [...] -o OUTPUT_DIR [--fps 2 --workers 4 --format npz|parquet
+                                                              --chunk-seconds 120 --annotate-every 0]
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+import importlib.util
+from dataclasses import dataclass, asdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+
+from annotation import draw_detections
+from detections import Detections, DETECTION_DTYPE
+from detectors import load_detector, DEFAULT_MODEL_ID, DEFAULT_MODEL_VERSION
+from frame_reader import FrameReader
+from metrics import setup_logging
+from renditions import Rendition, encode_image
+from tiling import TiledDetector
+
+logger = logging.getLogger("batch")
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".mkv", ".avi", ".m4v", ".webm")
+MANIFEST = "batch.json"
+# 每行一个检测框；sampled_* 为所有采样帧（包括没有检测到目标的帧）
+DETECTION_COLUMNS = ("frame_index", "time", "x", "y", "width", "height", "confidence")
+
+
+@dataclass
+class Video:
+    path: str
+    key: str
+    fps: float
+    total_frames: int
+    duration: float
+
+
+@dataclass
+class Chunk:
+    """一个视频中采样序号 [first, last) 的一段"""
+    video: Video
+    index: int
+    first: int
+    last: int
+    sample_fps: float
+
+    @property
+    def part_path(self) -> str:
+        return f"{self.index:05d}.npz"
+
+    @property
+    def timestamps(self):
+        return np.arange(self.first, self.last) / self.sample_fps
+
+
+def discover_videos(inputs):
+    """展开目录（递归）、通配符和文件路径，返回去重排序后的视频文件列表"""
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            for dirpath, _, filenames in os.walk(item):
+                paths.update(os.path.join(dirpath, name) for name in filenames
+                             if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            paths.update(path for path in glob.glob(item, recursive=True)
+                         if os.path.isfile(path) and path.lower().endswith(VIDEO_EXTENSIONS))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def video_key(path: str) -> str:
+    """输出文件名：视频名 + 路径、大小和修改时间的指纹，同名视频不会冲突，文件被替换后重新处理"""
+    stat = os.stat(path)
+    fingerprint = hashlib.sha1(f"{os.path.abspath(path)}|{stat.st_size}|{stat.st_mtime_ns}".encode()).hexdigest()
+    return f"{os.path.splitext(os.path.basename(path))[0]}-{fingerprint[:10]}"
+
+
+def probe_video(path: str):
+    try:
+        with FrameReader(path) as reader:
+            info = reader.info
+    except IOError as e:
+        logger.warning(f"跳过无法打开的视频 {path}: {e}")
+        return None
+    if info["fps"] <= 0 or info["total_frames"] <= 0:
+        logger.warning(f"跳过无法获取帧率/帧数的视频 {path}")
+        return None
+    return Video(path, video_key(path), info["fps"], info["total_frames"], info["duration"])
+
+
+def plan_chunks(video: Video, sample_fps: float, chunk_seconds: float):
+    """第 i 个采样点位于 i / sample_fps 秒，按 chunk_seconds 切段"""
+    samples = int(np.floor(video.duration * sample_fps - 1e-9)) + 1
+    per_chunk = max(1, int(round(chunk_seconds * sample_fps)))
+    return [Chunk(video, i, first, min(first + per_chunk, samples), sample_fps)
+            for i, first in enumerate(range(0, samples, per_chunk))]
+
+
+def detector_options(args) -> dict:
+    return {
+        "backend": args.backend,
+        "api_key": os.getenv("ROBOFLOW_API_KEY"),
+        "model_id": args.model_id,
+        "model_version": args.model_version,
+        "model_path": args.model_path,
+        "class_names": args.classes.split(",") if args.classes else None,
+        "input_size": args.input_size,
+        "confidence": args.confidence,
+        "overlap": args.overlap,
+        "concurrency": args.detect_concurrency,
+        "mode": args.mode,
+        "tile": args.tile_size,
+        "coarse_width": args.tile_coarse_width,
+        "max_tiles": args.tile_max_tiles,
+    }
+
+
+def build_detector(options: dict):
+    """与服务端 init_detector / wrap_detector 相同的检测后端"""
+    options = dict(options)
+    mode = options.pop("mode")
+    tiling = {k: options.pop(k) for k in ("tile", "coarse_width", "max_tiles")}
+    detector = load_detector(**options)
+    if mode == "tiled":
+        detector = TiledDetector(detector, **tiling)
+    return detector
+
+
+# 工作进程内的状态：检测后端只在进程启动时加载一次
+_worker = {}
+
+
+def init_worker(options: dict, output: str, batch_size: int, annotate_every: int, annotate_width: int):
+    # 每个进程处理一个分段，OpenCV 内部不再开多线程，避免与进程池争抢核心
+    cv2.setNumThreads(1)
+    _worker.update(detector=build_detector(options), output=output, batch_size=batch_size,
+                   annotate_every=annotate_every,
+                   rendition=Rendition("annotated", annotate_width, "jpeg", 85))
+
+
+def write_atomic(path: str, write):
+    """先写临时文件再改名，中断时不会留下不完整的分段/结果文件"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def process_chunk(chunk: Chunk) -> dict:
+    """读取一段的采样帧、批量检测，写入分段文件；在工作进程中执行"""
+    detector = _worker["detector"]
+    batch_size = _worker["batch_size"]
+    start = time.perf_counter()
+
+    frame_index, frame_time, frames = [], [], []
+    annotated_dir = os.path.join(_worker["output"], "annotated", chunk.video.key)
+
+    def flush(batch):
+        for sample, result in zip(batch, detector.predict([sample.frame for sample in batch])):
+            detections = Detections.from_result(result)
+            frame_index.append(sample.frame_index)
+            frame_time.append(sample.actual_time)
+            frames.append(detections)
+            every = _worker["annotate_every"]
+            if every and (chunk.first + len(frame_index) - 1) % every == 0:
+                annotated, _ = draw_detections(sample.frame, detections)
+                image = encode_image(annotated, _worker["rendition"])
+                os.makedirs(annotated_dir, exist_ok=True)
+                write_atomic(os.path.join(annotated_dir, f"{sample.frame_index:07d}.jpg"),
+                             lambda f: f.write(image.data))
+
+    with FrameReader(chunk.video.path) as reader:
+        batch = []
+        for sample in reader.iter_frames(chunk.timestamps):
+            batch.append(sample)
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+
+    # 各帧的检测数组直接拼接为列
+    counts = [len(detections) for detections in frames]
+    boxes = np.concatenate([detections.array for detections in frames]) if frames else np.zeros(0, DETECTION_DTYPE)
+    classes = np.concatenate([detections.names() for detections in frames]) if frames else np.zeros(0, object)
+    columns = {
+        "frame_index": np.repeat(np.asarray(frame_index, dtype=np.int32), counts),
+        "time": np.repeat(np.asarray(frame_time, dtype=np.float32), counts),
+        "x": (boxes["x1"] + boxes["x2"]) / 2,
+        "y": (boxes["y1"] + boxes["y2"]) / 2,
+        "width": boxes["x2"] - boxes["x1"],
+        "height": boxes["y2"] - boxes["y1"],
+        "confidence": boxes["confidence"],
+        "class": classes.astype(np.str_),
+        "sampled_frame_index": np.asarray(frame_index, dtype=np.int32),
+        "sampled_time": np.asarray(frame_time, dtype=np.float32),
+    }
+    parts_dir = os.path.join(_worker["output"], "parts", chunk.video.key)
+    os.makedirs(parts_dir, exist_ok=True)
+    write_atomic(os.path.join(parts_dir, chunk.part_path), lambda f: np.savez(f, **columns))
+    return {"frames": len(frame_index), "detections": len(classes), "seconds": time.perf_counter() - start}
+
+
+def merge_parts(parts):
+    """合并分段，类别名转为 classes 表 + class_id 编码"""
+    merged = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+    classes, class_id = np.unique(merged.pop("class"), return_inverse=True)
+    merged["class_id"] = class_id.astype(np.int16)
+    merged["classes"] = classes
+    return merged
+
+
+def write_npz(path: str, columns: dict, meta: dict):
+    write_atomic(path, lambda f: np.savez_compressed(f, meta=np.array(json.dumps(meta)), **columns))
+
+
+def write_parquet(path: str, columns: dict, meta: dict):
+    """检测框一行一条写入 Parquet，类别为字典编码列；采样帧列表写入 <名称>.frames.parquet"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    classes = pa.array(columns["classes"].tolist(), type=pa.string())
+    table = pa.table({
+        **{name: columns[name] for name in DETECTION_COLUMNS},
+        "class": pa.DictionaryArray.from_arrays(pa.array(columns["class_id"], type=pa.int16()), classes),
+    }).replace_schema_metadata({"batch": json.dumps(meta)})
+    frames = pa.table({"frame_index": columns["sampled_frame_index"], "time": columns["sampled_time"]})
+    write_atomic(path, lambda f: pq.write_table(table, f, compression="zstd"))
+    write_atomic(path[:-len(".parquet")] + ".frames.parquet", lambda f: pq.write_table(frames, f))
+
+
+WRITERS = {"npz": write_npz, "parquet": write_parquet}
+
+
+def finish_video(output: str, video: Video, chunks, fmt: str, meta: dict) -> str:
+    parts_dir = os.path.join(output, "parts", video.key)
+    parts = []
+    for chunk in chunks:
+        with np.load(os.path.join(parts_dir, chunk.part_path)) as data:
+            parts.append({name: data[name] for name in data.files})
+    columns = merge_parts(parts)
+    path = os.path.join(output, f"{video.key}.{fmt}")
+    WRITERS[fmt](path, columns, {**meta, "video": asdict(video), "frames": int(len(columns["sampled_frame_index"]))})
+    shutil.rmtree(parts_dir, ignore_errors=True)
+    try:
+        os.rmdir(os.path.dirname(parts_dir))  # 所有视频都已合并
+    except OSError:
+        pass
+    return path
+
+
+def load_manifest(output: str, config: dict, restart: bool):
+    """检查输出目录中上次运行的参数；参数不同时不能续跑，避免把两种结果混在一起"""
+    path = os.path.join(output, MANIFEST)
+    if os.path.exists(path) and not restart:
+        with open(path) as f:
+            previous = json.load(f)
+        if previous != config:
+            changed = sorted(k for k in set(previous) | set(config) if previous.get(k) != config.get(k))
+            raise SystemExit(f"输出目录 {output} 中已有参数不同的结果（{', '.join(changed)}），"
+                             f"换一个输出目录或加 --restart 重新开始")
+    if restart:
+        shutil.rmtree(os.path.join(output, "parts"), ignore_errors=True)
+    write_atomic(path, lambda f: f.write(json.dumps(config, indent=2).encode("utf-8")))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="离线批量检测比赛视频，结果写入 NPZ / Parquet")
+    parser.add_argument("inputs", nargs="+", help="视频文件、目录（递归查找）或通配符")
+    parser.add_argument("-o", "--output", required=True, help="输出目录（同时保存断点）")
+    parser.add_argument("--fps", type=float, default=1.0, help="采样帧率（每秒检测几帧）")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="npz")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="进程数")
+    parser.add_argument("--chunk-seconds", type=float, default=120, help="每个任务处理的视频时长")
+    parser.add_argument("--batch-size", type=int, default=8, help="每次送入检测后端的帧数")
+    parser.add_argument("--annotate-every", type=int, default=0,
+                        help="每 N 个采样帧保存一张标注图到 annotated/（0 表示不保存）")
+    parser.add_argument("--annotate-width", type=int, default=1280)
+    parser.add_argument("--restart", action="store_true", help="忽略已有的结果和断点，全部重新处理")
+    parser.add_argument("--backend", default=os.getenv("DETECTOR_BACKEND", "roboflow").lower())
+    parser.add_argument("--model-id", default=DEFAULT_MODEL_ID)
+    parser.add_argument("--model-version", type=int, default=DEFAULT_MODEL_VERSION)
+    parser.add_argument("--model-path", default=os.getenv("DETECTOR_MODEL_PATH"))
+    parser.add_argument("--classes", default=os.getenv("DETECTOR_CLASSES"))
+    parser.add_argument("--input-size", type=int, default=int(os.getenv("DETECTOR_INPUT_SIZE", 640)))
+    parser.add_argument("--confidence", type=float, default=40)
+    parser.add_argument("--overlap", type=float, default=30)
+    parser.add_argument("--detect-concurrency", type=int, default=int(os.getenv("DETECTION_CONCURRENCY", 4)),
+                        help="Roboflow 每个进程的并发请求数")
+    parser.add_argument("--mode", choices=("full", "tiled"), default=os.getenv("DETECTION_MODE", "full").lower())
+    parser.add_argument("--tile-size", type=int, default=int(os.getenv("TILE_SIZE", 480)))
+    parser.add_argument("--tile-coarse-width", type=int, default=int(os.getenv("TILE_COARSE_WIDTH", 960)))
+    parser.add_argument("--tile-max-tiles", type=int, default=int(os.getenv("TILE_MAX_TILES", 3)))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "INFO"))
+    args = parser.parse_args(argv)
+    if args.fps <= 0 or args.chunk_seconds <= 0 or args.batch_size <= 0 or args.workers <= 0:
+        parser.error("--fps、--chunk-seconds、--batch-size、--workers 必须为正数")
+    if args.backend == "roboflow" and not os.getenv("ROBOFLOW_API_KEY"):
+        parser.error("roboflow 后端需要设置 ROBOFLOW_API_KEY")
+    if args.backend != "roboflow" and not args.model_path:
+        parser.error(f"{args.backend} 后端需要 --model-path 或 DETECTOR_MODEL_PATH")
+    if args.format == "parquet":
+        if importlib.util.find_spec("pyarrow") is None:
+            parser.error("Parquet 输出需要安装 pyarrow")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    setup_logging(args.log_level)
+    os.makedirs(args.output, exist_ok=True)
+
+    options = detector_options(args)
+    # 决定结果内容的参数；续跑时必须与上次一致
+    config = {k: v for k, v in options.items() if k not in ("api_key", "concurrency")}
+    config.update(fps=args.fps, chunk_seconds=args.chunk_seconds, format=args.format)
+    load_manifest(args.output, config, args.restart)
+
+    videos = [video for video in map(probe_video, discover_videos(args.inputs)) if video is not None]
+    if not videos:
+        logger.error("没有找到可处理的视频")
+        return 1
+
+    # 已合并的视频整段跳过，已写入的分段逐个跳过
+    pending, done_videos = {}, 0
+    for video in videos:
+        if not args.restart and os.path.exists(os.path.join(args.output, f"{video.key}.{args.format}")):
+            done_videos += 1
+            continue
+        chunks = plan_chunks(video, args.fps, args.chunk_seconds)
+        parts_dir = os.path.join(args.output, "parts", video.key)
+        remaining = [c for c in chunks if not os.path.exists(os.path.join(parts_dir, c.part_path))]
+        pending[video.key] = (video, chunks, remaining)
+    tasks = [chunk for _, _, remaining in pending.values() for chunk in remaining]
+    logger.info(f"共 {len(videos)} 个视频：{done_videos} 个已完成，{len(pending)} 个待处理，"
+                f"{len(tasks)} 个分段，{args.workers} 个进程")
+
+    summary = {"videos": len(videos), "skipped_videos": done_videos, "chunks": len(tasks),
+               "frames": 0, "detections": 0, "failed_chunks": 0, "outputs": []}
+    meta = dict(config)
+    start = time.perf_counter()
+
+    def finish_ready():
+        for key in list(pending):
+            video, chunks, remaining = pending[key]
+            if not remaining:
+                path = finish_video(args.output, video, chunks, args.format, meta)
+                summary["outputs"].append(path)
+                logger.info(f"已完成 {video.path} → {path}")
+                del pending[key]
+
+    finish_ready()  # 上次中断时所有分段已完成、但尚未合并的视频
+    executor = ProcessPoolExecutor(
+        max_workers=args.workers, initializer=init_worker,
+        initargs=(options, args.output, args.batch_size, args.annotate_every, args.annotate_width),
+    )
+    try:
+        futures = {executor.submit(process_chunk, chunk): chunk for chunk in tasks}
+        for n, future in enumerate(as_completed(futures), 1):
+            chunk = futures[future]
+            video, _, remaining = pending[chunk.video.key]
+            try:
+                result = future.result()
+            except Exception as e:
+                summary["failed_chunks"] += 1
+                logger.error(f"[{n}/{len(tasks)}] {video.key} 第 {chunk.index} 段失败: {e}")
+                continue
+            remaining.remove(chunk)
+            summary["frames"] += result["frames"]
+            summary["detections"] += result["detections"]
+            logger.info(f"[{n}/{len(tasks)}] {video.key} "
+                        f"{chunk.first / chunk.sample_fps:.0f}–{chunk.last / chunk.sample_fps:.0f}s: "
+                        f"{result['frames']} 帧, {result['detections']} 个目标, "
+                        f"{result['frames'] / max(result['seconds'], 1e-9):.1f} 帧/秒")
+            finish_ready()
+    except KeyboardInterrupt:
+        logger.warning("已中断：完成的分段已保存，用相同参数重新运行即可继续")
+        executor.shutdown(wait=False, cancel_futures=True)
+        return 130
+    executor.shutdown()
+
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if summary["failed_chunks"]:
+        logger.error(f"{summary['failed_chunks']} 个分段失败，重新运行相同命令可重试")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
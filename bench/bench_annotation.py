@@ -0,0 +1,222 @@
+"""标注绘制的微基准：对比重构前的整帧混合实现与 annotation 模块的局部混合/批量绘制实现
+
+用法: python bench/bench_annotation.py [--width 3840 --height 2160 --players 22 --balls 1 --repeat 20]
+"""
+import os
+import sys
+import time
+import json
+import argparse
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from annotation import draw_detections  # noqa: E402
+from detections import Detections  # noqa: E402
+
+
+def legacy_draw_detections(frame, predictions):
+    """重构前的实现（光晕每圈整帧复制并混合、角标记逐条 cv2.line），仅用于对比"""
+    h, w = frame.shape[:2]
+
+    # 创建带有标注的图像
+    annotated_frame = frame.copy()
+
+    # 存储检测到的球员信息，用于前端交互
+    players_data = []
+
+    for pred in predictions:
+        # 获取边界框坐标
+        x = pred['x']
+        y = pred['y']
+        width = pred['width']
+        height = pred['height']
+
+        # 计算边界框的左上角和右下角坐标
+        x1 = int(x - width/2)
+        y1 = int(y - height/2)
+        x2 = int(x + width/2)
+        y2 = int(y + height/2)
+
+        # 确保坐标在图像范围内
+        x1 = max(0, x1)
+        y1 = max(0, y1)
+        x2 = min(w, x2)
+        y2 = min(h, y2)
+
+        # 根据类别选择颜色
+        if pred['class'] == 'ball':
+            # 球的特殊标记 - 使用渐变光晕效果
+            center = (int(x), int(y))
+
+            # 1. 绘制外部光晕效果
+            for r in range(20, 10, -1):
+                alpha = (20 - r) / 10  # 渐变透明度
+                color = (0, int(255 * alpha), int(255 * alpha))  # 渐变黄色
+                overlay = annotated_frame.copy()
+                cv2.circle(overlay, center, r, color, 2)
+                cv2.addWeighted(overlay, 0.3, annotated_frame, 0.7, 0, annotated_frame)
+
+            # 2. 绘制主圆圈 - 明亮的黄色
+            cv2.circle(annotated_frame, center, 12, (0, 255, 255), 2)
+
+            # 3. 绘制内部圆圈 - 白色高光
+            cv2.circle(annotated_frame, center, 8, (255, 255, 255), -1)
+
+            # 4. 绘制中心点 - 黄色
+            cv2.circle(annotated_frame, center, 4, (0, 200, 255), -1)
+
+        elif pred['class'] == 'referee':
+            # 裁判员使用轻量级角标记设计 - 与球员相同但颜色为紫色
+            # 使用鲜艳紫色作为主色调
+            corner_color = (255, 0, 255)  # 鲜艳紫色/品红色
+
+            # 只添加角标记 - 不绘制填充矩形和完整边框
+            corner_length = min(20, (x2-x1)//3, (y2-y1)//3)  # 角标记长度
+            thickness = 2  # 角标记粗细
+
+            # 左上角
+            cv2.line(annotated_frame, (x1, y1), (x1 + corner_length, y1), corner_color, thickness)
+            cv2.line(annotated_frame, (x1, y1), (x1, y1 + corner_length), corner_color, thickness)
+
+            # 右上角
+            cv2.line(annotated_frame, (x2, y1), (x2 - corner_length, y1), corner_color, thickness)
+            cv2.line(annotated_frame, (x2, y1), (x2, y1 + corner_length), corner_color, thickness)
+
+            # 左下角
+            cv2.line(annotated_frame, (x1, y2), (x1 + corner_length, y2), corner_color, thickness)
+            cv2.line(annotated_frame, (x1, y2), (x1, y2 - corner_length), corner_color, thickness)
+
+            # 右下角
+            cv2.line(annotated_frame, (x2, y2), (x2 - corner_length, y2), corner_color, thickness)
+            cv2.line(annotated_frame, (x2, y2), (x2, y2 - corner_length), corner_color, thickness)
+
+        else:
+            # 球员使用轻量级角标记设计 - 不使用填充边界框
+            # 使用橙色作为主色调
+            corner_color = (255, 128, 0)  # 橙色
+
+            # 只添加角标记 - 不绘制填充矩形和完整边框
+            corner_length = min(20, (x2-x1)//3, (y2-y1)//3)  # 角标记长度
+            thickness = 2  # 角标记粗细
+
+            # 左上角
+            cv2.line(annotated_frame, (x1, y1), (x1 + corner_length, y1), corner_color, thickness)
+            cv2.line(annotated_frame, (x1, y1), (x1, y1 + corner_length), corner_color, thickness)
+
+            # 右上角
+            cv2.line(annotated_frame, (x2, y1), (x2 - corner_length, y1), corner_color, thickness)
+            cv2.line(annotated_frame, (x2, y1), (x2, y1 + corner_length), corner_color, thickness)
+
+            # 左下角
+            cv2.line(annotated_frame, (x1, y2), (x1 + corner_length, y2), corner_color, thickness)
+            cv2.line(annotated_frame, (x1, y2), (x1, y2 - corner_length), corner_color, thickness)
+
+            # 右下角
+            cv2.line(annotated_frame, (x2, y2), (x2 - corner_length, y2), corner_color, thickness)
+            cv2.line(annotated_frame, (x2, y2), (x2, y2 - corner_length), corner_color, thickness)
+
+            # 添加小型ID标签在边界框顶部
+            player_id = len(players_data) + 1
+            id_text = f"P{player_id}"
+            text_size = cv2.getTextSize(id_text, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)[0]
+            text_x = x1 + (x2 - x1 - text_size[0]) // 2  # 居中
+            text_y = y1 - 5  # 边界框上方
+
+            # 确保文本在图像内
+            if text_y < 15:
+                text_y = y1 + 15
+
+            # 绘制文本背景
+            cv2.rectangle(annotated_frame, 
+                         (text_x - 2, text_y - text_size[1] - 2),
+                         (text_x + text_size[0] + 2, text_y + 2),
+                         (0, 0, 0), -1)
+
+            # 绘制文本
+            cv2.putText(annotated_frame, id_text, (text_x, text_y), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+            # 存储球员信息用于前端交互
+            player_id = len(players_data) + 1  # 简单的ID分配
+            players_data.append({
+                "id": player_id,
+                "bbox": [x1, y1, x2, y2],
+                "center": [int(x), int(y)]
+            })
+
+    return annotated_frame, players_data
+
+
+def synthetic_predictions(width, height, players, balls, seed=0):
+    """生成随机分布、互不重叠概率较高的检测框"""
+    rng = np.random.default_rng(seed)
+    predictions = []
+    for i in range(players):
+        predictions.append({
+            "x": float(rng.uniform(50, width - 50)),
+            "y": float(rng.uniform(80, height - 80)),
+            "width": float(rng.uniform(30, 80)),
+            "height": float(rng.uniform(60, 160)),
+            "confidence": float(rng.uniform(0.5, 0.99)),
+            "class": "referee" if i % 11 == 10 else "player",
+        })
+    for _ in range(balls):
+        predictions.append({
+            "x": float(rng.uniform(30, width - 30)),
+            "y": float(rng.uniform(30, height - 30)),
+            "width": 12.0,
+            "height": 12.0,
+            "confidence": 0.6,
+            "class": "ball",
+        })
+    return predictions
+
+
+def time_it(fn, frame, predictions, repeat):
+    fn(frame, predictions)  # 预热
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(frame, predictions)
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--players", type=int, default=22)
+    parser.add_argument("--balls", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    frame = rng.integers(0, 256, size=(args.height, args.width, 3), dtype=np.uint8)
+    predictions = synthetic_predictions(args.width, args.height, args.players, args.balls)
+
+    legacy_image, legacy_players = legacy_draw_detections(frame, predictions)
+    detections = Detections.from_predictions(predictions)
+    image, players = draw_detections(frame, detections)
+    diff = np.abs(legacy_image.astype(np.int16) - image.astype(np.int16))
+
+    legacy_time = time_it(legacy_draw_detections, frame, predictions, args.repeat)
+    new_time = time_it(draw_detections, frame, detections, args.repeat)
+
+    print(json.dumps({
+        "resolution": f"{args.width}x{args.height}",
+        "players": args.players,
+        "balls": args.balls,
+        "legacy_ms": round(legacy_time * 1000, 3),
+        "annotation_ms": round(new_time * 1000, 3),
+        "speedup": round(legacy_time / new_time, 2) if new_time > 0 else None,
+        "max_pixel_diff": int(diff.max()),
+        "differing_pixels": int(np.count_nonzero(diff.any(axis=2))),
+        "players_data_equal": legacy_players == players,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
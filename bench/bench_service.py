@@ -0,0 +1,235 @@
+"""服务端到端基准：合成视频 + 本地替身服务，测量各接口在不同并发下的延迟分位数和吞吐量
+
+用法: python bench/bench_service.py [--resolutions 640x360,1280x720,1920x1080 --gops 12,50,250
+                                     --concurrency 1,4,8 --requests 16 --endpoints frame,frames,gemini,track
+                                     --roboflow-latency 0.15 --output bench/results/latest.json
+                                     --compare bench/results/baseline.json]
+
+不需要任何外部服务或凭据；结果写成 JSON，可用 --compare 与之前的结果对比。
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+import fakes  # noqa: E402
+from synthetic import ensure_videos  # noqa: E402
+
+# 黄金分割步长：请求时间点均匀散布在视频中，避免检测缓存把后续请求全部命中
+GOLDEN = 0.6180339887
+
+
+def parse_resolutions(value):
+    return [tuple(int(v) for v in item.split("x")) for item in value.split(",") if item]
+
+
+def parse_ints(value):
+    return [int(v) for v in value.split(",") if v]
+
+
+def request_time(i: int, duration: float) -> float:
+    return round(((i * GOLDEN) % 1.0) * max(duration - 0.5, 0.1), 3)
+
+
+def build_request(endpoint: str, i: int, video_id: str, duration: float):
+    """返回 (路径, 表单数据)"""
+    t = request_time(i, duration)
+    if endpoint == "frame":
+        return "/analyze_frame", {"video_id": video_id, "time_in_seconds": str(t)}
+    if endpoint == "frames":
+        times = [request_time(i * 8 + k, duration) for k in range(8)]
+        return "/analyze_frames", {"video_id": video_id, "timestamps": json.dumps(times)}
+    if endpoint == "gemini":
+        return "/analyze_with_gemini", {
+            "video_id": video_id, "time_in_seconds": str(t), "prompt": "分析该球员的跑位",
+            "player_coordinates": json.dumps({"x": 100 + i, "y": 100}),
+        }
+    if endpoint == "track":
+        start = min(t, max(duration - 3, 0))
+        return "/track_players", {"video_id": video_id, "start_time": str(start), "end_time": str(start + 3)}
+    raise ValueError(f"未知接口: {endpoint}")
+
+
+def stage_totals(metrics_module):
+    """当前各阶段累计 (耗时, 次数)"""
+    totals = {}
+    for name, _, labels, value in metrics_module.STAGE_SECONDS.samples():
+        if name.endswith("_sum"):
+            totals.setdefault(labels[0], [0.0, 0])[0] = value
+        elif name.endswith("_count"):
+            totals.setdefault(labels[0], [0.0, 0])[1] = value
+    return totals
+
+
+def stage_means(before, after):
+    """两次快照之间各阶段的平均耗时（毫秒）"""
+    result = {}
+    for stage, (total, count) in after.items():
+        prev_total, prev_count = before.get(stage, (0.0, 0))
+        if count > prev_count:
+            result[stage] = round((total - prev_total) / (count - prev_count) * 1000, 3)
+    return result
+
+
+def percentile(values, q):
+    return round(float(np.percentile(values, q)) * 1000, 3) if values else None
+
+
+def run_level(app_module, endpoint, video_id, duration, concurrency, total, offset):
+    """以固定并发发送 total 个请求，返回延迟统计"""
+    def one(i):
+        client = app_module.app.test_client()
+        path, form = build_request(endpoint, offset + i, video_id, duration)
+        start = time.perf_counter()
+        response = client.post(path, data=form)
+        return time.perf_counter() - start, response.status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+
+    latencies = [elapsed for elapsed, status in outcomes if status == 200]
+    errors = {}
+    for _, status in outcomes:
+        if status != 200:
+            errors[str(status)] = errors.get(str(status), 0) + 1
+    return {
+        "requests": total,
+        "ok": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": round(float(np.mean(latencies)) * 1000, 3) if latencies else None,
+        "max_ms": round(max(latencies) * 1000, 3) if latencies else None,
+        "throughput_rps": round(len(latencies) / wall, 3) if wall > 0 else None,
+        "wall_seconds": round(wall, 3),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=os.path.dirname(BENCH_DIR), text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline_path):
+    """按 (接口, 视频, 并发) 对比 p50/p99/吞吐量的变化百分比"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    index = {(r["endpoint"], r["video"], r["concurrency"]): r for r in baseline["results"]}
+    rows = []
+    for r in current["results"]:
+        old = index.get((r["endpoint"], r["video"], r["concurrency"]))
+        if not old:
+            continue
+        row = {"endpoint": r["endpoint"], "video": r["video"], "concurrency": r["concurrency"]}
+        for key in ("p50_ms", "p99_ms", "throughput_rps"):
+            if old.get(key) and r.get(key) is not None:
+                row[f"{key}_change"] = round((r[key] - old[key]) / old[key], 4)
+        rows.append(row)
+    return {"baseline": baseline_path, "baseline_commit": baseline.get("commit"), "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", type=parse_resolutions, default="640x360,1280x720,1920x1080")
+    parser.add_argument("--gops", type=parse_ints, default="12,50,250")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--concurrency", type=parse_ints, default="1,4,8")
+    parser.add_argument("--requests", type=int, default=16, help="每个并发级别的请求数")
+    parser.add_argument("--endpoints", default="frame,frames,gemini,track")
+    parser.add_argument("--roboflow-latency", type=float, default=0.15)
+    parser.add_argument("--roboflow-jitter", type=float, default=0.05)
+    parser.add_argument("--supabase-latency", type=float, default=0.08)
+    parser.add_argument("--supabase-bandwidth", type=float, default=50.0, help="Mbps")
+    parser.add_argument("--gemini-latency", type=float, default=1.5)
+    parser.add_argument("--gemini-bandwidth", type=float, default=20.0, help="Mbps")
+    parser.add_argument("--video-dir", default=os.path.join(BENCH_DIR, "videos"))
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "latest.json"))
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    # 外部服务凭据置空，app 导入时不会连接真实服务
+    for name in ("ROBOFLOW_API_KEY", "SUPABASE_URL", "SUPABASE_KEY", "GEMINI_API_KEY"):
+        os.environ[name] = ""
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["SERVICE_WARMUP"] = "lazy"
+    import app as app_module
+    import metrics
+
+    services = fakes.install(
+        app_module,
+        roboflow_latency=fakes.Latency(args.roboflow_latency, args.roboflow_jitter),
+        supabase_latency=fakes.Latency(args.supabase_latency),
+        gemini_latency=fakes.Latency(args.gemini_latency),
+        supabase_bandwidth_mbps=args.supabase_bandwidth,
+        gemini_bandwidth_mbps=args.gemini_bandwidth,
+    )
+
+    videos = ensure_videos(args.video_dir, args.resolutions, args.gops, seconds=args.seconds)
+    endpoints = [e for e in args.endpoints.split(",") if e]
+    client = app_module.app.test_client()
+    results = []
+    offset = 0
+
+    for name, path in videos:
+        with open(path, "rb") as f:
+            upload = client.post("/videos", data={"video": (f, os.path.basename(path))}).get_json()
+        video_id = upload["video_id"]
+        duration = args.seconds
+        for endpoint in endpoints:
+            for concurrency in args.concurrency:
+                before = stage_totals(metrics)
+                stats = run_level(app_module, endpoint, video_id, duration, concurrency, args.requests, offset)
+                offset += args.requests
+                stats.update({
+                    "endpoint": endpoint,
+                    "video": name,
+                    "video_bytes": os.path.getsize(path),
+                    "concurrency": concurrency,
+                    "stages_ms": stage_means(before, stage_totals(metrics)),
+                })
+                results.append(stats)
+                print(f"{name:>20} {endpoint:>7} c={concurrency:<3} p50={stats['p50_ms']}ms "
+                      f"p99={stats['p99_ms']}ms {stats['throughput_rps']} req/s errors={stats['errors']}",
+                      file=sys.stderr)
+
+    output = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare", "video_dir")},
+        "services": {
+            "roboflow_calls": services["roboflow"].calls,
+            "supabase_objects": len(services["supabase"].objects),
+            "gemini_calls": services["gemini"].calls,
+            "gemini_sent_bytes": services["gemini"].sent_bytes,
+        },
+        "results": results,
+    }
+    if args.compare:
+        output["comparison"] = compare(output, args.compare)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(output, f, indent=2, ensure_ascii=False)
+    print(json.dumps(output.get("comparison", {"output": args.output}), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Roboflow / Supabase / Gemini 的本地替身：结果确定、延迟可配置，用于离线基准测试"""
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+
+def _seed(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class Latency:
+    """固定基础延迟 + 按键确定的抖动（同一输入每次延迟相同）"""
+
+    def __init__(self, base: float = 0.0, jitter: float = 0.0):
+        self.base = base
+        self.jitter = jitter
+
+    def sleep(self, key: int = 0, extra: float = 0.0):
+        delay = self.base + extra
+        if self.jitter:
+            delay += self.jitter * np.random.default_rng(key).random()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class FakePrediction:
+    """与 roboflow SDK 的 PredictionGroup 相同：每条结果带上 image_path（传入的整帧数组）和
+    prediction_type；数组输入时 image 的宽高为字符串 "0"，与真实 SDK 一致"""
+
+    def __init__(self, predictions, image):
+        self._predictions = [dict(p, image_path=image, prediction_type="ObjectDetectionModel")
+                             for p in predictions]
+
+    def json(self):
+        return {"predictions": self._predictions, "image": {"width": "0", "height": "0"}}
+
+
+class FakeRoboflowModel:
+    """模拟 Roboflow 托管模型的 predict：检测框由帧内容的哈希决定"""
+
+    def __init__(self, latency: Latency, players: int = 22):
+        self.latency = latency
+        self.players = players
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def predict(self, image, confidence=40, overlap=30):
+        with self._lock:
+            self.calls += 1
+        key = _seed(np.ascontiguousarray(image[::64, ::64]).tobytes())
+        self.latency.sleep(key)
+
+        h, w = image.shape[:2]
+        rng = np.random.default_rng(key)
+        predictions = []
+        for i in range(self.players):
+            predictions.append({
+                "x": float(rng.uniform(0.05, 0.95) * w),
+                "y": float(rng.uniform(0.1, 0.9) * h),
+                "width": float(w / 60),
+                "height": float(h / 18),
+                "confidence": float(rng.uniform(0.5, 0.99)),
+                "class": "referee" if i == self.players - 1 else "player",
+                "class_id": 3 if i == self.players - 1 else 2,
+                "detection_id": f"{key:016x}-{i}",
+            })
+        predictions.append({
+            "x": float(rng.uniform(0.05, 0.95) * w), "y": float(rng.uniform(0.1, 0.9) * h),
+            "width": float(w / 120), "height": float(w / 120), "confidence": 0.6, "class": "ball",
+            "class_id": 0, "detection_id": f"{key:016x}-ball",
+        })
+        return FakePrediction(predictions, image)
+
+
+class FakeBucket:
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, path, file, file_options=None):
+        data = file if isinstance(file, bytes) else file.read()
+        self.client.latency.sleep(_seed(path.encode()), extra=len(data) * self.client.seconds_per_byte)
+        with self.client.lock:
+            self.client.objects[path] = len(data)
+
+    def remove(self, paths):
+        with self.client.lock:
+            for path in paths:
+                self.client.objects.pop(path, None)
+
+
+class FakeStorage:
+    def __init__(self, client):
+        self.client = client
+
+    def from_(self, bucket):
+        return FakeBucket(self.client)
+
+
+class FakeSupabaseClient:
+    """模拟 Supabase Storage：只记录对象大小，上传延迟 = 基础延迟 + 字节数 / 带宽"""
+
+    def __init__(self, latency: Latency, bandwidth_mbps: float = 50.0):
+        self.latency = latency
+        self.seconds_per_byte = 8 / (bandwidth_mbps * 1e6) if bandwidth_mbps > 0 else 0.0
+        self.objects = {}
+        self.lock = threading.Lock()
+        self.storage = FakeStorage(self)
+
+
+class FakeGeminiResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """模拟 genai.GenerativeModel：延迟 = 基础延迟 + 上传视频字节数 / 带宽"""
+    latency = Latency()
+    seconds_per_byte = 0.0
+    calls = 0
+    sent_bytes = 0
+    _lock = threading.Lock()
+
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    @classmethod
+    def configure(cls, latency: Latency, bandwidth_mbps: float = 20.0):
+        cls.latency = latency
+        cls.seconds_per_byte = 8 / (bandwidth_mbps * 1e6) if bandwidth_mbps > 0 else 0.0
+        cls.calls = 0
+        cls.sent_bytes = 0
+
+    def generate_content(self, contents):
+        size = 0
+        text = ""
+        for message in contents:
+            for part in message.get("parts", []):
+                if "inline_data" in part:
+                    size += len(part["inline_data"]["data"])
+                text += part.get("text", "")
+        with self._lock:
+            FakeGeminiModel.calls += 1
+            FakeGeminiModel.sent_bytes += size
+        key = _seed(text.encode())
+        self.latency.sleep(key, extra=size * self.seconds_per_byte)
+        return FakeGeminiResponse(f"[fake-gemini] 分析完成，视频 {size} 字节，提示词 {len(text)} 字")
+
+
+class FakeGenai:
+    """替代 google.generativeai 模块"""
+    GenerativeModel = FakeGeminiModel
+
+
+def install(app_module, roboflow_latency: Latency, supabase_latency: Latency, gemini_latency: Latency,
+            supabase_bandwidth_mbps: float = 50.0, gemini_bandwidth_mbps: float = 20.0):
+    """把 app 模块中的三个外部服务替换为本地替身，返回替身对象"""
+    from detectors import RoboflowDetector
+    from storage import SupabaseStorage, ArtifactUploader
+
+    model = FakeRoboflowModel(roboflow_latency)
+    app_module.services.provide("detector", app_module.wrap_detector(RoboflowDetector(
+        model, app_module.MODEL_ID, app_module.MODEL_VERSION,
+        confidence=app_module.DETECTION_CONFIDENCE, overlap=app_module.DETECTION_OVERLAP,
+        concurrency=app_module.DETECTION_CONCURRENCY, call=app_module.remote_calls["detector"].call,
+    )))
+
+    supabase = FakeSupabaseClient(supabase_latency, supabase_bandwidth_mbps)
+    app_module.services.provide("supabase", supabase, required=True)
+    app_module.artifact_storage = SupabaseStorage(lambda: supabase, app_module.BUCKET_NAME, "http://fake-supabase",
+                                                   call=app_module.remote_calls["storage"].call)
+    app_module.artifact_uploader = ArtifactUploader(app_module.artifact_storage)
+
+    FakeGeminiModel.configure(gemini_latency, gemini_bandwidth_mbps)
+    app_module.services.provide("gemini", FakeGenai)
+    return {"roboflow": model, "supabase": supabase, "gemini": FakeGeminiModel}
@@ -0,0 +1,100 @@
+"""合成类比赛视频：绿色草皮、白色边线、若干移动的球员色块和一个球，分辨率和 GOP 长度可配置"""
+import os
+import sys
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from seek_index import av  # noqa: E402
+
+TEAM_COLORS = [(40, 40, 220), (230, 230, 230)]
+REFEREE_COLOR = (20, 20, 20)
+
+
+def pitch_background(width: int, height: int, seed: int = 0):
+    """带草皮条纹、噪声纹理和边线的球场背景"""
+    rng = np.random.default_rng(seed)
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    stripe = max(1, width // 12)
+    for i in range(0, width, stripe):
+        shade = 120 if (i // stripe) % 2 == 0 else 140
+        image[:, i:i + stripe] = (40, shade, 40)
+    noise = rng.integers(-12, 12, size=(height, width, 1), dtype=np.int16)
+    image = np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+    line = max(2, width // 400)
+    margin = width // 20
+    cv2.rectangle(image, (margin, margin), (width - margin, height - margin), (255, 255, 255), line)
+    cv2.line(image, (width // 2, margin), (width // 2, height - margin), (255, 255, 255), line)
+    cv2.circle(image, (width // 2, height // 2), height // 6, (255, 255, 255), line)
+    return image
+
+
+def player_positions(frame_index: int, width: int, height: int, players: int, seed: int = 0):
+    """每名球员在椭圆轨迹上匀速移动，位置只取决于帧号"""
+    rng = np.random.default_rng(seed)
+    cx = rng.uniform(0.15, 0.85, players) * width
+    cy = rng.uniform(0.2, 0.8, players) * height
+    rx = rng.uniform(0.02, 0.12, players) * width
+    ry = rng.uniform(0.02, 0.1, players) * height
+    speed = rng.uniform(0.01, 0.04, players)
+    phase = rng.uniform(0, 2 * np.pi, players)
+    t = frame_index * speed + phase
+    return np.stack([cx + rx * np.cos(t), cy + ry * np.sin(t)], axis=1)
+
+
+def render_frame(background, frame_index: int, players: int, seed: int = 0):
+    height, width = background.shape[:2]
+    frame = background.copy()
+    box_w, box_h = max(6, width // 60), max(12, height // 18)
+    for i, (x, y) in enumerate(player_positions(frame_index, width, height, players, seed)):
+        color = REFEREE_COLOR if i == players - 1 else TEAM_COLORS[i % 2]
+        x1, y1 = int(x - box_w / 2), int(y - box_h / 2)
+        cv2.rectangle(frame, (x1, y1), (x1 + box_w, y1 + box_h), color, -1)
+        cv2.rectangle(frame, (x1, y1 + box_h // 3), (x1 + box_w, y1 + box_h // 2), (0, 0, 0), -1)
+    ball_x = int(width * (0.5 + 0.35 * np.sin(frame_index / 17)))
+    ball_y = int(height * (0.5 + 0.3 * np.cos(frame_index / 23)))
+    cv2.circle(frame, (ball_x, ball_y), max(3, width // 250), (255, 255, 255), -1)
+    return frame
+
+
+def write_video(path: str, width: int, height: int, seconds: float = 10.0, fps: int = 25,
+                gop: int = 50, players: int = 23, seed: int = 0) -> str:
+    """生成合成视频；有 PyAV 时用 H.264 并设置 GOP 长度，否则退回 OpenCV mp4v（GOP 不可控）"""
+    background = pitch_background(width, height, seed)
+    count = int(seconds * fps)
+    if av is not None:
+        with av.open(path, "w") as container:
+            stream = container.add_stream("libx264", rate=Fraction(fps))
+            stream.width, stream.height = width, height
+            stream.pix_fmt = "yuv420p"
+            stream.options = {"g": str(gop), "keyint_min": str(gop), "sc_threshold": "0",
+                              "preset": "veryfast", "crf": "23"}
+            for i in range(count):
+                frame = av.VideoFrame.from_ndarray(render_frame(background, i, players, seed), format="bgr24")
+                for packet in stream.encode(frame):
+                    container.mux(packet)
+            for packet in stream.encode():
+                container.mux(packet)
+    else:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        for i in range(count):
+            writer.write(render_frame(background, i, players, seed))
+        writer.release()
+    return path
+
+
+def ensure_videos(directory: str, resolutions, gops, seconds: float = 10.0, fps: int = 25):
+    """按 (分辨率, GOP) 生成视频，已存在则复用；返回 [(名称, 路径)]"""
+    os.makedirs(directory, exist_ok=True)
+    videos = []
+    for width, height in resolutions:
+        for gop in gops:
+            name = f"{width}x{height}_gop{gop}"
+            path = os.path.join(directory, f"{name}_{seconds:g}s.mp4")
+            if not os.path.exists(path):
+                write_video(path, width, height, seconds=seconds, fps=fps, gop=gop)
+            videos.append((name, path))
+    return videos
@@ -0,0 +1,198 @@
+import logging
+import os
+from itertools import chain
+from fractions import Fraction
+from dataclasses import dataclass
+
+import cv2
+
+from frame_reader import FrameReader
+from seek_index import av, get_seek_index
+from tracking import track_center_at
+
+logger = logging.getLogger(__name__)
+
+# 片段处理方式：highlight 在原画面上标出球员，crop 裁剪到球员周围区域，none 只做缩放抽帧
+CLIP_MODES = ("highlight", "crop", "none")
+# crop 模式下裁剪区域占原画面宽度的比例
+CROP_FRACTION = 0.4
+HIGHLIGHT_COLOR = (0, 255, 255)
+
+
+@dataclass
+class ClipResult:
+    """预处理后的视频片段"""
+    path: str
+    mime_type: str
+    start: float
+    end: float
+    fps: float
+    width: int
+    height: int
+    frames: int
+    source_bytes: int
+    clip_bytes: int
+    # 原画面坐标 → 片段画面坐标：先平移再缩放
+    offset: tuple = (0, 0)
+    scale: float = 1.0
+
+    @property
+    def reduction(self) -> float:
+        return 1 - self.clip_bytes / self.source_bytes if self.source_bytes else 0.0
+
+    def map_point(self, x: float, y: float):
+        return ((x - self.offset[0]) * self.scale, (y - self.offset[1]) * self.scale)
+
+    def to_dict(self) -> dict:
+        return {
+            "start": round(self.start, 3),
+            "end": round(self.end, 3),
+            "fps": self.fps,
+            "width": self.width,
+            "height": self.height,
+            "frames": self.frames,
+            "source_bytes": self.source_bytes,
+            "clip_bytes": self.clip_bytes,
+            "reduction": round(self.reduction, 4),
+        }
+
+
+def player_point(player_coordinates):
+    """从前端传来的球员坐标中取出中心点，支持 {"x","y"}、{"bbox"}、[x, y] 和 [x1, y1, x2, y2]；
+    格式不支持时返回 None，坐标值不是数字时抛出 TypeError / ValueError"""
+    coords = player_coordinates
+    if isinstance(coords, dict):
+        if "bbox" in coords:
+            coords = coords["bbox"]
+        elif "center" in coords:
+            coords = coords["center"]
+        elif "x" in coords and "y" in coords:
+            return float(coords["x"]), float(coords["y"])
+    if isinstance(coords, (list, tuple)):
+        if len(coords) == 4:
+            x1, y1, x2, y2 = map(float, coords)
+            return (x1 + x2) / 2, (y1 + y2) / 2
+        if len(coords) == 2:
+            return float(coords[0]), float(coords[1])
+    return None
+
+
+def crop_window(point, width: int, height: int):
+    """以球员为中心、保持原画面宽高比的裁剪区域 (x1, y1, x2, y2)"""
+    crop_w = int(width * CROP_FRACTION)
+    crop_h = int(height * CROP_FRACTION)
+    x1 = int(min(max(point[0] - crop_w / 2, 0), width - crop_w))
+    y1 = int(min(max(point[1] - crop_h / 2, 0), height - crop_h))
+    return x1, y1, x1 + crop_w, y1 + crop_h
+
+
+def _even(value: int) -> int:
+    # H.264 的 yuv420p 要求宽高为偶数
+    return max(2, int(value) // 2 * 2)
+
+
+def _write_pyav(path, frames, fps, width, height) -> int:
+    count = 0
+    with av.open(path, "w") as container:
+        stream = container.add_stream("libx264", rate=Fraction(fps).limit_denominator(1000))
+        stream.width, stream.height = width, height
+        stream.pix_fmt = "yuv420p"
+        stream.options = {"crf": "28", "preset": "veryfast"}
+        for frame in frames:
+            for packet in stream.encode(av.VideoFrame.from_ndarray(frame, format="bgr24")):
+                container.mux(packet)
+            count += 1
+        for packet in stream.encode():
+            container.mux(packet)
+    return count
+
+
+def _write_opencv(path, frames, fps, width, height) -> int:
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    if not writer.isOpened():
+        raise IOError("无法创建视频片段文件")
+    count = 0
+    try:
+        for frame in frames:
+            writer.write(frame)
+            count += 1
+    finally:
+        writer.release()
+    return count
+
+
+def extract_clip(video_path: str, center_time: float, output_path: str, window: float = 10.0,
+                 max_width: int = 640, target_fps: float = 5.0, player_coordinates=None,
+                 mode: str = "highlight", track: dict = None, index=None) -> ClipResult:
+    """截取 center_time 前后共 window 秒的片段，降低分辨率和帧率后重新编码为 MP4
+
+    mode 为 crop/highlight 时根据球员坐标裁剪或标出球员区域；
+    给出跟踪轨迹 track 时，highlight 的标记逐帧跟随球员移动。
+    index 为调用方已取得的定位索引，未给出时在当前线程获取。
+    """
+    if index is None:
+        index = get_seek_index(video_path)
+    with FrameReader(video_path, index=index) as reader:
+        duration = reader.duration
+        start = max(0.0, min(center_time - window / 2, duration - window))
+        end = min(duration, start + window)
+        fps = min(target_fps, reader.fps) if reader.fps > 0 else target_fps
+        count = max(1, int((end - start) * fps))
+        timestamps = [start + i / fps for i in range(count)]
+        planned = len(reader.plan(timestamps))
+
+        # 逐帧读取、缩放、标注并编码，内存中只保留当前帧；先取第一帧确定画面尺寸
+        samples = reader.iter_frames(timestamps)
+        first = next(samples, None)
+        if first is None:
+            raise IOError("无法从视频中提取片段")
+
+        height, width = first.frame.shape[:2]
+        point = None
+        if mode != "none":
+            point = track_center_at(track, center_time) if track else player_point(player_coordinates)
+
+        offset = (0, 0)
+        region = (0, 0, width, height)
+        if point is not None and mode == "crop":
+            region = crop_window(point, width, height)
+            offset = region[:2]
+
+        region_w, region_h = region[2] - region[0], region[3] - region[1]
+        scale = min(1.0, max_width / region_w)
+        out_w, out_h = _even(region_w * scale), _even(region_h * scale)
+
+        def render(sample):
+            frame = sample.frame[region[1]:region[3], region[0]:region[2]]
+            frame = cv2.resize(frame, (out_w, out_h), interpolation=cv2.INTER_AREA)
+            if point is not None and mode == "highlight":
+                frame_point = track_center_at(track, sample.actual_time) if track else point
+                center = (int((frame_point[0] - offset[0]) * scale), int((frame_point[1] - offset[1]) * scale))
+                cv2.circle(frame, center, max(8, out_w // 25), HIGHLIGHT_COLOR, 2)
+            return frame
+
+        # 帧率按计划抽取的帧数回算，保证片段时长与原视频时间一致
+        actual_fps = planned / (end - start) if end > start else fps
+        try:
+            if av is None:
+                raise RuntimeError("PyAV 不可用")
+            frames = _write_pyav(output_path, map(render, chain([first], samples)), actual_fps, out_w, out_h)
+        except Exception as e:
+            logger.warning(f"H.264 编码失败，改用 OpenCV 编码: {e}")
+            frames = _write_opencv(output_path, map(render, reader.iter_frames(timestamps)), actual_fps,
+                                   out_w, out_h)
+
+    return ClipResult(
+        path=output_path,
+        mime_type="video/mp4",
+        start=start,
+        end=end,
+        fps=round(actual_fps, 3),
+        width=out_w,
+        height=out_h,
+        frames=frames,
+        source_bytes=os.path.getsize(video_path),
+        clip_bytes=os.path.getsize(output_path),
+        offset=offset,
+        scale=out_w / region_w,
+    )
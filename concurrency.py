@@ -0,0 +1,129 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """并发已满且等待队列已满（或等待超时），调用方应返回 429 并带 Retry-After"""
+    status = 429
+
+    def __init__(self, name: str, message: str, retry_after: int = 5):
+        super().__init__(message)
+        self.name = name
+        self.retry_after = retry_after
+
+
+class Limiter:
+    """带有界等待队列的并发限制
+
+    同时最多 limit 个调用方持有名额；其余调用方最多 max_waiting 个排队等待，
+    等待超过 timeout 秒或队列已满时立即拒绝，而不是让请求线程无限堆积。
+    """
+
+    def __init__(self, name: str, limit: int, max_waiting: int = 0, timeout: float = 0.0,
+                 retry_after: int = 5):
+        self.name = name
+        self.limit = max(1, limit)
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.wait_seconds = 0.0
+        self._cond = threading.Condition()
+
+    def _reject(self, reason: str):
+        self.rejected += 1
+        logger.warning(f"{self.name} 拒绝请求: {reason}（进行中 {self.active}，等待 {self.waiting}）")
+        raise Overloaded(self.name, f"服务繁忙（{self.name}），请稍后重试", self.retry_after)
+
+    def acquire(self):
+        start = time.perf_counter()
+        with self._cond:
+            if self.active >= self.limit:
+                if self.waiting >= self.max_waiting or self.timeout <= 0:
+                    self._reject("等待队列已满")
+                self.waiting += 1
+                try:
+                    acquired = self._cond.wait_for(lambda: self.active < self.limit, timeout=self.timeout)
+                finally:
+                    self.waiting -= 1
+                if not acquired:
+                    self._reject(f"等待超过 {self.timeout:g} 秒")
+            self.active += 1
+            self.admitted += 1
+            self.wait_seconds += time.perf_counter() - start
+
+    def release(self):
+        with self._cond:
+            self.active -= 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "active": self.active,
+                "waiting": self.waiting,
+                "max_waiting": self.max_waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "wait_seconds": round(self.wait_seconds, 3),
+            }
+
+
+class CpuPool:
+    """解码、绘制、编码等 CPU 密集工作的有界线程池
+
+    OpenCV / PyAV / NumPy 在计算时释放 GIL，线程数与 CPU 核数一致即可并行；
+    请求线程提交后只等待结果，等待远程服务的线程不再与 CPU 工作争抢核心。
+    """
+
+    def __init__(self, workers: int = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cpu")
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.pending = 0
+
+    def _done(self, _future):
+        with self._lock:
+            self.pending -= 1
+
+    def submit(self, fn, *args, **kwargs):
+        """提交任务并返回 Future；复制当前上下文，任务中的日志和计时仍属于当前请求"""
+        with self._lock:
+            self.submitted += 1
+            self.pending += 1
+        future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, fn, *args, **kwargs):
+        """在池中执行并等待结果"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def map(self, fn, *iterables):
+        """并行执行并按顺序返回结果列表"""
+        futures = [self.submit(fn, *args) for args in zip(*iterables)]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.workers, "pending": self.pending, "submitted": self.submitted}
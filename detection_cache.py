@@ -0,0 +1,144 @@
+import logging
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class DetectionCache:
+    """两级检测结果缓存：进程内 LRU + 磁盘，两级都按字节数上限淘汰最久未使用的条目
+
+    键由 (视频内容哈希, 帧号, 模型ID/版本, 置信度, 重叠阈值) 生成，
+    同一帧在相同模型参数下只需请求一次检测服务。
+    内存中保存对象本身；encode/decode 在对象与写入磁盘的 JSON 值之间转换（默认原样保存）。
+    """
+
+    def __init__(self, directory: str, memory_bytes: int = 32 * 1024 * 1024,
+                 disk_bytes: int = 256 * 1024 * 1024, encode=None, decode=None):
+        self.directory = directory
+        self.encode = encode or (lambda value: value)
+        self.decode = decode or (lambda data: data)
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._memory = OrderedDict()  # key -> (value, size)
+        self._memory_used = 0
+        self._disk = OrderedDict()    # key -> size，按最近使用排序
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(video_id: str, frame_index: int, model_id: str, model_version,
+                 confidence, overlap) -> str:
+        raw = json.dumps([video_id, int(frame_index), model_id, str(model_version),
+                          float(confidence), float(overlap)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘缓存，按修改时间恢复 LRU 顺序"""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".json"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name[:-5], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_used += size
+        self._evict_disk()
+
+    def get(self, key: str):
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return item[0]
+            on_disk = key in self._disk
+
+        if on_disk:
+            try:
+                with open(self._path_for(key), "rb") as f:
+                    data = f.read()
+                value = self.decode(json.loads(data))
+                os.utime(self._path_for(key))
+            except (OSError, ValueError, KeyError, TypeError):
+                with self._lock:
+                    self._disk_used -= self._disk.pop(key, 0)
+            else:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._put_memory(key, value, len(data))
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value):
+        """写入缓存；结果无法序列化时记录日志并跳过，不影响请求"""
+        try:
+            data = json.dumps(self.encode(value)).encode("utf-8")
+        except (TypeError, ValueError) as e:
+            logger.warning(f"检测结果无法序列化，跳过缓存: {e}")
+            return
+        path = self._path_for(key)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"写入检测缓存失败: {e}")
+            data_on_disk = False
+        else:
+            data_on_disk = True
+
+        with self._lock:
+            self._put_memory(key, value, len(data))
+            if data_on_disk:
+                self._disk_used += len(data) - self._disk.pop(key, 0)
+                self._disk[key] = len(data)
+                self._evict_disk()
+
+    def _put_memory(self, key, value, size):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_used -= old[1]
+        self._memory[key] = (value, size)
+        self._memory_used += size
+        while self._memory_used > self.memory_bytes and self._memory:
+            _, (_, evicted_size) = self._memory.popitem(last=False)
+            self._memory_used -= evicted_size
+
+    def _evict_disk(self):
+        while self._disk_used > self.disk_bytes and self._disk:
+            key, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            try:
+                os.remove(self._path_for(key))
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "memory_items": len(self._memory),
+                "memory_bytes": self._memory_used,
+                "disk_items": len(self._disk),
+                "disk_bytes": self._disk_used,
+            }
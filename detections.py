@@ -0,0 +1,175 @@
+import numpy as np
+
+from detectors import DEFAULT_CLASSES
+
+# 一行一个检测框；track_id 为 -1 表示未关联轨迹
+DETECTION_DTYPE = np.dtype([
+    ("class_id", "<i2"), ("confidence", "<f4"),
+    ("x1", "<f4"), ("y1", "<f4"), ("x2", "<f4"), ("y2", "<f4"),
+    ("track_id", "<i4"),
+])
+# 检测后端返回的原始数值，只用于 JSON 输出：保留 float64 精度，class_id 为 -1 表示原结果中没有；
+# integral 按位记录 x、y、width、height、confidence 中哪些原本是整数（JSON 中仍输出为整数）
+SOURCE_DTYPE = np.dtype([
+    ("x", "<f8"), ("y", "<f8"), ("width", "<f8"), ("height", "<f8"), ("confidence", "<f8"),
+    ("class_id", "<i4"), ("integral", "u1"),
+])
+SOURCE_VALUES = ("x", "y", "width", "height", "confidence")
+# 一行一个轨迹点；detected 为 1 表示该帧做过检测，0 表示由光流推算
+TRACK_POINT_DTYPE = np.dtype([
+    ("track_id", "<i4"), ("frame_index", "<i4"), ("time", "<f4"),
+    ("x1", "<i4"), ("y1", "<i4"), ("x2", "<i4"), ("y2", "<i4"),
+    ("detected", "u1"),
+])
+# 一行一名球员（标注图中的编号、框和中心点）
+PLAYER_DTYPE = np.dtype([
+    ("id", "<i4"), ("x1", "<i4"), ("y1", "<i4"), ("x2", "<i4"), ("y2", "<i4"),
+    ("center_x", "<i4"), ("center_y", "<i4"),
+])
+
+
+def columns(array: np.ndarray) -> dict:
+    """结构化数组按列编码：每列为小端序的连续字节，客户端可直接转为 TypedArray"""
+    return {
+        "count": len(array),
+        "dtypes": {name: array.dtype[name].str for name in array.dtype.names},
+        "columns": {name: np.ascontiguousarray(array[name]).tobytes() for name in array.dtype.names},
+    }
+
+
+class Detections:
+    """一帧的检测结果：结构化数组 + 类别名表
+
+    检测完成时转换一次，之后缓存、绘制和跟踪都直接使用数组；
+    只有 JSON 响应才由 source 和 detection_ids 还原出与检测后端完全相同的字典列表。
+    """
+    __slots__ = ("array", "classes", "source", "detection_ids")
+
+    def __init__(self, array: np.ndarray, classes, source: np.ndarray, detection_ids):
+        self.array = array
+        self.classes = list(classes)
+        self.source = source
+        self.detection_ids = list(detection_ids)
+
+    @classmethod
+    def from_predictions(cls, predictions):
+        classes = list(DEFAULT_CLASSES)
+        ids = {name: i for i, name in enumerate(classes)}
+        array = np.zeros(len(predictions), dtype=DETECTION_DTYPE)
+        source = np.zeros(len(predictions), dtype=SOURCE_DTYPE)
+        if predictions:
+            for p in predictions:
+                if p["class"] not in ids:
+                    ids[p["class"]] = len(classes)
+                    classes.append(p["class"])
+            for bit, name in enumerate(SOURCE_VALUES):
+                values = [p[name] for p in predictions]
+                source[name] = values
+                source["integral"] |= np.array([isinstance(v, int) for v in values], dtype=np.uint8) << bit
+            source["class_id"] = [p.get("class_id", -1) for p in predictions]
+            array["class_id"] = [ids[p["class"]] for p in predictions]
+            array["confidence"] = source["confidence"]
+            array["x1"] = source["x"] - source["width"] / 2
+            array["y1"] = source["y"] - source["height"] / 2
+            array["x2"] = source["x"] + source["width"] / 2
+            array["y2"] = source["y"] + source["height"] / 2
+            array["track_id"] = [p.get("track_id", -1) for p in predictions]
+        return cls(array, classes, source, [p.get("detection_id") for p in predictions])
+
+    @classmethod
+    def from_result(cls, result: dict):
+        """由检测后端返回的 {"predictions": [...], "image": {...}} 创建"""
+        return cls.from_predictions(result.get("predictions", []))
+
+    def to_cache(self) -> dict:
+        return {"classes": self.classes, "rows": self.array.tolist(), "source": self.source.tolist(),
+                "detection_ids": self.detection_ids}
+
+    @classmethod
+    def from_cache(cls, data: dict):
+        if "predictions" in data:
+            # 旧版本缓存的是检测后端的原始结果
+            return cls.from_result(data)
+        array = np.array([tuple(row) for row in data["rows"]], dtype=DETECTION_DTYPE)
+        source = np.array([tuple(row) for row in data["source"]], dtype=SOURCE_DTYPE)
+        return cls(array, data["classes"], source, data["detection_ids"])
+
+    def __len__(self):
+        return len(self.array)
+
+    def names(self) -> np.ndarray:
+        """每个检测框的类别名"""
+        return np.asarray(self.classes, dtype=object)[self.array["class_id"]]
+
+    def centers(self) -> np.ndarray:
+        a = self.array
+        return np.column_stack([(a["x1"] + a["x2"]) / 2, (a["y1"] + a["y2"]) / 2])
+
+    def boxes(self, width: int, height: int) -> np.ndarray:
+        """取整并裁剪到图像范围内的 (x1, y1, x2, y2) 整数框"""
+        a = self.array
+        return np.column_stack([
+            np.maximum(0, np.trunc(a["x1"])), np.maximum(0, np.trunc(a["y1"])),
+            np.minimum(width, np.trunc(a["x2"])), np.minimum(height, np.trunc(a["y2"])),
+        ]).astype(np.int64).reshape(-1, 4)
+
+    def to_predictions(self):
+        """还原检测后端返回的字典列表：数值、class_id 和 detection_id 与原结果相同"""
+        predictions = []
+        rows = zip(self.source.tolist(), self.array["class_id"].tolist(), self.detection_ids)
+        for (*values, class_id, integral), class_index, detection_id in rows:
+            p = {name: int(v) if integral >> bit & 1 else v
+                 for bit, (name, v) in enumerate(zip(SOURCE_VALUES, values))}
+            p["class"] = self.classes[class_index]
+            if class_id >= 0:
+                p["class_id"] = class_id
+            if detection_id is not None:
+                p["detection_id"] = detection_id
+            predictions.append(p)
+        return predictions
+
+    def __json__(self):
+        return self.to_predictions()
+
+    def __compact__(self):
+        return {"classes": self.classes, **columns(self.array)}
+
+
+class TrackTable:
+    """跟踪结果中的轨迹列表：JSON 为原来的轨迹字典列表，紧凑格式把所有轨迹点合并为一张按列编码的表"""
+    __slots__ = ("tracks",)
+
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def points(self) -> np.ndarray:
+        rows = [(track["track_id"], p["frame_index"], p["time"], *p["bbox"], p["source"] == "detect")
+                for track in self.tracks for p in track["points"]]
+        return np.array(rows, dtype=TRACK_POINT_DTYPE) if rows else np.zeros(0, dtype=TRACK_POINT_DTYPE)
+
+    def __json__(self):
+        return self.tracks
+
+    def __compact__(self):
+        return {
+            "tracks": [{k: v for k, v in track.items() if k != "points"} for track in self.tracks],
+            "points": columns(self.points()),
+        }
+
+
+class PlayerTable:
+    """标注图中的球员列表（players_data）：JSON 为原来的字典列表，紧凑格式为按列编码的表"""
+    __slots__ = ("players",)
+
+    def __init__(self, players):
+        self.players = players
+
+    def to_array(self) -> np.ndarray:
+        rows = [(p["id"], *p["bbox"], *p["center"]) for p in self.players]
+        return np.array(rows, dtype=PLAYER_DTYPE) if rows else np.zeros(0, dtype=PLAYER_DTYPE)
+
+    def __json__(self):
+        return self.players
+
+    def __compact__(self):
+        return columns(self.to_array())
@@ -0,0 +1,250 @@
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+# ONNX Runtime 为可选依赖，仅 onnx 后端需要
+try:
+    import onnxruntime as ort
+except Exception:
+    ort = None
+
+# 默认类别顺序与 Roboflow 足球球员检测模型一致
+DEFAULT_CLASSES = ["ball", "goalkeeper", "player", "referee"]
+# Roboflow 托管的足球球员检测模型
+DEFAULT_MODEL_ID = "football-players-detection-3zvbc-lkn9q"
+DEFAULT_MODEL_VERSION = 1
+# 检测结果中保留的字段；Roboflow SDK 还会在每条结果中放入 image_path（即整帧数组）等字段
+PREDICTION_KEYS = ("x", "y", "width", "height", "confidence", "class", "class_id", "detection_id")
+
+
+class Detector:
+    """检测后端接口
+
+    predict 接收 BGR 格式的 NumPy 帧列表，返回与 Roboflow prediction.json()
+    相同结构的字典列表：{"predictions": [{"x", "y", "width", "height",
+    "confidence", "class", "class_id"}, ...], "image": {"width", "height"}}
+    """
+    name = "base"
+    model_id = ""
+    model_version = ""
+
+    def __init__(self, confidence: float = 40, overlap: float = 30):
+        # 与 Roboflow 接口保持一致，阈值使用百分比
+        self.confidence = confidence
+        self.overlap = overlap
+
+    def predict(self, frames):
+        raise NotImplementedError
+
+    def describe(self) -> dict:
+        return {"backend": self.name, "model_id": self.model_id, "model_version": self.model_version}
+
+
+class RoboflowDetector(Detector):
+    """Roboflow 托管模型：直接发送内存中的帧，多帧时并发请求以重叠网络等待
+
+    SDK 对数组输入不做缩放，发送前先把帧缩小到模型输入尺寸以内，结果坐标再还原到原图。
+    """
+    name = "roboflow"
+
+    def __init__(self, model, model_id: str, model_version, confidence: float = 40,
+                 overlap: float = 30, concurrency: int = 4, call=None, input_size: int = 640):
+        super().__init__(confidence, overlap)
+        self.model = model
+        self.model_id = model_id
+        self.model_version = str(model_version)
+        self.concurrency = concurrency
+        # call(fn, *args) 执行单次远程请求（超时、重试、熔断等策略），默认直接调用
+        self.call = call
+        # 模型的预处理尺寸优先，取不到时使用 input_size
+        resize = (getattr(model, "preprocessing", None) or {}).get("resize") or {}
+        try:
+            self.input_size = (int(resize["width"]), int(resize["height"]))
+        except (KeyError, TypeError, ValueError):
+            self.input_size = (input_size, input_size)
+
+    def _request(self, frame):
+        height, width = frame.shape[:2]
+        scale = min(1.0, self.input_size[0] / width, self.input_size[1] / height)
+        if scale < 1.0:
+            frame = cv2.resize(frame, (max(1, round(width * scale)), max(1, round(height * scale))),
+                               interpolation=cv2.INTER_AREA)
+        result = self.model.predict(frame, confidence=self.confidence, overlap=self.overlap).json()
+
+        predictions = []
+        for raw in result.get("predictions", []):
+            prediction = {key: raw[key] for key in PREDICTION_KEYS if key in raw}
+            if scale < 1.0:
+                for key in ("x", "y", "width", "height"):
+                    prediction[key] = float(prediction[key]) / scale
+            predictions.append(prediction)
+        return {"predictions": predictions, "image": {"width": width, "height": height}}
+
+    def _predict_one(self, frame):
+        if self.call is not None:
+            return self.call(self._request, frame)
+        return self._request(frame)
+
+    def predict(self, frames):
+        if len(frames) <= 1:
+            return [self._predict_one(frame) for frame in frames]
+        with ThreadPoolExecutor(max_workers=min(self.concurrency, len(frames))) as pool:
+            return list(pool.map(self._predict_one, frames))
+
+
+def letterbox(frame, size: int):
+    """等比缩放并填充到 size×size，返回 (图像, 缩放比例, (x偏移, y偏移))"""
+    h, w = frame.shape[:2]
+    scale = min(size / w, size / h)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    resized = cv2.resize(frame, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = resized
+    return canvas, scale, (pad_x, pad_y)
+
+
+class YoloDetector(Detector):
+    """本地 CPU 推理的 YOLOv8 格式 ONNX 模型（输出为 1×(4+类别数)×N）的公共前后处理"""
+
+    def __init__(self, model_path: str, class_names=None, input_size: int = 640,
+                 confidence: float = 40, overlap: float = 30):
+        super().__init__(confidence, overlap)
+        self.model_path = model_path
+        self.class_names = list(class_names or DEFAULT_CLASSES)
+        self.input_size = input_size
+        self.model_id = os.path.basename(model_path)
+        with open(model_path, "rb") as f:
+            self.model_version = hashlib.sha256(f.read()).hexdigest()[:12]
+
+    def _preprocess(self, frames):
+        batch, transforms = [], []
+        for frame in frames:
+            image, scale, pad = letterbox(frame, self.input_size)
+            batch.append(image)
+            transforms.append((scale, pad, frame.shape[1], frame.shape[0]))
+        blob = cv2.dnn.blobFromImages(batch, scalefactor=1 / 255.0, swapRB=True)
+        return blob, transforms
+
+    def _postprocess(self, output, transform):
+        scale, (pad_x, pad_y), width, height = transform
+        output = np.squeeze(output, axis=0) if output.ndim == 3 else output
+        if output.shape[1] != 4 + len(self.class_names):
+            output = output.T  # YOLOv8 输出为 (4+类别数)×N，转为 N×(4+类别数)
+
+        scores_all = output[:, 4:]
+        class_ids = scores_all.argmax(axis=1)
+        scores = scores_all[np.arange(len(class_ids)), class_ids]
+        keep = scores >= self.confidence / 100
+        boxes, scores, class_ids = output[keep, :4], scores[keep], class_ids[keep]
+
+        # 去除 letterbox 变换，还原到原图坐标（中心点 + 宽高）
+        boxes = boxes.copy()
+        boxes[:, 0] = (boxes[:, 0] - pad_x) / scale
+        boxes[:, 1] = (boxes[:, 1] - pad_y) / scale
+        boxes[:, 2:4] /= scale
+
+        xywh = np.column_stack([boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2,
+                                boxes[:, 2], boxes[:, 3]])
+        indices = cv2.dnn.NMSBoxesBatched(xywh.tolist(), scores.tolist(), class_ids.tolist(),
+                                          self.confidence / 100, self.overlap / 100)
+
+        predictions = []
+        for i in np.asarray(indices, dtype=int).reshape(-1):
+            class_id = int(class_ids[i])
+            predictions.append({
+                "x": float(boxes[i, 0]),
+                "y": float(boxes[i, 1]),
+                "width": float(boxes[i, 2]),
+                "height": float(boxes[i, 3]),
+                "confidence": float(scores[i]),
+                "class": self.class_names[class_id] if class_id < len(self.class_names) else str(class_id),
+                "class_id": class_id,
+            })
+        return {"predictions": predictions, "image": {"width": width, "height": height}}
+
+    def _forward(self, blob):
+        raise NotImplementedError
+
+    def predict(self, frames):
+        if not frames:
+            return []
+        blob, transforms = self._preprocess(frames)
+        outputs = self._forward(blob)
+        return [self._postprocess(outputs[i], transform) for i, transform in enumerate(transforms)]
+
+
+class OnnxRuntimeDetector(YoloDetector):
+    """ONNX Runtime CPU 后端；模型支持动态批次时整批推理，否则逐帧推理"""
+    name = "onnx"
+
+    def __init__(self, model_path: str, **kwargs):
+        if ort is None:
+            raise RuntimeError("onnxruntime 未安装，无法使用 onnx 检测后端")
+        super().__init__(model_path, **kwargs)
+        self.session = ort.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+
+    def _forward(self, blob):
+        if self.dynamic_batch:
+            return self.session.run(None, {self.input_name: blob})[0]
+        return np.concatenate([
+            self.session.run(None, {self.input_name: blob[i:i + 1]})[0] for i in range(len(blob))
+        ])
+
+
+class OpenCVDnnDetector(YoloDetector):
+    """OpenCV DNN CPU 后端，不需要额外依赖"""
+    name = "opencv"
+
+    def __init__(self, model_path: str, **kwargs):
+        super().__init__(model_path, **kwargs)
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self._lock = threading.Lock()  # cv2.dnn.Net 不支持多线程同时推理
+
+    def _forward(self, blob):
+        with self._lock:
+            self.net.setInput(blob)
+            return self.net.forward()
+
+
+def load_detector(backend: str, api_key: str = None, model_id: str = None, model_version=None,
+                  model_path: str = None, class_names=None, input_size: int = 640,
+                  confidence: float = 40, overlap: float = 30, concurrency: int = 4, call=None):
+    """按配置加载检测后端：Roboflow 需要网络请求获取托管模型，本地后端加载权重文件"""
+    backend = (backend or "roboflow").lower()
+    if backend == "roboflow":
+        from roboflow import Roboflow
+        rf = Roboflow(api_key=api_key)
+        model = rf.workspace().project(model_id).version(model_version).model
+        return create_detector(
+            "roboflow", model=model, model_id=model_id, model_version=model_version,
+            confidence=confidence, overlap=overlap, concurrency=concurrency, call=call, input_size=input_size,
+        )
+    return create_detector(
+        backend, model_path=model_path, class_names=class_names, input_size=input_size,
+        confidence=confidence, overlap=overlap,
+    )
+
+
+def create_detector(backend: str, **options):
+    """根据配置创建检测后端：roboflow / onnx / opencv"""
+    backend = (backend or "roboflow").lower()
+    if backend == "roboflow":
+        return RoboflowDetector(**options)
+
+    local_options = {k: options[k] for k in ("class_names", "input_size", "confidence", "overlap")
+                     if k in options}
+    if backend == "onnx":
+        return OnnxRuntimeDetector(options["model_path"], **local_options)
+    if backend == "opencv":
+        return OpenCVDnnDetector(options["model_path"], **local_options)
+    raise ValueError(f"未知的检测后端: {backend}")
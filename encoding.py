@@ -0,0 +1,50 @@
+import gzip
+
+import msgpack
+import numpy as np
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/vnd.msgpack", "application/x-msgpack")
+# 小于该字节数的响应不压缩
+GZIP_MIN_BYTES = 1024
+
+
+def negotiate(accept_mimetypes, fmt: str = None) -> str:
+    """根据 format 参数或 Accept 头选择响应格式：json（默认）或 msgpack
+
+    Accept 为 */* 或同时接受两者且权重相同时返回 JSON，只有明确偏好 MessagePack 时才使用紧凑格式。
+    """
+    if fmt:
+        return "msgpack" if fmt.lower() == "msgpack" else "json"
+    best = accept_mimetypes.best_match((JSON_TYPE,) + MSGPACK_TYPES, default=JSON_TYPE)
+    return "msgpack" if best in MSGPACK_TYPES else "json"
+
+
+def compact(value):
+    """把响应数据转为只含基本类型的紧凑结构：检测结果、球员列表等转为按列编码"""
+    if isinstance(value, dict):
+        return {k: compact(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [compact(v) for v in value]
+    if hasattr(value, "__compact__"):
+        return compact(value.__compact__())
+    if hasattr(value, "__json__"):
+        return compact(value.__json__())
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def packb(value) -> bytes:
+    """MessagePack 编码（字符串为 str 类型，字节为 bin 类型）"""
+    return msgpack.packb(compact(value), use_bin_type=True)
+
+
+def maybe_gzip(body: bytes, accept_encodings):
+    """客户端接受 gzip 且响应足够大时压缩，返回 (body, Content-Encoding 或 None)"""
+    if len(body) >= GZIP_MIN_BYTES and accept_encodings["gzip"]:
+        return gzip.compress(body, compresslevel=5), "gzip"
+    return body, None
@@ -0,0 +1,167 @@
+import logging
+from dataclasses import dataclass, replace
+
+import cv2
+import numpy as np
+
+from seek_index import av
+
+logger = logging.getLogger(__name__)
+
+# 无索引时：两个目标帧间隔不超过该帧数时顺序读取（grab），否则直接跳转
+DEFAULT_SEEK_THRESHOLD = 48
+
+
+@dataclass
+class FrameSample:
+    """按时间戳提取出的一帧"""
+    requested_time: float
+    frame_index: int
+    actual_time: float
+    frame: np.ndarray
+
+
+class FrameReader:
+    """按时间戳提取视频帧
+
+    有定位索引时用 PyAV 直接跳到目标帧之前最近的关键帧，再解码到精确的目标帧；
+    没有索引时使用 OpenCV 顺序读取 / 按帧号跳转。
+    """
+
+    def __init__(self, video_path: str, index=None, seek_threshold: int = DEFAULT_SEEK_THRESHOLD):
+        self.index = index if av is not None else None
+        self.seek_threshold = seek_threshold
+        self._cap = None
+        self._container = None
+
+        if self.index is not None:
+            try:
+                self._container = av.open(video_path)
+            except Exception as e:
+                raise IOError(f"无法打开视频文件，请检查文件格式: {e}")
+            self._stream = self._container.streams.video[0]
+            self._stream.thread_type = "AUTO"
+            self._decoder = None
+            self._last_pts = None
+            self.fps = self.index.fps
+            self.total_frames = self.index.total_frames
+        else:
+            self._cap = cv2.VideoCapture(video_path)
+            if not self._cap.isOpened():
+                raise IOError("无法打开视频文件，请检查文件格式")
+            self._position = 0  # 下一次 read() 将返回的帧号
+            self.fps = self._cap.get(cv2.CAP_PROP_FPS)
+            self.total_frames = int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT))
+
+        self.duration = self.total_frames / self.fps if self.fps > 0 else 0
+
+    @property
+    def info(self) -> dict:
+        return {"fps": self.fps, "total_frames": self.total_frames, "duration": self.duration}
+
+    def frame_for_time(self, t: float) -> int:
+        t = max(float(t), 0.0)
+        if self.index is not None:
+            index = self.index.frame_for_time(t)
+        else:
+            index = int(round(t * self.fps)) if self.fps > 0 else 0
+        return min(index, max(self.total_frames - 1, 0))
+
+    def plan(self, timestamps):
+        """将时间戳转换为排序去重后的 (帧号, 请求时间) 列表"""
+        planned = {}
+        for t in sorted(max(float(t), 0.0) for t in timestamps):
+            planned.setdefault(self.frame_for_time(t), t)
+        return sorted(planned.items())
+
+    def read(self, timestamps):
+        """单次前向遍历提取多个时间点的帧，按请求顺序返回 FrameSample 列表
+
+        落在同一帧上的时间点只解码一次，但每个时间点各返回一项（共享同一帧数据）；
+        requested_time 为调用方传入的原值（负数按 0 取帧）。无法读取的帧跳过。
+        """
+        timestamps = [float(t) for t in timestamps]
+        decoded = {sample.frame_index: sample for sample in self.iter_frames(timestamps)}
+        samples = []
+        for t in timestamps:
+            sample = decoded.get(self.frame_for_time(t))
+            if sample is not None:
+                samples.append(replace(sample, requested_time=t))
+        return samples
+
+    def iter_frames(self, timestamps):
+        """与 read 相同，但逐帧产出，适合帧数较多、不宜全部留在内存中的场景"""
+        for frame_index, requested_time in self.plan(timestamps):
+            if self.index is not None:
+                frame = self._read_indexed(frame_index)
+                actual_time = float(self.index.times[frame_index])
+            else:
+                frame = self._read_sequential(frame_index)
+                actual_time = frame_index / self.fps if self.fps > 0 else 0.0
+
+            if frame is None:
+                logger.warning(f"无法读取第 {frame_index} 帧，已跳过")
+                continue
+            yield FrameSample(
+                requested_time=requested_time,
+                frame_index=frame_index,
+                actual_time=actual_time,
+                frame=frame,
+            )
+
+    def _read_sequential(self, frame_index: int):
+        gap = frame_index - self._position
+        if 0 <= gap <= self.seek_threshold:
+            for _ in range(gap):
+                if not self._cap.grab():
+                    break
+        else:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+
+        ret, frame = self._cap.read()
+        if not ret:
+            self._position = int(self._cap.get(cv2.CAP_PROP_POS_FRAMES))
+            return None
+        self._position = frame_index + 1
+        return frame
+
+    def _read_indexed(self, frame_index: int):
+        target_pts = int(self.index.pts[frame_index])
+        keyframe_pts = int(self.index.pts[self.index.keyframe_for(frame_index)])
+
+        # 仅当当前解码位置与目标之间隔着关键帧（或需要回退）时才跳转，
+        # 否则继续顺序解码比从关键帧重新解码更省
+        if (self._decoder is None or self._last_pts is None
+                or target_pts <= self._last_pts or keyframe_pts > self._last_pts):
+            self._container.seek(keyframe_pts, stream=self._stream, backward=True, any_frame=False)
+            self._decoder = self._container.decode(self._stream)
+            self._last_pts = None
+
+        for frame in self._decoder:
+            if frame.pts is None:
+                continue
+            self._last_pts = frame.pts
+            if frame.pts >= target_pts:
+                return frame.to_ndarray(format="bgr24")
+        self._decoder = None
+        return None
+
+    def close(self):
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        if self._container is not None:
+            self._container.close()
+            self._container = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_frames(video_path: str, timestamps, seek_threshold: int = DEFAULT_SEEK_THRESHOLD, index=None):
+    """提取多个时间点的帧，返回 (视频信息, FrameSample 列表)"""
+    with FrameReader(video_path, index=index, seek_threshold=seek_threshold) as reader:
+        return reader.info, reader.read(timestamps)
@@ -0,0 +1,187 @@
+import logging
+import time
+import uuid
+import threading
+import contextvars
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class QueueFullError(Exception):
+    """等待中的任务数已达上限"""
+
+
+class JobCancelled(Exception):
+    """任务已被取消（客户端主动取消或长时间未轮询）"""
+
+
+@dataclass
+class Job:
+    """一个后台分析任务"""
+    job_id: str
+    kind: str
+    status: str = QUEUED
+    stage: str = ""
+    result: dict = None
+    error: str = None
+    error_status: int = 500
+    created_at: float = field(default_factory=time.time)
+    started_at: float = None
+    finished_at: float = None
+    last_seen: float = field(default_factory=time.time)
+    version: int = 0
+    cancel_requested: bool = False
+
+    def check_cancelled(self):
+        """在阶段边界调用：任务已被取消时中止执行"""
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self) -> dict:
+        data = {
+            "job_id": self.job_id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.status == SUCCEEDED:
+            data["result"] = self.result
+        if self.error:
+            data["error"] = self.error
+            data["error_status"] = self.error_status
+        return data
+
+
+class JobManager:
+    """有界线程池执行后台任务
+
+    - 排队任务数超过 max_queue 时提交失败（调用方返回 429）
+    - 客户端超过 client_timeout 秒未查询状态的未完成任务会被取消
+    - 已结束的任务保留 result_ttl 秒供客户端取回结果
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16,
+                 client_timeout: float = 60, result_ttl: float = 600):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.client_timeout = client_timeout
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._cond = threading.Condition()
+        self._reaper = threading.Thread(target=self._reap_loop, name="job-reaper", daemon=True)
+        self._reaper.start()
+
+    def submit(self, kind: str, fn, *args, on_done=None, **kwargs) -> Job:
+        """提交任务；fn 的第一个参数为 Job，用于检查取消和报告阶段
+
+        on_done 在任务结束后调用（包括排队时被取消），用于释放任务占用的资源。
+        """
+        with self._cond:
+            queued = sum(1 for job in self._jobs.values() if job.status == QUEUED)
+            if queued >= self.max_queue:
+                raise QueueFullError(f"任务队列已满（{queued} 个任务等待中），请稍后重试")
+            job = Job(job_id=uuid.uuid4().hex, kind=kind)
+            self._jobs[job.job_id] = job
+        # 复制当前上下文（请求ID等），任务线程中的日志仍能对应到提交它的请求
+        self._executor.submit(contextvars.copy_context().run, self._run, job, fn, args, kwargs, on_done)
+        return job
+
+    def _update(self, job: Job, **changes):
+        with self._cond:
+            for key, value in changes.items():
+                setattr(job, key, value)
+            job.version += 1
+            self._cond.notify_all()
+
+    def set_stage(self, job: Job, stage: str):
+        self._update(job, stage=stage)
+
+    def _run(self, job: Job, fn, args, kwargs, on_done=None):
+        try:
+            self._execute(job, fn, args, kwargs)
+        finally:
+            if on_done is not None:
+                on_done()
+
+    def _execute(self, job: Job, fn, args, kwargs):
+        if job.cancel_requested:
+            self._update(job, status=CANCELLED, finished_at=time.time())
+            return
+        self._update(job, status=RUNNING, started_at=time.time())
+        try:
+            result = fn(job, *args, **kwargs)
+        except JobCancelled:
+            self._update(job, status=CANCELLED, finished_at=time.time())
+        except Exception as e:
+            self._update(job, status=FAILED, error=str(e),
+                         error_status=getattr(e, "status", 500), finished_at=time.time())
+        else:
+            self._update(job, status=SUCCEEDED, result=result, finished_at=time.time())
+
+    def get(self, job_id: str, touch: bool = True):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and touch:
+                job.last_seen = time.time()
+            return job
+
+    def cancel(self, job_id: str) -> bool:
+        """请求取消：排队中的任务不会再执行，运行中的任务在下一个阶段边界中止"""
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return False
+        if job.status == QUEUED:
+            self._update(job, cancel_requested=True, status=CANCELLED, finished_at=time.time())
+        else:
+            self._update(job, cancel_requested=True)
+        return True
+
+    def wait_for_change(self, job: Job, version: int, timeout: float) -> int:
+        """阻塞直到任务状态版本号变化或超时，返回最新版本号"""
+        with self._cond:
+            self._cond.wait_for(lambda: job.version != version, timeout=timeout)
+            return job.version
+
+    def _reap_loop(self):
+        while True:
+            time.sleep(min(5.0, self.client_timeout / 2))
+            try:
+                self.reap()
+            except Exception as e:
+                logger.exception(f"清理任务时出错: {e}")
+
+    def reap(self):
+        """取消客户端已离开的任务，删除过期的已结束任务"""
+        now = time.time()
+        with self._cond:
+            abandoned = [job.job_id for job in self._jobs.values()
+                         if job.status not in FINISHED_STATES and not job.cancel_requested
+                         and now - job.last_seen > self.client_timeout]
+            expired = [job.job_id for job in self._jobs.values()
+                       if job.status in FINISHED_STATES and now - job.finished_at > self.result_ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+        for job_id in abandoned:
+            logger.warning(f"客户端超过 {self.client_timeout:.0f} 秒未查询，取消任务: {job_id}")
+            self.cancel(job_id)
+
+    def stats(self) -> dict:
+        with self._cond:
+            counts = {state: 0 for state in (QUEUED, RUNNING) + FINISHED_STATES}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return {"workers": self.max_workers, "max_queue": self.max_queue, **counts}
@@ -0,0 +1,207 @@
+import re
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# 当前请求ID：Flask 请求开始时设置，后台任务提交时随上下文一起复制
+request_id_var = contextvars.ContextVar("request_id", default="-")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+logger = logging.getLogger(__name__)
+
+
+# 客户端传入的请求ID只接受该格式，避免换行等字符注入日志或超长的值
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def request_id_from(header: str = None) -> str:
+    """沿用客户端传入的合法请求ID，缺失或格式不符时生成新的"""
+    if header and REQUEST_ID_PATTERN.fullmatch(header):
+        return header
+    return new_request_id()
+
+
+class RequestIdFilter(logging.Filter):
+    """为每条日志加上 request_id 字段"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+def setup_logging(level: str = "INFO"):
+    """配置根日志：级别由 LOG_LEVEL 控制，每行带请求ID"""
+    handler = logging.StreamHandler()
+    handler.addFilter(RequestIdFilter())
+    handler.setFormatter(logging.Formatter(
+        "%(asctime)s %(levelname)s [%(request_id)s] %(name)s: %(message)s"))
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level.upper())
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """单调递增计数器"""
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self.labelnames, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """累积分桶直方图，附带 _sum 和 _count"""
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # labels -> [各桶计数..., sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-1] += value
+
+    def samples(self):
+        result = []
+        names = self.labelnames + ("le",)
+        with self._lock:
+            items = [(key, list(data)) for key, data in self._values.items()]
+        for key, data in items:
+            for bound, count in zip(self.buckets, data):
+                result.append((f"{self.name}_bucket", names, key + (_format_value(bound),), count))
+            result.append((f"{self.name}_sum", self.labelnames, key, data[-1]))
+            result.append((f"{self.name}_count", self.labelnames, key, data[len(self.buckets) - 1]))
+        return result
+
+
+class CallbackMetric:
+    """抓取时才调用 fn 读取当前值的指标（缓存、队列等状态）
+
+    fn 返回一个数值，或 {标签值元组: 数值} 字典。
+    """
+
+    def __init__(self, name: str, documentation: str, fn, labelnames=(), type="gauge"):
+        self.name = name
+        self.documentation = documentation
+        self.fn = fn
+        self.labelnames = tuple(labelnames)
+        self.type = type
+
+    def samples(self):
+        value = self.fn()
+        if isinstance(value, dict):
+            return [(self.name, self.labelnames, key, v) for key, v in value.items()]
+        return [(self.name, (), (), value)]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames))
+
+    def counter_callback(self, name, documentation, fn, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, fn, labelnames, type="counter"))
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (text/plain; version=0.0.4)"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for metric in metrics:
+            try:
+                samples = metric.samples()
+            except Exception as e:
+                logger.warning(f"读取指标 {metric.name} 失败: {e}")
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labelnames, labelvalues, value in samples:
+                lines.append(f"{name}{_format_labels(labelnames, labelvalues)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "stage_duration_seconds", "各处理阶段耗时", ("stage",))
+STAGE_ERRORS = REGISTRY.counter(
+    "stage_errors_total", "各处理阶段抛出异常的次数", ("stage",))
+HTTP_REQUESTS = REGISTRY.counter(
+    "http_requests_total", "HTTP 请求数", ("endpoint", "method", "status"))
+HTTP_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP 请求处理耗时", ("endpoint",))
+
+
+@contextmanager
+def span(stage: str):
+    """计时一个处理阶段：耗时计入 stage_duration_seconds，并输出 debug 日志"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        logger.debug(f"阶段 {stage} 耗时 {elapsed * 1000:.1f} ms")
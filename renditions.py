@@ -0,0 +1,85 @@
+import uuid
+from dataclasses import dataclass
+
+import cv2
+
+# 输出格式：扩展名、Content-Type、质量参数
+FORMATS = {
+    "jpeg": (".jpg", "image/jpeg", cv2.IMWRITE_JPEG_QUALITY),
+    "webp": (".webp", "image/webp", cv2.IMWRITE_WEBP_QUALITY),
+}
+
+
+@dataclass(frozen=True)
+class Rendition:
+    """一种输出规格：max_width 为 0 表示保持原分辨率"""
+    name: str
+    max_width: int = 0
+    format: str = "jpeg"
+    quality: int = 90
+
+    @property
+    def extension(self) -> str:
+        return FORMATS[self.format][0]
+
+    @property
+    def content_type(self) -> str:
+        return FORMATS[self.format][1]
+
+
+@dataclass
+class EncodedImage:
+    rendition: Rendition
+    data: bytes
+    width: int
+    height: int
+
+
+def parse_renditions(spec: str):
+    """解析 "名称:最大宽度:格式:质量" 的逗号分隔列表，例如 full:0:jpeg:90,preview:480:webp:75"""
+    renditions = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        parts = item.strip().split(":")
+        name = parts[0]
+        max_width = int(parts[1]) if len(parts) > 1 and parts[1] else 0
+        fmt = parts[2].lower() if len(parts) > 2 and parts[2] else "jpeg"
+        quality = int(parts[3]) if len(parts) > 3 and parts[3] else 90
+        if fmt == "jpg":
+            fmt = "jpeg"
+        if fmt not in FORMATS:
+            raise ValueError(f"不支持的图像格式: {fmt}")
+        if not 1 <= quality <= 100:
+            raise ValueError(f"图像质量必须在 1-100 之间: {quality}")
+        renditions.append(Rendition(name, max_width, fmt, quality))
+    if not renditions:
+        raise ValueError("至少需要一种输出规格")
+    if len({r.name for r in renditions}) != len(renditions):
+        raise ValueError("输出规格名称重复")
+    return renditions
+
+
+def new_artifact_id() -> str:
+    """产物ID：同一秒内的并发请求也不会相互覆盖"""
+    return uuid.uuid4().hex[:12]
+
+
+def encode_image(image, rendition: Rendition) -> EncodedImage:
+    """在内存中缩放并编码，不经过临时文件"""
+    h, w = image.shape[:2]
+    if rendition.max_width and w > rendition.max_width:
+        scale = rendition.max_width / w
+        image = cv2.resize(image, (rendition.max_width, max(1, int(round(h * scale)))),
+                           interpolation=cv2.INTER_AREA)
+        h, w = image.shape[:2]
+    extension, _, quality_flag = FORMATS[rendition.format]
+    ok, buffer = cv2.imencode(extension, image, [quality_flag, rendition.quality])
+    if not ok:
+        raise RuntimeError(f"图像编码失败: {rendition.name} ({rendition.format})")
+    return EncodedImage(rendition, buffer.tobytes(), w, h)
+
+
+def encode_renditions(image, renditions):
+    """按配置编码所有规格，返回与 renditions 顺序一致的 EncodedImage 列表"""
+    return [encode_image(image, rendition) for rendition in renditions]
@@ -0,0 +1,253 @@
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from concurrency import Overloaded
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 4xx 中重试可能成功的状态码：请求超时、限流
+RETRYABLE_CLIENT_STATUS = (408, 429)
+
+
+class DeadlineExceeded(Exception):
+    """远程调用超过单次调用的时限（重试后仍超时）"""
+    status = 504
+
+
+class CircuitOpen(Overloaded):
+    """后端连续失败、熔断器打开期间直接拒绝调用，调用方返回 503 并带 Retry-After"""
+    status = 503
+
+
+def http_status(error):
+    """取异常对应的 HTTP 状态码，取不到返回 None
+
+    requests / httpx 异常为 response.status_code，google.api_core 为 code，storage3 为 status（可能是字符串）。
+    """
+    response = getattr(error, "response", None)
+    for value in (getattr(response, "status_code", None), getattr(error, "status_code", None),
+                  getattr(error, "code", None), getattr(error, "status", None)):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def client_error(error) -> bool:
+    """后端以 4xx 拒绝了请求（密钥无效、参数错误等），重试不会成功；408、429 除外"""
+    status = http_status(error)
+    return status is not None and 400 <= status < 500 and status not in RETRYABLE_CLIENT_STATUS
+
+
+def _never(error) -> bool:
+    return False
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后打开，reset_timeout 秒后放行一个探测调用（半开），
+    探测成功则关闭，失败则重新打开"""
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """调用前检查；熔断期间抛出 CircuitOpen"""
+        with self._lock:
+            if self.state == OPEN and time.time() - self.opened_at >= self.reset_timeout:
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            retry_after = max(1, int(self.opened_at + self.reset_timeout - time.time()) + 1)
+        raise CircuitOpen(self.name, f"{self.name} 暂时不可用（熔断中），请稍后重试", retry_after)
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info(f"{self.name} 熔断器关闭，后端已恢复")
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logger.warning(f"{self.name} 熔断器打开：连续失败 {self.failures} 次，{self.reset_timeout:g} 秒内直接拒绝")
+                self.state = OPEN
+                self.opened_at = time.time()
+                self.opens += 1
+                self._probing = False
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = {"state": self.state, "failures": self.failures, "opens": self.opens, "rejected": self.rejected}
+            if self.state == OPEN:
+                data["retry_in"] = round(max(0.0, self.opened_at + self.reset_timeout - time.time()), 1)
+            return data
+
+
+class RemoteCall:
+    """远程后端调用策略：单次时限、带抖动的有界重试、可选的对冲请求和熔断
+
+    调用在该后端专用的有界线程池中执行，请求线程最多等待 timeout 秒；
+    SDK 不支持超时时，卡住的调用只占用池中的线程，不再占住请求线程。
+    开启 hedge 时，若第一次请求超过近期延迟的 p95 仍未返回，再并发发出一次相同请求，
+    取先返回的结果（对冲请求数不超过调用数的 hedge_budget 比例）。
+    no_retry(error) 为真的异常（如 client_error）直接抛出，不重试、不计入熔断。
+    """
+
+    def __init__(self, name: str, timeout: float, retries: int = 0, backoff: float = 0.2,
+                 max_backoff: float = 2.0, breaker: CircuitBreaker = None, hedge: bool = False,
+                 hedge_min_delay: float = 0.05, hedge_budget: float = 0.1, workers: int = 16,
+                 no_retry=None):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = breaker
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_budget = hedge_budget
+        self.no_retry = no_retry or _never
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"call-{name}")
+        self._latencies = deque(maxlen=200)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retried = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def _submit(self, fn, args, kwargs):
+        return self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+    def latency_p95(self):
+        with self._lock:
+            if len(self._latencies) < 20:
+                return None
+            ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def _hedge_delay(self):
+        """距离第一次请求多久发出对冲请求；样本不足或超出预算时返回 None"""
+        if not self.hedge:
+            return None
+        p95 = self.latency_p95()
+        with self._lock:
+            if p95 is None or self.hedged >= self.hedge_budget * self.calls + 1:
+                return None
+        return max(self.hedge_min_delay, p95)
+
+    def _attempt(self, fn, args, kwargs):
+        start = time.perf_counter()
+        futures = [self._submit(fn, args, kwargs)]
+        delay = self._hedge_delay()
+        if delay is not None and delay < self.timeout:
+            done, _ = wait(futures, timeout=delay)
+            if not done:
+                with self._lock:
+                    self.hedged += 1
+                logger.debug(f"{self.name} 调用超过 p95（{delay:.3f} 秒），发出对冲请求")
+                futures.append(self._submit(fn, args, kwargs))
+
+        deadline = start + self.timeout
+        pending = set(futures)
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.perf_counter()),
+                                 return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    with self._lock:
+                        self._latencies.append(time.perf_counter() - start)
+                        if future is not futures[0]:
+                            self.hedge_wins += 1
+                    return future.result()
+                error = future.exception()
+                if self.no_retry(error):
+                    raise error
+        if pending:
+            with self._lock:
+                self.timeouts += 1
+            raise DeadlineExceeded(f"{self.name} 调用超过 {self.timeout:g} 秒未返回")
+        raise error
+
+    def call(self, fn, *args, **kwargs):
+        """按策略执行 fn(*args, **kwargs)；重试用尽后抛出最后一次的异常"""
+        if self.breaker is not None:
+            self.breaker.allow()
+        with self._lock:
+            self.calls += 1
+        for attempt in range(self.retries + 1):
+            try:
+                result = self._attempt(fn, args, kwargs)
+            except Exception as e:
+                if self.no_retry(e):
+                    # 后端正常响应了（如参数错误），不计入熔断
+                    if self.breaker is not None:
+                        self.breaker.record_success()
+                    raise
+                if attempt == self.retries:
+                    with self._lock:
+                        self.failures += 1
+                    if self.breaker is not None:
+                        self.breaker.record_failure()
+                    raise
+                with self._lock:
+                    self.retried += 1
+                # 全抖动退避：多个调用方不会在同一时刻重试
+                delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+                logger.warning(f"{self.name} 调用失败（第 {attempt + 1} 次），{delay:.2f} 秒后重试: {e}")
+                time.sleep(delay)
+            else:
+                if self.breaker is not None:
+                    self.breaker.record_success()
+                return result
+
+    def stats(self) -> dict:
+        p95 = self.latency_p95()
+        with self._lock:
+            data = {
+                "timeout": self.timeout,
+                "retries": self.retries,
+                "hedge": self.hedge,
+                "calls": self.calls,
+                "failures": self.failures,
+                "timeouts": self.timeouts,
+                "retried": self.retried,
+                "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins,
+                "latency_p95": round(p95, 3) if p95 is not None else None,
+            }
+        if self.breaker is not None:
+            data["breaker"] = self.breaker.stats()
+        return data
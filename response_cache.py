@@ -0,0 +1,171 @@
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(value, digits: int = 3):
+    """把请求参数规范化为稳定的 JSON 值：浮点数四舍五入，字典按键排序，字符串合并空白"""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), digits)
+    if isinstance(value, str):
+        return " ".join(value.split())
+    if isinstance(value, dict):
+        return {str(k): normalize(v, digits) for k, v in sorted(value.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v, digits) for v in value]
+    return str(value)
+
+
+def make_key(*parts) -> str:
+    raw = json.dumps([normalize(part) for part in parts], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    """一次进行中的上游调用，相同键的后来者等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.waiters = 0
+
+
+class ResponseCache:
+    """带 TTL 和条目数/字节数上限的响应缓存，并对相同键的并发请求做单飞合并
+
+    get_or_compute 命中缓存时直接返回；未命中时只有第一个请求（leader）调用上游，
+    同时到达的相同请求等待 leader 的结果，而不是各自再发一次。
+    过期的条目在被淘汰前仍保留，上游不可用时可以用 get_stale 取出作为降级结果。
+    leader 失败时错误不缓存，等待者收到同一个异常；retry_on 中的异常（如任务被取消）
+    只属于 leader 本身，等待者会重新竞争成为 leader。
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_items: int = 256, max_bytes: int = 16 * 1024 * 1024,
+                 retry_on=()):
+        self.ttl = ttl_seconds
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.retry_on = tuple(retry_on)
+        self._items = OrderedDict()  # key -> (过期时间, value, size)
+        self._bytes = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _size(value) -> int:
+        return len(json.dumps(value, ensure_ascii=False, default=str).encode("utf-8"))
+
+    def _get_locked(self, key: str):
+        item = self._items.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            return None
+        self._items.move_to_end(key)
+        return item[1]
+
+    def _remove_locked(self, key: str):
+        item = self._items.pop(key, None)
+        if item is not None:
+            self._bytes -= item[2]
+
+    def get(self, key: str):
+        with self._lock:
+            return self._get_locked(key)
+
+    def get_stale(self, key: str):
+        """返回条目（包括已过期的），不存在时返回 None"""
+        with self._lock:
+            item = self._items.get(key)
+            return item[1] if item is not None else None
+
+    def put(self, key: str, value):
+        size = self._size(value)
+        if self.ttl <= 0 or size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove_locked(key)
+            self._items[key] = (time.time() + self.ttl, value, size)
+            self._bytes += size
+            while self._items and (len(self._items) > self.max_items or self._bytes > self.max_bytes):
+                oldest = next(iter(self._items))
+                self._remove_locked(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key: str):
+        with self._lock:
+            self._remove_locked(key)
+
+    def get_or_compute(self, key: str, compute, refresh: bool = False, check=None, poll: float = 1.0):
+        """返回 (value, source)，source 为 "hit" / "miss" / "coalesced"
+
+        refresh 为 True 时跳过缓存读取，但仍与进行中的相同请求合并，结果会更新缓存。
+        check 在等待期间定期调用（如检查任务是否被取消），可以抛出异常结束等待。
+        """
+        while True:
+            with self._lock:
+                if not refresh:
+                    value = self._get_locked(key)
+                    if value is not None:
+                        self.hits += 1
+                        return value, "hit"
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self.misses += 1
+                else:
+                    flight.waiters += 1
+                    self.coalesced += 1
+
+            if leader:
+                try:
+                    value = compute()
+                except BaseException as e:
+                    flight.error = e
+                    raise
+                else:
+                    flight.value = value
+                    self.put(key, value)
+                    return value, "miss"
+                finally:
+                    with self._lock:
+                        self._flights.pop(key, None)
+                    flight.done.set()
+
+            logger.info(f"相同请求正在进行中，等待其结果（共 {flight.waiters} 个等待者）")
+            while not flight.done.wait(timeout=poll):
+                if check is not None:
+                    check()
+            if flight.error is None:
+                return flight.value, "coalesced"
+            if not isinstance(flight.error, self.retry_on):
+                raise flight.error
+            # leader 被取消等：重新查询缓存并竞争成为 leader
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "items": len(self._items),
+                "bytes": self._bytes,
+                "max_items": self.max_items,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "in_flight": len(self._flights),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,313 @@
+import logging
+import os
+import time
+import uuid
+import shutil
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+# 由 ScratchStore 创建或接管的目录中放置该标记文件，只有带标记的目录才会在启动时清理
+MARKER = ".scratch-store"
+
+
+class ScratchFull(Exception):
+    """临时存储配额已满，且剩余文件都在使用中无法淘汰"""
+    status = 507
+
+
+@dataclass
+class ScratchEntry:
+    """一个受管理的临时文件；refs > 0 时正在被请求或任务使用，不会被淘汰"""
+    path: str
+    kind: str
+    size: int
+    last_access: float
+    refs: int = 0
+    on_evict: object = None
+    evicting: bool = False
+
+
+class Reservation:
+    """reserve 预留的空间：写入完成后随 register/update 转为文件大小，或在退出 with 时释放"""
+
+    def __init__(self, store, nbytes: int):
+        self.store = store
+        self.nbytes = nbytes
+        self.active = True
+
+    def _release_locked(self):
+        if self.active:
+            self.active = False
+            self.store._reserved_bytes -= self.nbytes
+            self.store._reserved_files -= 1
+
+    def release(self):
+        with self.store._lock:
+            self._release_locked()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class ScratchStore:
+    """带配额的临时文件存储：视频、分片上传、本地产物和中间文件共用一个字节数和文件数上限
+
+    - 超出配额时按最近最少使用淘汰未被引用的文件，淘汰由文件的所有者（on_evict）完成，
+      使视频会话等内存状态与磁盘保持一致
+    - 写入前用 reserve 预留空间，预留的字节计入用量直到写入完成，并发写入合计也不会超出配额；
+      无法腾出空间时抛出 ScratchFull（调用方返回 507）
+    - 启动时 sweep 清理上次运行残留的文件；只清理由本存储创建（或接管时为空）的目录，
+      其中放有 MARKER 标记文件，避免误删共享目录中的其他文件
+    """
+
+    def __init__(self, root: str, max_bytes: int, max_files: int = 10000, stale_seconds: float = 3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.stale_seconds = stale_seconds
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.rejections = 0
+        self._entries = {}
+        self._reserved_bytes = 0
+        self._reserved_files = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self.owned = self._claim()
+
+    def _claim(self) -> bool:
+        marker = os.path.join(self.root, MARKER)
+        if os.path.exists(marker):
+            return True
+        if os.listdir(self.root):
+            logger.warning(f"临时存储目录 {self.root} 不是由本服务创建的，启动时不做清理")
+            return False
+        open(marker, "w").close()
+        return True
+
+    def directory(self, name: str) -> str:
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _usage(self):
+        return (sum(e.size for e in self._entries.values()) + self._reserved_bytes,
+                len(self._entries) + self._reserved_files)
+
+    def register(self, path: str, kind: str, on_evict=None, refs: int = 0, size: int = None,
+                 reservation: Reservation = None):
+        """登记一个已写入的文件（视为最近使用），随后按配额淘汰其他文件；同时释放写入前的预留"""
+        if size is None:
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+        with self._lock:
+            self._entries[path] = ScratchEntry(path, kind, size, time.time(), refs, on_evict)
+            if reservation is not None:
+                reservation._release_locked()
+        self._evict(0, exclude=path)
+
+    def unregister(self, path: str):
+        """文件已被所有者删除或移走"""
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def update(self, path: str, size: int, reservation: Reservation = None):
+        """文件大小变化（如分片上传追加写入）；同时释放写入前的预留"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                entry.size = size
+                entry.last_access = time.time()
+            if reservation is not None:
+                reservation._release_locked()
+
+    def touch(self, path: str):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                entry.last_access = time.time()
+
+    def acquire(self, path: str) -> bool:
+        """增加引用，文件在释放前不会被淘汰；文件已被淘汰时返回 False"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or entry.evicting:
+                return False
+            entry.refs += 1
+            entry.last_access = time.time()
+            return True
+
+    def release(self, path: str):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.refs > 0:
+                entry.refs -= 1
+                entry.last_access = time.time()
+
+    def reserve(self, nbytes: int, exclude: str = None) -> Reservation:
+        """为即将写入的 nbytes 字节腾出空间并预留，腾不出时抛出 ScratchFull
+
+        返回的 Reservation 在写入完成后传给 register/update，或用 with 在结束时释放。
+        """
+        reservation = Reservation(self, nbytes)
+        if not self._evict(nbytes, exclude=exclude, new_files=1, book=reservation):
+            with self._lock:
+                self.rejections += 1
+                used, files = self._usage()
+            raise ScratchFull(f"临时存储空间不足：已用 {used}/{self.max_bytes} 字节，"
+                              f"{files}/{self.max_files} 个文件，需要 {nbytes} 字节")
+        return reservation
+
+    def _evict(self, nbytes: int, exclude: str = None, new_files: int = 0, book: Reservation = None) -> bool:
+        """按最近最少使用淘汰未被引用的文件，直到满足配额；返回是否满足
+
+        给出 book 时在满足配额的同一临界区内记入预留，避免并发的检查都通过后合计超出配额。
+        """
+        while True:
+            with self._lock:
+                used, files = self._usage()
+                if used + nbytes <= self.max_bytes and files + new_files <= self.max_files:
+                    if book is not None:
+                        self._reserved_bytes += nbytes
+                        self._reserved_files += new_files
+                    return True
+                candidates = [e for e in self._entries.values()
+                              if e.refs == 0 and not e.evicting and e.path != exclude]
+                if not candidates:
+                    logger.warning(f"临时存储超出配额且没有可淘汰的文件: {used} 字节, {files} 个文件")
+                    return False
+                victim = min(candidates, key=lambda e: e.last_access)
+                victim.evicting = True
+                self.evictions += 1
+                self.evicted_bytes += victim.size
+
+            logger.info(f"临时存储淘汰 {victim.kind}: {os.path.basename(victim.path)} ({victim.size} 字节)")
+            self._delete(victim)
+
+    def _delete(self, entry: ScratchEntry):
+        """由所有者（on_evict）或直接删除文件，并取消登记"""
+        try:
+            if entry.on_evict is not None:
+                entry.on_evict()
+            elif os.path.exists(entry.path):
+                os.remove(entry.path)
+        except Exception as e:
+            logger.warning(f"删除临时文件时出错: {e}")
+        self.unregister(entry.path)
+
+    @contextmanager
+    def hold(self, path: str):
+        acquired = self.acquire(path)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                self.release(path)
+
+    def new_temp(self, suffix: str = "", kind: str = "tmp") -> str:
+        """分配一个中间文件路径：使用期间不可淘汰，用完后必须调用 discard"""
+        path = os.path.join(self.directory("tmp"), f"{uuid.uuid4().hex}{suffix}")
+        with self._lock:
+            self._entries[path] = ScratchEntry(path, kind, 0, time.time(), refs=1)
+        return path
+
+    def discard(self, path: str):
+        """删除中间文件并取消登记"""
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除临时文件时出错: {e}")
+        self.unregister(path)
+
+    @contextmanager
+    def temp_file(self, suffix: str = "", kind: str = "tmp"):
+        """请求内使用的中间文件，结束后（包括异常）一定删除"""
+        path = self.new_temp(suffix, kind)
+        try:
+            yield path
+        finally:
+            self.discard(path)
+
+    def sweep(self, adopt=None, keep=()):
+        """启动时清理上次运行残留的文件
+
+        adopt 为 {子目录: 类型}，其中未过期的文件重新登记（如本地产物，链接可能仍在使用），
+        keep 中的子目录自行管理（如检测缓存），不做处理；其余文件（没有对应会话的视频、
+        未完成的分片、中间文件）全部删除。目录不带标记文件时不做任何处理。
+        """
+        adopt = adopt or {}
+        now = time.time()
+        removed, removed_bytes, adopted = 0, 0, 0
+        if not self.owned:
+            return {"removed": removed, "removed_bytes": removed_bytes, "adopted": adopted}
+        for name in os.listdir(self.root):
+            if name in keep or name == MARKER:
+                continue
+            top = os.path.join(self.root, name)
+            for dirpath, _, filenames in os.walk(top) if os.path.isdir(top) else [(self.root, [], [name])]:
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                        if name in adopt and now - stat.st_mtime < self.stale_seconds and not filename.endswith(".tmp"):
+                            with self._lock:
+                                self._entries[path] = ScratchEntry(path, adopt[name], stat.st_size, stat.st_mtime)
+                            adopted += 1
+                            continue
+                        os.remove(path)
+                        removed += 1
+                        removed_bytes += stat.st_size
+                    except OSError as e:
+                        logger.warning(f"清理残留文件时出错: {e}")
+        if removed or adopted:
+            logger.info(f"临时存储启动清理: 删除 {removed} 个残留文件（{removed_bytes} 字节），保留 {adopted} 个产物")
+        self._evict(0)
+        return {"removed": removed, "removed_bytes": removed_bytes, "adopted": adopted}
+
+    def cleanup(self, keep=()):
+        """进程退出时删除本进程登记的文件（keep 中的类型除外，如仍可能被访问的产物），
+        目录中的其他文件不做处理"""
+        with self._lock:
+            entries = [e for e in self._entries.values() if e.kind not in keep and not e.evicting]
+            for entry in entries:
+                entry.evicting = True
+        for entry in entries:
+            self._delete(entry)
+        return len(entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            used, files = self._usage()
+            kinds = {}
+            pinned = 0
+            for entry in self._entries.values():
+                kind = kinds.setdefault(entry.kind, {"files": 0, "bytes": 0})
+                kind["files"] += 1
+                kind["bytes"] += entry.size
+                if entry.refs > 0:
+                    pinned += entry.size
+            data = {
+                "root": self.root,
+                "bytes": used,
+                "files": files,
+                "max_bytes": self.max_bytes,
+                "max_files": self.max_files,
+                "pinned_bytes": pinned,
+                "reserved_bytes": self._reserved_bytes,
+                "kinds": kinds,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+                "rejections": self.rejections,
+            }
+        try:
+            disk = shutil.disk_usage(self.root)
+            data["disk"] = {"total": disk.total, "used": disk.used, "free": disk.free}
+        except OSError:
+            pass
+        return data
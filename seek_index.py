@@ -0,0 +1,165 @@
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# PyAV 为可选依赖：不可用时不建立索引，调用方退回 OpenCV 的时间定位
+try:
+    import av
+except Exception as e:
+    logger.warning(f"PyAV导入失败，将不使用关键帧索引: {e}")
+    av = None
+
+INDEX_SUFFIX = ".seekidx.npz"
+
+
+@dataclass
+class SeekIndex:
+    """视频的帧级定位索引（按显示顺序）
+
+    帧号 → pts / 秒 → 最近的前一个关键帧（帧号与其数据包的字节偏移）
+    """
+    pts: np.ndarray           # int64, 每帧的 pts
+    times: np.ndarray         # float64, 每帧相对视频起点的秒数
+    keyframe: np.ndarray      # int64, 每帧对应的最近前置关键帧帧号
+    byte_offset: np.ndarray   # int64, 每帧数据包在文件中的字节偏移，未知为 -1
+    fps: float
+
+    @property
+    def total_frames(self) -> int:
+        return len(self.pts)
+
+    @property
+    def duration(self) -> float:
+        return self.total_frames / self.fps if self.fps > 0 else 0.0
+
+    def frame_for_time(self, seconds: float) -> int:
+        """返回显示时间最接近 seconds 的帧号"""
+        if self.total_frames == 0:
+            return 0
+        right = int(np.searchsorted(self.times, seconds, side="left"))
+        if right <= 0:
+            return 0
+        if right >= self.total_frames:
+            return self.total_frames - 1
+        left = right - 1
+        return left if seconds - self.times[left] <= self.times[right] - seconds else right
+
+    def keyframe_for(self, frame_index: int) -> int:
+        return int(self.keyframe[frame_index])
+
+    def save(self, path: str):
+        # 先写临时文件再替换，避免并发读取到写了一半的索引
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, pts=self.pts, times=self.times, keyframe=self.keyframe,
+                 byte_offset=self.byte_offset, fps=np.float64(self.fps))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "SeekIndex":
+        with np.load(path) as data:
+            return cls(
+                pts=data["pts"],
+                times=data["times"],
+                keyframe=data["keyframe"],
+                byte_offset=data["byte_offset"],
+                fps=float(data["fps"]),
+            )
+
+
+def build_seek_index(video_path: str) -> SeekIndex:
+    """只解复用不解码，扫描一次视频流的数据包建立索引"""
+    with av.open(video_path) as container:
+        stream = container.streams.video[0]
+        pts, is_key, offsets = [], [], []
+        for packet in container.demux(stream):
+            if packet.pts is None:
+                continue
+            pts.append(packet.pts)
+            is_key.append(packet.is_keyframe)
+            offsets.append(packet.pos if packet.pos is not None else -1)
+
+        time_base = float(stream.time_base)
+        fps = float(stream.average_rate or stream.guessed_rate or 0)
+        start = stream.start_time
+
+    # 数据包按解码顺序给出，存在B帧时需按 pts 重排为显示顺序
+    pts = np.asarray(pts, dtype=np.int64)
+    order = np.argsort(pts, kind="stable")
+    pts = pts[order]
+    is_key = np.asarray(is_key, dtype=bool)[order]
+    offsets = np.asarray(offsets, dtype=np.int64)[order]
+
+    if start is None:
+        start = int(pts[0]) if len(pts) else 0
+    times = (pts - start) * time_base
+
+    # 每帧对应的最近前置关键帧：关键帧位置取自身帧号，其余取前缀最大值
+    frame_numbers = np.arange(len(pts), dtype=np.int64)
+    keyframe = np.maximum.accumulate(np.where(is_key, frame_numbers, 0)) if len(pts) else frame_numbers
+
+    return SeekIndex(pts=pts, times=times, keyframe=keyframe, byte_offset=offsets, fps=fps)
+
+
+_index_cache = {}
+_index_building = {}  # 正在建立索引的视频路径 -> Future，同一视频只建立一次
+_index_lock = threading.Lock()
+
+
+def _load_or_build(video_path: str):
+    index_path = video_path + INDEX_SUFFIX
+    try:
+        if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(video_path):
+            return SeekIndex.load(index_path)
+        index = build_seek_index(video_path)
+        index.save(index_path)
+        logger.debug(f"已建立定位索引: {index.total_frames} 帧, 关键帧 {len(np.unique(index.keyframe))} 个")
+        return index
+    except Exception as e:
+        logger.warning(f"建立定位索引失败，退回普通定位: {e}")
+        return None
+
+
+def get_seek_index(video_path: str, run=None):
+    """获取视频的定位索引：内存缓存 → 视频旁的索引文件 → 重新扫描建立
+
+    同一视频的并发请求只建立一次索引，其余请求等待其结果。
+    run 用于执行加载/扫描（如 CPU 线程池的 run），默认在当前线程执行；
+    已在 CPU 线程池中运行的代码不要再传入池的 run，以免等待自身所在的池。
+    PyAV 不可用或视频无法解析时返回 None
+    """
+    if av is None:
+        return None
+
+    with _index_lock:
+        index = _index_cache.get(video_path)
+        if index is not None:
+            return index
+        future = _index_building.get(video_path)
+        leader = future is None
+        if leader:
+            future = _index_building[video_path] = Future()
+    if not leader:
+        return future.result()
+
+    index = None
+    try:
+        index = run(_load_or_build, video_path) if run is not None else _load_or_build(video_path)
+    finally:
+        with _index_lock:
+            if index is not None:
+                _index_cache[video_path] = index
+            _index_building.pop(video_path, None)
+        future.set_result(index)
+    return index
+
+
+def forget_seek_index(video_path: str):
+    """视频被删除时清除内存中的索引"""
+    with _index_lock:
+        _index_cache.pop(video_path, None)
@@ -0,0 +1,172 @@
+import time
+import random
+import logging
+import threading
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# 服务状态
+PENDING = "pending"
+INITIALIZING = "initializing"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+class ServiceUnavailable(Exception):
+    """服务未配置、尚未初始化完成或初始化失败"""
+
+    def __init__(self, name: str, state: str, error: str = None):
+        message = f"服务 {name} 不可用（{state}）"
+        if error:
+            message += f": {error}"
+        super().__init__(message)
+        self.name = name
+        self.state = state
+
+
+@dataclass
+class Service:
+    """一个外部依赖：factory 返回客户端对象，返回 None 表示未配置"""
+    name: str
+    factory: object
+    required: bool = True
+    state: str = PENDING
+    value: object = None
+    error: str = None
+    attempts: int = 0
+    ready_at: float = None
+    next_retry: float = 0.0
+    init_seconds: float = None
+    background: bool = False
+    cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    def to_dict(self) -> dict:
+        data = {"state": self.state, "required": self.required, "attempts": self.attempts}
+        if self.init_seconds is not None:
+            data["init_seconds"] = round(self.init_seconds, 3)
+        if self.error:
+            data["error"] = self.error
+        return data
+
+
+class ServiceRegistry:
+    """按需或在后台初始化外部服务客户端，失败时按指数退避重试
+
+    启动时不再同步等待网络调用：warmup 在后台线程中初始化各服务，
+    请求到来时 get 最多等待 wait 秒，仍未就绪则抛出 ServiceUnavailable。
+    """
+
+    def __init__(self, backoff: float = 1.0, max_backoff: float = 60.0):
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._services = {}
+
+    def register(self, name: str, factory, required: bool = True):
+        self._services[name] = Service(name=name, factory=factory, required=required)
+
+    def provide(self, name: str, value, required: bool = None):
+        """直接设置一个已就绪的服务（用于基准测试替身等场景）"""
+        service = self._services.get(name)
+        if service is None:
+            service = self._services[name] = Service(name=name, factory=None,
+                                                     required=bool(required))
+        with service.cond:
+            service.value = value
+            service.state = READY if value is not None else DISABLED
+            service.error = None
+            service.ready_at = time.time()
+            if required is not None:
+                service.required = required
+            service.cond.notify_all()
+
+    def _delay(self, attempts: int) -> float:
+        return min(self.max_backoff, self.backoff * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+
+    def _initialize(self, service: Service) -> bool:
+        """执行一次初始化，返回是否已结束（就绪或未配置）"""
+        with service.cond:
+            if service.state in (READY, DISABLED, INITIALIZING):
+                return service.state != INITIALIZING
+            service.state = INITIALIZING
+            service.attempts += 1
+
+        start = time.perf_counter()
+        try:
+            value = service.factory()
+        except Exception as e:
+            delay = self._delay(service.attempts)
+            logger.warning(f"服务 {service.name} 初始化失败（第 {service.attempts} 次），{delay:.1f} 秒后重试: {e}")
+            with service.cond:
+                service.state = FAILED
+                service.error = str(e)
+                service.next_retry = time.time() + delay
+                service.cond.notify_all()
+            return False
+
+        with service.cond:
+            service.init_seconds = time.perf_counter() - start
+            service.value = value
+            service.error = None
+            if value is None:
+                service.state = DISABLED
+                logger.warning(f"服务 {service.name} 未配置，已禁用")
+            else:
+                service.state = READY
+                service.ready_at = time.time()
+                logger.info(f"服务 {service.name} 已就绪，耗时 {service.init_seconds:.2f} 秒")
+            service.cond.notify_all()
+        return True
+
+    def _warm(self, service: Service):
+        while not self._initialize(service):
+            with service.cond:
+                if service.state == INITIALIZING:
+                    # 其他线程（按需初始化）正在进行，等它结束
+                    service.cond.wait(timeout=1.0)
+                    continue
+                wait = max(0.0, service.next_retry - time.time())
+            time.sleep(wait)
+
+    def warmup(self):
+        """为每个服务启动后台初始化线程，不阻塞调用方"""
+        for service in self._services.values():
+            if service.factory is not None and service.state == PENDING:
+                service.background = True
+                threading.Thread(target=self._warm, args=(service,),
+                                 name=f"warmup-{service.name}", daemon=True).start()
+
+    def get(self, name: str, wait: float = 0.0):
+        """返回就绪的客户端；正在初始化时最多等待 wait 秒
+
+        没有后台预热的服务在调用方线程中初始化，失败后到了重试时间才会再次尝试。
+        """
+        service = self._services[name]
+        if service.state == READY:
+            return service.value
+
+        if not service.background and (
+                service.state == PENDING or (service.state == FAILED and time.time() >= service.next_retry)):
+            self._initialize(service)
+
+        with service.cond:
+            if service.state == INITIALIZING and wait > 0:
+                service.cond.wait_for(lambda: service.state != INITIALIZING, timeout=wait)
+            if service.state == READY:
+                return service.value
+            raise ServiceUnavailable(name, service.state, service.error)
+
+    def state(self, name: str) -> str:
+        return self._services[name].state
+
+    def peek(self, name: str):
+        """不触发初始化，返回已就绪的客户端或 None"""
+        service = self._services.get(name)
+        return service.value if service is not None and service.state == READY else None
+
+    def ready(self) -> bool:
+        return all(s.state == READY for s in self._services.values() if s.required)
+
+    def status(self) -> dict:
+        return {name: service.to_dict() for name, service in self._services.items()}
@@ -0,0 +1,161 @@
+import logging
+import os
+import time
+import random
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+class SupabaseStorage:
+    """Supabase Storage 后端：复用同一个客户端（及其 HTTP 连接池），单次请求覆盖写入
+
+    client_provider 在首次上传时才被调用，客户端尚未就绪时抛出的异常由上传重试处理。
+    call(fn, **kwargs) 执行上传请求（超时、熔断等策略），默认直接调用。
+    """
+    name = "supabase"
+
+    def __init__(self, client_provider, bucket: str, base_url: str, call=None):
+        self.client_provider = client_provider
+        self.bucket_name = bucket
+        self.base_url = base_url
+        self.call = call
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        if self._bucket is None:
+            self._bucket = self.client_provider().storage.from_(self.bucket_name)
+        return self._bucket
+
+    def upload(self, path: str, data: bytes, content_type: str):
+        # upsert 代替先 remove 再 upload，省去一次往返
+        upload = self.bucket.upload
+        options = {"content-type": content_type, "upsert": "true"}
+        if self.call is not None:
+            self.call(upload, path=path, file=data, file_options=options)
+        else:
+            upload(path=path, file=data, file_options=options)
+
+    def public_url(self, path: str) -> str:
+        return f"{self.base_url}/storage/v1/object/public/{self.bucket_name}/{path}"
+
+
+class LocalStorage:
+    """本地目录存储：无需外部服务，用于开发测试和离线部署，文件通过 /artifacts 路由访问
+
+    给出 scratch 时产物计入临时存储配额，空间不足时淘汰最久未访问的产物。
+    """
+    name = "local"
+
+    def __init__(self, root: str, base_url: str = "", scratch=None):
+        self.root = root
+        self.base_url = base_url
+        self.scratch = scratch
+        os.makedirs(root, exist_ok=True)
+
+    def local_path(self, path: str) -> str:
+        full_path = os.path.normpath(os.path.join(self.root, path))
+        if not full_path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"非法的存储路径: {path}")
+        return full_path
+
+    def upload(self, path: str, data: bytes, content_type: str):
+        full_path = self.local_path(path)
+        if self.scratch is None:
+            self._write(full_path, data)
+            return
+        with self.scratch.reserve(len(data), exclude=full_path) as reservation:
+            self._write(full_path, data)
+            self.scratch.register(full_path, "artifact", size=len(data), reservation=reservation)
+
+    @staticmethod
+    def _write(full_path: str, data: bytes):
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        tmp_path = f"{full_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, full_path)
+
+    def public_url(self, path: str) -> str:
+        return f"{self.base_url}/artifacts/{path}"
+
+
+class ArtifactUploader:
+    """后台上传分析产物（标注图、分析文本）
+
+    submit 立即返回确定的公共URL，上传在线程池中带重试执行；
+    上传完成前内容保留在内存中，可由本地路由直接提供。
+    no_retry(error) 为真的失败（如存储拒绝请求）不再重试。
+    """
+
+    def __init__(self, storage, max_workers: int = 4, retries: int = 3,
+                 backoff: float = 0.5, keep_failed: int = 64, no_retry=None):
+        self.storage = storage
+        self.retries = retries
+        self.backoff = backoff
+        self.keep_failed = keep_failed
+        self.no_retry = no_retry
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upload")
+        self._pending = {}            # path -> (data, content_type)
+        self._failed = OrderedDict()  # 重试仍失败的产物，保留最近若干个以便本地访问
+        self._lock = threading.Lock()
+        self.uploaded = 0
+        self.failed = 0
+        self.retried = 0
+
+    def submit(self, path: str, data: bytes, content_type: str) -> str:
+        with self._lock:
+            self._pending[path] = (data, content_type)
+            self._failed.pop(path, None)
+        self._executor.submit(contextvars.copy_context().run, self._upload, path, data, content_type)
+        return self.storage.public_url(path)
+
+    def _upload(self, path: str, data: bytes, content_type: str):
+        for attempt in range(self.retries + 1):
+            try:
+                with span("artifact_upload"):
+                    self.storage.upload(path, data, content_type)
+            except Exception as e:
+                if attempt == self.retries or (self.no_retry and self.no_retry(e)):
+                    logger.error(f"上传失败（已重试 {attempt} 次）: {path}: {e}")
+                    with self._lock:
+                        self.failed += 1
+                        if self._pending.get(path, (None,))[0] is data:
+                            del self._pending[path]
+                            self._failed[path] = (data, content_type)
+                            while len(self._failed) > self.keep_failed:
+                                self._failed.popitem(last=False)
+                    return
+                with self._lock:
+                    self.retried += 1
+                # 指数退避加随机抖动，避免多个上传同时重试
+                time.sleep(self.backoff * (2 ** attempt) * random.uniform(0.5, 1.5))
+            else:
+                with self._lock:
+                    self.uploaded += 1
+                    # 同一路径可能已被新内容覆盖提交，只移除本次上传的内容
+                    if self._pending.get(path, (None,))[0] is data:
+                        del self._pending[path]
+                return
+
+    def get_local(self, path: str):
+        """返回尚未上传完成（或上传失败）的产物 (data, content_type)，否则 None"""
+        with self._lock:
+            return self._pending.get(path) or self._failed.get(path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "backend": self.storage.name,
+                "pending": len(self._pending),
+                "pending_bytes": sum(len(data) for data, _ in self._pending.values()),
+                "uploaded": self.uploaded,
+                "failed": self.failed,
+                "retried": self.retried,
+            }
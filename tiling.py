@@ -0,0 +1,234 @@
+import threading
+
+import cv2
+import numpy as np
+
+from detectors import Detector
+from tracking import iou_matrix
+
+BALL_CLASS = "ball"
+CANDIDATE_CLASS = "_candidate"
+# 缩略图中球的候选点：白色顶帽变换后亮且小而紧凑的斑点（草皮上的球在缩小后往往低于模型的检测阈值）
+CANDIDATE_KERNEL = 11
+CANDIDATE_MIN_CONTRAST = 40
+# 贴着切片内部边缘（而非画面边缘）的框通常是被截断的目标，由相邻切片或缩略图中的完整框代替
+EDGE_MARGIN = 2
+
+
+def predictions_to_arrays(predictions):
+    """检测结果列表转为 (N×4 的 x1,y1,x2,y2, 置信度, 类别名)"""
+    if not predictions:
+        return np.zeros((0, 4), dtype=np.float32), np.zeros(0, dtype=np.float32), np.zeros(0, dtype=object)
+    data = np.array([[p["x"], p["y"], p["width"], p["height"], p["confidence"]] for p in predictions],
+                    dtype=np.float32)
+    boxes = np.column_stack([data[:, 0] - data[:, 2] / 2, data[:, 1] - data[:, 3] / 2,
+                             data[:, 0] + data[:, 2] / 2, data[:, 1] + data[:, 3] / 2])
+    return boxes, data[:, 4], np.array([p["class"] for p in predictions], dtype=object)
+
+
+def nms(boxes: np.ndarray, scores: np.ndarray, classes, iou_threshold: float) -> np.ndarray:
+    """按类别的非极大值抑制，返回保留框的下标（按置信度降序）
+
+    一次算出同类框两两之间的 IoU 矩阵，再按置信度顺序逐行屏蔽被抑制的框。
+    """
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=int)
+    order = np.argsort(-scores, kind="stable")
+    boxes, classes = boxes[order], np.asarray(classes)[order]
+    overlap = iou_matrix(boxes, boxes) > iou_threshold
+    overlap &= classes[:, None] == classes[None, :]
+    keep = np.ones(len(boxes), dtype=bool)
+    for i in range(len(boxes)):
+        if keep[i]:
+            keep[i + 1:] &= ~overlap[i, i + 1:]
+    return order[keep]
+
+
+def ball_candidates(image, max_candidates: int = 2) -> np.ndarray:
+    """在缩略图中找出最像球的小亮斑，返回 (K×4 的 x1,y1,x2,y2)，按对比度降序"""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (CANDIDATE_KERNEL, CANDIDATE_KERNEL))
+    tophat = cv2.morphologyEx(gray, cv2.MORPH_TOPHAT, kernel)
+    mask = (tophat >= CANDIDATE_MIN_CONTRAST).astype(np.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask)
+    if count <= 1:
+        return np.zeros((0, 4), dtype=np.float32)
+    stats = stats[1:]
+    w, h, area = stats[:, cv2.CC_STAT_WIDTH], stats[:, cv2.CC_STAT_HEIGHT], stats[:, cv2.CC_STAT_AREA]
+    # 比结构元素小、接近圆形、填充率高：排除边线、球衣条纹等细长亮区
+    compact = ((w < CANDIDATE_KERNEL) & (h < CANDIDATE_KERNEL) & (area >= 2)
+               & (np.maximum(w, h) <= 2 * np.minimum(w, h)) & (area >= 0.5 * w * h))
+    index = np.flatnonzero(compact)
+    if len(index) == 0:
+        return np.zeros((0, 4), dtype=np.float32)
+    peak = np.zeros(count, dtype=np.float32)
+    np.maximum.at(peak, labels.ravel(), tophat.ravel().astype(np.float32))
+    index = index[np.argsort(-peak[index + 1])][:max_candidates]
+    x, y = stats[index, cv2.CC_STAT_LEFT], stats[index, cv2.CC_STAT_TOP]
+    return np.column_stack([x, y, x + w[index], y + h[index]]).astype(np.float32)
+
+
+def select_tiles(boxes: np.ndarray, classes, width: int, height: int, tile: int, max_tiles: int):
+    """在缩略图检测结果周围选取全分辨率切片，返回 [(x1, y1, x2, y2)]
+
+    依次以检测到的球、球的候选点、球员为中心贪心覆盖：已落在某个切片内的目标不再新增切片。
+    """
+    tile_w, tile_h = min(tile, width), min(tile, height)
+    classes = np.asarray(classes)
+    priority = np.where(classes == BALL_CLASS, 0, np.where(classes == CANDIDATE_CLASS, 1, 2))
+    centers = np.column_stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2])
+    # 同一优先级内按离画面中心的距离排序，优先覆盖比赛集中的区域
+    distance = np.hypot(centers[:, 0] - width / 2, centers[:, 1] - height / 2)
+    order = np.lexsort((distance, priority))
+
+    tiles = []
+    covered = np.zeros(len(boxes), dtype=bool)
+    for i in order:
+        if len(tiles) >= max_tiles:
+            break
+        if covered[i]:
+            continue
+        cx, cy = centers[i]
+        x1 = int(np.clip(cx - tile_w / 2, 0, width - tile_w))
+        y1 = int(np.clip(cy - tile_h / 2, 0, height - tile_h))
+        tiles.append((x1, y1, x1 + tile_w, y1 + tile_h))
+        covered |= ((centers[:, 0] >= x1 + EDGE_MARGIN) & (centers[:, 0] <= x1 + tile_w - EDGE_MARGIN)
+                    & (centers[:, 1] >= y1 + EDGE_MARGIN) & (centers[:, 1] <= y1 + tile_h - EDGE_MARGIN))
+    return tiles
+
+
+def truncated_mask(boxes: np.ndarray, tile, width: int, height: int) -> np.ndarray:
+    """切片坐标系下贴着切片内部边缘的框"""
+    x1, y1, x2, y2 = tile
+    mask = np.zeros(len(boxes), dtype=bool)
+    if x1 > 0:
+        mask |= boxes[:, 0] <= EDGE_MARGIN
+    if y1 > 0:
+        mask |= boxes[:, 1] <= EDGE_MARGIN
+    if x2 < width:
+        mask |= boxes[:, 2] >= (x2 - x1) - EDGE_MARGIN
+    if y2 < height:
+        mask |= boxes[:, 3] >= (y2 - y1) - EDGE_MARGIN
+    return mask
+
+
+class TiledDetector(Detector):
+    """缩略图 + 局部高分辨率切片的检测模式，提高小目标（球）的召回率
+
+    1. 整帧缩小到 coarse_width 后检测一次，得到球员和球的大致位置；
+    2. 在这些位置（以及缩略图中未检出球时的球候选点）周围裁出最多 max_tiles 个
+       tile×tile 的原分辨率切片，所有帧的切片作为一批检测；
+    3. 切片结果映射回原图坐标，与缩略图结果一起做按类别的 NMS 合并。
+
+    1080p 画面按默认参数发送的像素量约为原分辨率整帧的 60%，且球的召回率接近整帧检测。
+    """
+
+    def __init__(self, inner: Detector, tile: int = 480, coarse_width: int = 960, max_tiles: int = 3):
+        super().__init__(inner.confidence, inner.overlap)
+        self.inner = inner
+        self.tile = tile
+        self.coarse_width = coarse_width
+        self.max_tiles = max_tiles
+        self.name = inner.name
+        self.model_id = f"{inner.model_id}@tiled{tile}x{max_tiles}c{coarse_width}"
+        self.model_version = inner.model_version
+        self.frames = 0
+        self.tiles = 0
+        self.pixels = 0
+        self._lock = threading.Lock()
+
+    def _count(self, frames: int, tiles: int, pixels: int):
+        with self._lock:
+            self.frames += frames
+            self.tiles += tiles
+            self.pixels += pixels
+
+    def predict(self, frames):
+        if not frames:
+            return []
+
+        # 第一遍：缩略图
+        coarse_images, scales = [], []
+        for frame in frames:
+            h, w = frame.shape[:2]
+            scale = min(1.0, self.coarse_width / w)
+            if scale < 1.0:
+                frame = cv2.resize(frame, (self.coarse_width, int(round(h * scale))), interpolation=cv2.INTER_AREA)
+            coarse_images.append(frame)
+            scales.append(scale)
+        coarse = self.inner.predict(coarse_images)
+
+        # 第二遍：所有帧的切片合成一批
+        merged = []
+        tile_images, tile_owners = [], []
+        for index, (frame, scale, result) in enumerate(zip(frames, scales, coarse)):
+            h, w = frame.shape[:2]
+            boxes, scores, classes = predictions_to_arrays(result.get("predictions", []))
+            boxes /= scale
+            merged.append([boxes, scores, classes])
+            if scale >= 1.0:
+                continue  # 缩略图即原分辨率，不需要切片
+            targets, target_classes = boxes, classes
+            if BALL_CLASS not in classes:
+                candidates = ball_candidates(coarse_images[index]) / scale
+                targets = np.concatenate([boxes, candidates])
+                target_classes = np.concatenate([classes, np.full(len(candidates), CANDIDATE_CLASS, dtype=object)])
+            if len(targets) == 0:
+                continue
+            for tile in select_tiles(targets, target_classes, w, h, self.tile, self.max_tiles):
+                x1, y1, x2, y2 = tile
+                tile_images.append(np.ascontiguousarray(frame[y1:y2, x1:x2]))
+                tile_owners.append((index, tile))
+
+        tile_results = self.inner.predict(tile_images) if tile_images else []
+        for (index, tile), result in zip(tile_owners, tile_results):
+            h, w = frames[index].shape[:2]
+            boxes, scores, classes = predictions_to_arrays(result.get("predictions", []))
+            keep = ~truncated_mask(boxes, tile, w, h)
+            boxes = boxes[keep] + np.array([tile[0], tile[1], tile[0], tile[1]], dtype=np.float32)
+            parts = merged[index]
+            parts[0] = np.concatenate([parts[0], boxes])
+            parts[1] = np.concatenate([parts[1], scores[keep]])
+            parts[2] = np.concatenate([parts[2], classes[keep]])
+
+        self._count(len(frames), len(tile_images),
+                    sum(image.shape[0] * image.shape[1] for image in coarse_images + tile_images))
+
+        results = []
+        class_ids = self._class_ids(coarse + tile_results)
+        for frame, (boxes, scores, classes) in zip(frames, merged):
+            h, w = frame.shape[:2]
+            predictions = []
+            for i in nms(boxes, scores, classes, self.overlap / 100):
+                x1, y1, x2, y2 = np.clip(boxes[i], 0, [w, h, w, h])
+                prediction = {
+                    "x": float((x1 + x2) / 2),
+                    "y": float((y1 + y2) / 2),
+                    "width": float(x2 - x1),
+                    "height": float(y2 - y1),
+                    "confidence": float(scores[i]),
+                    "class": classes[i],
+                }
+                if classes[i] in class_ids:
+                    prediction["class_id"] = class_ids[classes[i]]
+                predictions.append(prediction)
+            results.append({"predictions": predictions, "image": {"width": w, "height": h}})
+        return results
+
+    @staticmethod
+    def _class_ids(results) -> dict:
+        return {p["class"]: p["class_id"] for result in results
+                for p in result.get("predictions", []) if "class_id" in p}
+
+    def describe(self) -> dict:
+        with self._lock:
+            stats = {"frames": self.frames, "tiles": self.tiles, "pixels": self.pixels}
+        return {
+            **self.inner.describe(),
+            "model_id": self.model_id,
+            "mode": "tiled",
+            "tile": self.tile,
+            "coarse_width": self.coarse_width,
+            "max_tiles": self.max_tiles,
+            **stats,
+        }
@@ -0,0 +1,287 @@
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+import cv2
+import numpy as np
+
+# 参与跟踪的类别；球体积小、移动快，只在检测帧上报告位置
+TRACK_CLASSES = ("player", "goalkeeper", "referee")
+# 光流在缩小后的灰度图上计算
+FLOW_WIDTH = 640
+# 每个框内均匀采样 GRID x GRID 个点做光流，取位移中位数
+FLOW_GRID = 4
+MIN_FLOW_POINTS = 3
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=2,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+
+@dataclass
+class Track:
+    """一名球员（或裁判）在时间范围内的轨迹"""
+    track_id: int
+    class_name: str
+    box: np.ndarray
+    hits: int = 1
+    misses: int = 0
+    points: list = field(default_factory=list)
+
+    @property
+    def label(self) -> str:
+        return f"T{self.track_id}"
+
+    def record(self, frame_index: int, time_s: float, source: str):
+        x1, y1, x2, y2 = (int(round(v)) for v in self.box)
+        self.points.append({
+            "frame_index": frame_index,
+            "time": round(time_s, 3),
+            "bbox": [x1, y1, x2, y2],
+            "center": [(x1 + x2) // 2, (y1 + y2) // 2],
+            "source": source,
+        })
+
+    def to_dict(self) -> dict:
+        return {
+            "track_id": self.track_id,
+            "label": self.label,
+            "class": self.class_name,
+            "start_time": self.points[0]["time"] if self.points else None,
+            "end_time": self.points[-1]["time"] if self.points else None,
+            "detections": self.hits,
+            "points": self.points,
+        }
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """两组 (x1, y1, x2, y2) 框两两之间的 IoU"""
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-6)
+
+
+def greedy_match(iou: np.ndarray, threshold: float):
+    """按 IoU 从高到低贪心匹配，返回 [(行, 列)]"""
+    matches = []
+    if iou.size == 0:
+        return matches
+    rows, cols = np.where(iou >= threshold)
+    order = np.argsort(-iou[rows, cols])
+    used_rows, used_cols = set(), set()
+    for k in order:
+        r, c = int(rows[k]), int(cols[k])
+        if r in used_rows or c in used_cols:
+            continue
+        used_rows.add(r)
+        used_cols.add(c)
+        matches.append((r, c))
+    return matches
+
+
+class PlayerTracker:
+    """检测帧上用 IoU 关联检测结果与已有轨迹，检测帧之间用稀疏光流平移各个框"""
+
+    def __init__(self, iou_threshold: float = 0.3, max_misses: int = 2):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.tracks = []      # 仍在跟踪的轨迹
+        self.finished = []    # 已丢失的轨迹
+        self._next_id = 1
+        self._prev_gray = None
+        self._scale = 1.0
+
+    def _gray(self, frame):
+        h, w = frame.shape[:2]
+        self._scale = min(1.0, FLOW_WIDTH / w)
+        if self._scale < 1.0:
+            frame = cv2.resize(frame, (int(w * self._scale), int(h * self._scale)),
+                               interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def _flow(self, gray):
+        """所有轨迹的采样点合并为一次 calcOpticalFlowPyrLK 调用"""
+        if self._prev_gray is None or not self.tracks:
+            return
+        grid = (np.arange(FLOW_GRID) + 0.5) / FLOW_GRID
+        gx, gy = np.meshgrid(grid, grid)
+        gx, gy = gx.ravel(), gy.ravel()
+        boxes = np.array([t.box for t in self.tracks], dtype=np.float32) * self._scale
+        # 只取框中间 60% 区域的点，避开背景
+        px = boxes[:, None, 0] + (boxes[:, None, 2] - boxes[:, None, 0]) * (0.2 + 0.6 * gx)
+        py = boxes[:, None, 1] + (boxes[:, None, 3] - boxes[:, None, 1]) * (0.2 + 0.6 * gy)
+        points = np.stack([px, py], axis=-1).reshape(-1, 1, 2).astype(np.float32)
+
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(self._prev_gray, gray, points, None, **LK_PARAMS)
+        delta = (moved - points).reshape(len(self.tracks), -1, 2)
+        valid = status.reshape(len(self.tracks), -1).astype(bool)
+        for track, d, ok in zip(self.tracks, delta, valid):
+            if ok.sum() >= MIN_FLOW_POINTS:
+                dx, dy = np.median(d[ok], axis=0) / self._scale
+                track.box = track.box + np.array([dx, dy, dx, dy], dtype=np.float32)
+
+    def _associate(self, detections, frame_shape):
+        h, w = frame_shape[:2]
+        names = detections.names()
+        keep = np.isin(names, TRACK_CLASSES)
+        names = names[keep]
+        det_boxes = detections.boxes(w, h)[keep].astype(np.float32)
+        track_boxes = np.array([t.box for t in self.tracks], dtype=np.float32).reshape(-1, 4)
+
+        matches = greedy_match(iou_matrix(track_boxes, det_boxes), self.iou_threshold)
+        matched_tracks = {r for r, _ in matches}
+        matched_dets = {c for _, c in matches}
+
+        for r, c in matches:
+            track = self.tracks[r]
+            track.box = det_boxes[c]
+            track.class_name = names[c]
+            track.hits += 1
+            track.misses = 0
+
+        alive = []
+        for i, track in enumerate(self.tracks):
+            if i not in matched_tracks:
+                track.misses += 1
+            (alive if track.misses <= self.max_misses else self.finished).append(track)
+        self.tracks = alive
+
+        for c, name in enumerate(names):
+            if c not in matched_dets:
+                self.tracks.append(Track(self._next_id, name, det_boxes[c]))
+                self._next_id += 1
+
+    def update(self, frame, frame_index: int, time_s: float, detections=None):
+        """处理下一帧；detections（Detections）不为 None 表示该帧做过检测"""
+        gray = self._gray(frame)
+        self._flow(gray)
+        self._prev_gray = gray
+        if detections is not None:
+            self._associate(detections, frame.shape)
+        for track in self.tracks:
+            # 丢失中的轨迹不记录位置，避免光流漂移产生的假轨迹点
+            if track.misses == 0:
+                track.record(frame_index, time_s, "detect" if detections is not None else "flow")
+
+    def results(self, min_hits: int = 1):
+        tracks = [t for t in self.finished + self.tracks if t.hits >= min_hits and t.points]
+        return sorted(tracks, key=lambda t: t.track_id)
+
+
+def track_clip(reader, start: float, end: float, detect, sample_fps: float = 10.0,
+               detect_every: int = 5, batch_intervals: int = 4, min_hits: int = 2,
+               check_cancelled=None) -> dict:
+    """在 [start, end] 内跟踪球员
+
+    每 detect_every 个采样帧检测一次，中间帧用光流跟踪。帧按块读取：
+    每块包含 batch_intervals 个检测帧并一次批量检测，内存中最多保留一块的整帧，与片段长度无关。
+    detect(samples) 返回与 samples 对应的 Detections 列表。
+    """
+    fps = min(sample_fps, reader.fps) if reader.fps > 0 else sample_fps
+    count = max(1, int((end - start) * fps) + 1)
+    timestamps = [start + i / fps for i in range(count)]
+
+    tracker = PlayerTracker()
+    frames_meta = []
+    balls = []
+    detected = 0
+    chunk_size = detect_every * batch_intervals
+    frames = reader.iter_frames(timestamps)
+
+    while True:
+        if check_cancelled:
+            check_cancelled()
+        chunk = []
+        for sample in frames:
+            chunk.append(sample)
+            if len(chunk) == chunk_size:
+                break
+        if not chunk:
+            break
+
+        offset = len(frames_meta)
+        detect_positions = [i for i in range(len(chunk)) if (offset + i) % detect_every == 0]
+        predictions = detect([chunk[i] for i in detect_positions])
+        by_position = dict(zip(detect_positions, predictions))
+        detected += len(detect_positions)
+
+        for i, sample in enumerate(chunk):
+            detections = by_position.get(i)
+            tracker.update(sample.frame, sample.frame_index, sample.actual_time, detections)
+            frames_meta.append({
+                "frame_index": sample.frame_index,
+                "time": round(sample.actual_time, 3),
+                "detected": detections is not None,
+            })
+            if detections is not None:
+                for x, y in detections.centers()[detections.names() == "ball"].astype(np.int64).tolist():
+                    balls.append({"time": round(sample.actual_time, 3), "center": [x, y]})
+            sample.frame = None  # 尽早释放整帧
+
+    tracks = tracker.results(min_hits=min_hits)
+    return {
+        "start": round(start, 3),
+        "end": round(end, 3),
+        "sample_fps": round(fps, 3),
+        "detect_every": detect_every,
+        "frames": len(frames_meta),
+        "detected_frames": detected,
+        "tracks": [t.to_dict() for t in tracks],
+        "ball": balls,
+        "frame_info": frames_meta,
+    }
+
+
+class TrackStore:
+    """最近的跟踪结果（按 tracking_id），供后续 Gemini 分析引用某条轨迹"""
+
+    def __init__(self, max_items: int = 32, ttl_seconds: float = 3600):
+        self.max_items = max_items
+        self.ttl = ttl_seconds
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, video_id: str, result: dict) -> str:
+        tracking_id = uuid.uuid4().hex
+        with self._lock:
+            self._items[tracking_id] = (time.time(), video_id, result)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return tracking_id
+
+    def get_track(self, tracking_id: str, track_id: int, video_id: str = None):
+        """返回轨迹字典；结果不存在、已过期或不属于该视频时返回 None"""
+        with self._lock:
+            item = self._items.get(tracking_id)
+            if item is None or time.time() - item[0] > self.ttl:
+                self._items.pop(tracking_id, None)
+                return None
+            self._items.move_to_end(tracking_id)
+        _, owner, result = item
+        if video_id is not None and owner != video_id:
+            return None
+        for track in result["tracks"]:
+            if track["track_id"] == track_id:
+                return track
+        return None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"results": len(self._items)}
+
+
+def track_center_at(track: dict, time_s: float):
+    """轨迹字典在某一时刻的插值中心点"""
+    points = track.get("points") or []
+    if not points:
+        return None
+    times = [p["time"] for p in points]
+    return (float(np.interp(time_s, times, [p["center"][0] for p in points])),
+            float(np.interp(time_s, times, [p["center"][1] for p in points])))
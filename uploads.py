@@ -0,0 +1,267 @@
+import json
+import logging
+import os
+import re
+import time
+import uuid
+import hashlib
+import threading
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class UploadError(Exception):
+    """分片上传协议错误，status 为对应的 HTTP 状态码"""
+
+    def __init__(self, message: str, status: int = 400, offset: int = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+@dataclass
+class UploadSession:
+    """一次分片上传：数据按顺序追加写入磁盘，同时增量计算 SHA-256"""
+    upload_id: str
+    filename: str
+    total_size: int
+    path: str
+    offset: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    hasher: object = field(default_factory=hashlib.sha256, repr=False)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def to_dict(self) -> dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "size": self.total_size,
+            "offset": self.offset,
+            "complete": self.total_size is not None and self.offset >= self.total_size,
+        }
+
+
+def parse_content_range(header: str):
+    """解析 Content-Range: bytes start-end/total，返回 (start, end, total)，total 未知为 None"""
+    match = CONTENT_RANGE_PATTERN.match(header or "")
+    if not match:
+        raise UploadError("Content-Range 格式应为 bytes start-end/total")
+    start, end = int(match.group(1)), int(match.group(2))
+    total = None if match.group(3) == "*" else int(match.group(3))
+    if end < start:
+        raise UploadError("Content-Range 结束位置小于起始位置")
+    return start, end, total
+
+
+class ChunkedUploads:
+    """可断点续传的分片上传
+
+    客户端先 initiate，再按顺序 PUT 各个字节区间，最后 finalize。
+    数据流式写入磁盘，内存占用与文件大小无关；中断后从 offset 继续上传即可。
+    会话信息保存在分片文件旁的 .json 中，服务重启后从磁盘恢复（重新读取已接收的数据计算哈希）。
+    给出 scratch 时分片文件计入临时存储配额，上传进行中不会被淘汰。
+    """
+
+    def __init__(self, root: str, video_store, max_size: int, ttl_seconds: float = 24 * 3600, scratch=None):
+        self.root = root
+        self.video_store = video_store
+        self.max_size = max_size
+        self.ttl = ttl_seconds
+        self.scratch = scratch
+        self._sessions = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._recover()
+
+    @staticmethod
+    def _meta_path(session: UploadSession) -> str:
+        return session.path[:-len(".part")] + ".json"
+
+    def _save_meta(self, session: UploadSession):
+        meta = {"upload_id": session.upload_id, "filename": session.filename,
+                "total_size": session.total_size, "created_at": session.created_at}
+        tmp_path = self._meta_path(session) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        os.replace(tmp_path, self._meta_path(session))
+
+    def _recover(self):
+        """启动时从磁盘恢复未完成的上传；过期的和缺少会话信息的分片文件删除"""
+        names = set(os.listdir(self.root))
+        now = time.time()
+        recovered = 0
+        for name in names:
+            path = os.path.join(self.root, name)
+            upload_id, ext = os.path.splitext(name)
+            if ext == ".part" and f"{upload_id}.json" in names:
+                continue
+            if ext != ".json":
+                self._remove_path(path)
+                continue
+            part_path = os.path.join(self.root, f"{upload_id}.part")
+            try:
+                with open(path, encoding="utf-8") as f:
+                    meta = json.load(f)
+                updated_at = os.path.getmtime(part_path)
+                if now - updated_at > self.ttl:
+                    raise ValueError("上传已过期")
+                session = UploadSession(upload_id=upload_id, filename=meta["filename"],
+                                        total_size=meta["total_size"], path=part_path,
+                                        created_at=meta["created_at"], updated_at=updated_at)
+                with open(part_path, "rb") as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                        session.hasher.update(chunk)
+                        session.offset += len(chunk)
+            except (OSError, ValueError, KeyError) as e:
+                logger.info(f"丢弃无法恢复的上传 {upload_id}: {e}")
+                self._remove_path(path)
+                self._remove_path(part_path)
+                continue
+            if self.scratch is not None:
+                self.scratch.register(session.path, "upload", refs=1, size=session.offset)
+            self._sessions[upload_id] = session
+            recovered += 1
+        if recovered:
+            logger.info(f"已恢复 {recovered} 个未完成的分片上传")
+
+    def initiate(self, filename: str, total_size=None) -> UploadSession:
+        self.purge_expired()
+        if total_size is not None and total_size > self.max_size:
+            raise UploadError(f"文件大小超过上限 {self.max_size} 字节", 413)
+        upload_id = uuid.uuid4().hex
+        session = UploadSession(
+            upload_id=upload_id,
+            filename=filename or "video.mp4",
+            total_size=total_size,
+            path=os.path.join(self.root, f"{upload_id}.part"),
+        )
+        open(session.path, "wb").close()
+        self._save_meta(session)
+        if self.scratch is not None:
+            self.scratch.register(session.path, "upload", refs=1, size=0)
+        with self._lock:
+            self._sessions[upload_id] = session
+        return session
+
+    def get(self, upload_id: str) -> UploadSession:
+        with self._lock:
+            session = self._sessions.get(upload_id)
+        if session is None:
+            raise UploadError("上传不存在或已过期", 404)
+        return session
+
+    def write_chunk(self, upload_id: str, start: int, stream, total_size=None,
+                    stream_length: int = None, end: int = None) -> UploadSession:
+        """从 start 开始追加写入一个分片；start 必须等于已确认的 offset
+
+        给出 end（Content-Range 的结束位置）时，收到的数据必须正好到 end 为止，
+        多出的部分不写入，不足时抛出 UploadError(400)，已写入的部分仍然有效。
+        给出 stream_length 时先在临时存储中预留空间，不足时抛出 ScratchFull。
+        """
+        session = self.get(upload_id)
+        if not session.lock.acquire(blocking=False):
+            raise UploadError("该上传正在写入另一个分片", 409, session.offset)
+        reservation = None
+        try:
+            if total_size is not None:
+                if session.total_size is not None and session.total_size != total_size:
+                    raise UploadError("Content-Range 中的总大小与初始化时不一致", 400, session.offset)
+                if total_size > self.max_size:
+                    raise UploadError(f"文件大小超过上限 {self.max_size} 字节", 413, session.offset)
+                if session.total_size is None:
+                    session.total_size = total_size
+                    self._save_meta(session)
+            if start != session.offset:
+                raise UploadError(f"分片起始位置应为 {session.offset}", 409, session.offset)
+            if self.scratch is not None and stream_length is not None:
+                reservation = self.scratch.reserve(stream_length, exclude=session.path)
+
+            # 逐块写入并更新哈希；连接中断时已写入的部分仍然有效，可从新的 offset 续传
+            with open(session.path, "r+b") as out:
+                out.seek(session.offset)
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    if session.offset + len(chunk) > self.max_size or (
+                            session.total_size is not None and session.offset + len(chunk) > session.total_size):
+                        raise UploadError("写入的数据超过了文件总大小", 413, session.offset)
+                    if end is not None and session.offset + len(chunk) > end + 1:
+                        raise UploadError("分片数据长度超过 Content-Range 指定的区间", 400, session.offset)
+                    out.write(chunk)
+                    session.hasher.update(chunk)
+                    session.offset += len(chunk)
+                    session.updated_at = time.time()
+            if end is not None and session.offset != end + 1:
+                raise UploadError(f"分片数据不完整：已接收到 {session.offset} 字节，应到 {end + 1} 字节",
+                                  400, session.offset)
+            return session
+        finally:
+            if self.scratch is not None:
+                self.scratch.update(session.path, session.offset, reservation)
+            session.lock.release()
+
+    def finalize(self, upload_id: str, expected_sha256: str = None):
+        """校验完整性后将文件移交给视频存储，返回 (视频会话, 是否新建)"""
+        session = self.get(upload_id)
+        with session.lock:
+            if session.total_size is not None and session.offset != session.total_size:
+                raise UploadError(f"上传未完成：已接收 {session.offset}/{session.total_size} 字节",
+                                  409, session.offset)
+            if session.offset == 0:
+                raise UploadError("上传内容为空", 400, 0)
+            video_id = session.hasher.hexdigest()
+            if expected_sha256 and expected_sha256.lower() != video_id:
+                raise UploadError("SHA-256 校验失败", 422, session.offset)
+
+            with self._lock:
+                self._sessions.pop(upload_id, None)
+            self._remove_path(self._meta_path(session))
+            if self.scratch is not None:
+                self.scratch.unregister(session.path)
+            return self.video_store.adopt(session.path, video_id, session.filename, session.offset)
+
+    def abort(self, upload_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(upload_id, None)
+        if session is None:
+            return False
+        self._remove_file(session)
+        return True
+
+    def purge_expired(self) -> int:
+        """删除长时间没有新分片的未完成上传"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if now - s.updated_at > self.ttl]
+            for session in expired:
+                del self._sessions[session.upload_id]
+        for session in expired:
+            self._remove_file(session)
+        return len(expired)
+
+    def _remove_file(self, session: UploadSession):
+        self._remove_path(session.path)
+        self._remove_path(self._meta_path(session))
+        if self.scratch is not None:
+            self.scratch.unregister(session.path)
+
+    @staticmethod
+    def _remove_path(path: str):
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除上传分片文件时出错: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "uploads": len(self._sessions),
+                "bytes": sum(s.offset for s in self._sessions.values()),
+            }
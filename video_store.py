@@ -0,0 +1,175 @@
+import logging
+import os
+import re
+import glob
+import time
+import uuid
+import hashlib
+import threading
+from dataclasses import dataclass, field
+
+from seek_index import forget_seek_index
+
+logger = logging.getLogger(__name__)
+
+# 视频ID为内容的 SHA-256 十六进制摘要
+VIDEO_ID_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+CHUNK_SIZE = 1024 * 1024
+
+
+@dataclass
+class VideoSession:
+    """一个已上传视频的会话信息"""
+    video_id: str
+    path: str
+    filename: str
+    size: int
+    ttl: float
+    created_at: float = field(default_factory=time.time)
+    last_access: float = field(default_factory=time.time)
+
+    @property
+    def expires_at(self) -> float:
+        return self.last_access + self.ttl
+
+    def to_dict(self) -> dict:
+        return {
+            "video_id": self.video_id,
+            "filename": self.filename,
+            "size": self.size,
+            "created_at": self.created_at,
+            "expires_at": self.expires_at,
+        }
+
+
+class VideoStore:
+    """内容寻址的视频存储：同一视频只保存一份，按哈希复用，过期自动清理
+
+    给出 scratch 时视频文件计入临时存储配额，空间不足时按最近最少使用淘汰未在使用的会话。
+    """
+
+    def __init__(self, root: str, ttl_seconds: float = 3600, scratch=None):
+        self.root = root
+        self.ttl = ttl_seconds
+        self.scratch = scratch
+        self._sessions = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _path_for(self, video_id: str, filename: str) -> str:
+        ext = os.path.splitext(filename or "")[1].lower()
+        if not re.match(r"^\.[a-z0-9]{1,5}$", ext):
+            ext = ".mp4"
+        return os.path.join(self.root, f"{video_id}{ext}")
+
+    def ingest(self, stream, filename: str, reservation=None):
+        """边写入磁盘边计算哈希，返回 (会话, 是否新建)；重复内容只保留一份
+
+        reservation 为写入前在临时存储中的预留，登记文件时一并释放
+        """
+        incoming_path = os.path.join(self.root, f".incoming-{uuid.uuid4().hex}")
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with open(incoming_path, "wb") as out:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            return self.adopt(incoming_path, hasher.hexdigest(), filename, size, reservation)
+        finally:
+            if os.path.exists(incoming_path):
+                os.remove(incoming_path)
+
+    def adopt(self, file_path: str, video_id: str, filename: str, size: int, reservation=None):
+        """将已计算好哈希的文件纳入存储（移动文件），返回 (会话, 是否新建)"""
+        self.purge_expired()
+        with self._lock:
+            session = self._sessions.get(video_id)
+            if session and os.path.exists(session.path):
+                session.last_access = time.time()
+                os.remove(file_path)
+                if self.scratch is not None:
+                    self.scratch.touch(session.path)
+                return session, False
+
+            target_path = self._path_for(video_id, filename)
+            os.replace(file_path, target_path)
+            session = VideoSession(
+                video_id=video_id,
+                path=target_path,
+                filename=filename or os.path.basename(target_path),
+                size=size,
+                ttl=self.ttl,
+            )
+            self._sessions[video_id] = session
+        if self.scratch is not None:
+            self.scratch.register(target_path, "video", on_evict=lambda: self.remove(video_id), size=size,
+                                  reservation=reservation)
+        return session, True
+
+    def get(self, video_id: str):
+        """按ID获取会话并刷新过期时间；不存在或已过期返回 None"""
+        if not video_id or not VIDEO_ID_PATTERN.match(video_id):
+            return None
+        self.purge_expired()
+        with self._lock:
+            session = self._sessions.get(video_id)
+            if session is None or not os.path.exists(session.path):
+                self._sessions.pop(video_id, None)
+                return None
+            session.last_access = time.time()
+        if self.scratch is not None:
+            self.scratch.touch(session.path)
+        return session
+
+    def acquire(self, session: VideoSession) -> bool:
+        """请求或任务使用期间固定视频文件，防止被配额淘汰；文件已被淘汰时返回 False"""
+        if self.scratch is None:
+            return os.path.exists(session.path)
+        return self.scratch.acquire(session.path)
+
+    def release(self, session: VideoSession):
+        if self.scratch is not None:
+            self.scratch.release(session.path)
+
+    def remove(self, video_id: str) -> bool:
+        with self._lock:
+            session = self._sessions.pop(video_id, None)
+        if session is None:
+            return False
+        self._delete_files(session)
+        return True
+
+    def purge_expired(self) -> int:
+        """删除所有过期会话及其文件，返回删除数量"""
+        now = time.time()
+        with self._lock:
+            expired = [s for s in self._sessions.values() if s.expires_at <= now]
+            for session in expired:
+                del self._sessions[session.video_id]
+        for session in expired:
+            self._delete_files(session)
+        return len(expired)
+
+    def _delete_files(self, session: VideoSession):
+        # 连同视频旁的附属文件（如定位索引）一起删除
+        for path in [session.path] + glob.glob(glob.escape(session.path) + ".*"):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"删除视频文件时出错: {e}")
+        forget_seek_index(session.path)
+        if self.scratch is not None:
+            self.scratch.unregister(session.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "bytes": sum(s.size for s in self._sessions.values()),
+            }